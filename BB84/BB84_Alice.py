@@ -1,13 +1,14 @@
+import numpy as np
 import netsquid as ns
 
 from netsquid.protocols import NodeProtocol
 from netsquid.components import Clock
+from netsquid.components.component import Message
 from netsquid.components.qsource import SourceStatus
 
-import sys
-scriptpath = "lib/"
-sys.path.append(scriptpath)
-from lib.functions import rng_bin_lst, SinglePhotonSource
+from lib.functions import rng_basis_lst, rng_bin_lst, sift_frame, SinglePhotonSource
+from lib.noise import sample_flips
+from lib.tableau import TableauFrame
 
 
 
@@ -26,36 +27,68 @@ class AliceProtocol(NodeProtocol):
         key             storage for key output
         source_Qlist    list of qubits emitted by attached photon source
         source_freq     frequency of attached photon source in Hz
+        flip_probs      (p_z, p_x) classical-equivalent channel noise applied at encoding, or None
+        attack          lib.attacks.EavesdropperModel attacking each frame before channel noise, or None
+        tableau         encode the frame with the batched lib.tableau engine instead of qubit operations
+        qubit_pool      lib.pool.QubitPool to draw photons from instead of the photon source, or None
+        memory_monitor  lib.memory.MemoryMonitor sampling every encoded frame, or None
+        frame_template  pre-encoded TableauFrame of basis_list/bit_list to send instead of encoding, or None
+        p_z             probability of choosing the Z-basis (None: symmetric BB84)
+        test_key        X-basis sifted bits disclosed for parameter estimation (efficient BB84 only)
+        test_mask       photon indices of test_key
 
     Parameters:
         sourceEff       efficiency of attached photon source
         portNames       list of node ports to be stored in protocol
+        basisList       basis choices to use instead of drawing them (e.g. lib.crn inputs)
+        bitList         bit choices to use instead of drawing them
+        pZ              Z-basis probability of efficient BB84, where only Z-basis bits form the
+                        key; None (default) for symmetric BB84 with uniform bases
     """
 
 
-    def __init__(self, node, photonCount, sourceFreq, sourceEff=1, portNames=["A.Q.Out","A,C.Out","A.C.In"]):
+    def __init__(self, node, photonCount, sourceFreq, sourceEff=1, portNames=["A.Q.Out","A,C.Out","A.C.In"],
+                 basisList=None, bitList=None, pZ=None):
         super().__init__()
         self.node         = node
         self.photon_count = photonCount
         self.port_qo_name = portNames[0]
         self.port_co_name = portNames[1]
         self.port_ci_name = portNames[2]
-        self.basis_list   = rng_bin_lst(photonCount)
-        self.bit_list     = rng_bin_lst(photonCount)
+        self.p_z          = pZ
+        self.basis_list   = rng_basis_lst(photonCount, pZ) if basisList is None else list(basisList)
+        self.bit_list     = rng_bin_lst(photonCount) if bitList is None else list(bitList)
 
         self.mask         = []
         self.key          = self.bit_list       # initialisation
+        self.test_mask    = []
+        self.test_key     = []
+
+        self.a_source     = self.attach_source(sourceFreq, sourceEff)
 
-        # attaching a lib.functions.SinglePhotonSource object external to the node
-        self.a_source     = SinglePhotonSource("[A: SPS]", sourceFreq, efficiency=sourceEff, status=SourceStatus.EXTERNAL)
-        # function to handle source output
-        self.a_source.ports["qout0"].bind_output_handler(self.store_source_output)
-        
         self.source_Qlist = []
         self.source_freq  = sourceFreq
 
         self.bits = []
 
+        self.flip_probs = None
+        self.attack     = None
+        self.tableau    = False
+        self.qubit_pool = None
+        self.memory_monitor = None
+        self.frame_template = None
+
+
+    def attach_source(self, sourceFreq, sourceEff):
+        """
+        Create the lib.functions.SinglePhotonSource (external to the node) whose output
+        is batched by store_source_output
+        """
+        source = SinglePhotonSource("[A: SPS]", sourceFreq, efficiency=sourceEff, status=SourceStatus.EXTERNAL)
+        # function to handle source output
+        source.ports["qout0"].bind_output_handler(self.store_source_output)
+        return source
+
 
     def store_source_output(self, qubit):
         """
@@ -76,12 +109,51 @@ class AliceProtocol(NodeProtocol):
         """
         Encode basis and bit and send batch on quantum port
         """
-        for i, q in enumerate(self.source_Qlist):
-            basis, bit = self.basis_list[i], self.bit_list[i]
-            self.bits.append((basis, bit))
+        self.node.ports[self.port_qo_name].tx_output(self.encode(self.source_Qlist, self.basis_list, self.bit_list))
+
+
+    def encode(self, qubits, basis_list, bit_list, **meta):
+        """
+        Encode a frame of photons and return it as a message for the quantum port
+
+        Parameters:
+            qubits      photons of the frame
+            basis_list  basis choice per photon
+            bit_list    bit choice per photon
+            meta        extra message metadata (e.g. round number)
+        """
+        self.bits.extend(zip(basis_list, bit_list))
+        # eavesdropper at the start of the link: the states leaving Eve are sent instead
+        sent_bases, sent_bits = basis_list, bit_list
+        if self.attack is not None:
+            sent_bases, sent_bits = self.attack.intercept(basis_list, bit_list)
+        # fast noise path: flip the encoded (not the recorded) bit as the channel would
+        flips = sample_flips(sent_bases, self.flip_probs) if self.flip_probs is not None else None
+
+        if self.tableau:
+            # whole frame in one go; the state travels alongside the (untouched) photons
+            bits = np.asarray(sent_bits) if flips is None else np.asarray(sent_bits) ^ np.asarray(flips)
+            if flips is None and self.attack is None and self.frame_template is not None:
+                frame, self.frame_template = self.frame_template, None
+            else:
+                frame = TableauFrame.bb84(sent_bases, bits)
+            return self.frame_message(Message(qubits, tableau=frame, **meta))
+
+        for i, q in enumerate(qubits):
+            basis, bit = sent_bases[i], sent_bits[i]
+            if flips is not None: bit ^= flips[i]
             if bit: ns.qubits.operate(q, ns.X)
             if basis: ns.qubits.operate(q, ns.H)
-        self.node.ports[self.port_qo_name].tx_output(self.source_Qlist)
+        return self.frame_message(Message(qubits, **meta))
+
+
+    def frame_message(self, msg):
+        """
+        Hand an encoded frame to the memory monitor (if any) on its way to the channel
+        """
+        if self.memory_monitor is not None:
+            self.memory_monitor.frame_sent(msg)
+        return msg
 
 
     def basis_reconciliation(self):
@@ -92,14 +164,24 @@ class AliceProtocol(NodeProtocol):
         self.node.ports[self.port_co_name].tx_output(self.basis_list)
         bob_bases = self.bob_bases
 
-        self.mask = [i for i, b in enumerate(bob_bases) if b == self.basis_list[i]]
-        
         # finalise key output by matching bases
-        self.key = [bit for i, bit in enumerate(self.bit_list) if self.basis_list[i] == bob_bases[i]]
+        self.mask, self.key, self.test_mask, self.test_key = sift_frame(self.basis_list, bob_bases, self.bit_list, self.p_z)
+
+
+    def emit_pooled(self, message):
+        """
+        Clock tick handler emitting a photon taken from self.qubit_pool
+        """
+        self.store_source_output(Message([self.qubit_pool.acquire()]))
 
 
     def gen_qubits(self):
         clock = Clock("[A: Clock]", frequency=self.source_freq, max_ticks=self.photon_count)
+        if self.qubit_pool is not None:
+            # each tick emits a recycled photon instead of triggering the source
+            clock.ports["cout"].bind_output_handler(self.emit_pooled)
+            clock.start()
+            return
         try:
             clock.ports["cout"].connect(self.a_source.ports["trigger"])
         except Exception as e:
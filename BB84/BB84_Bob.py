@@ -1,33 +1,53 @@
+import numpy as np
 import netsquid as ns
 
 from netsquid.protocols import NodeProtocol
 from netsquid.components import QSource
 from netsquid.components.qsource import SourceStatus
 
-import sys
-scriptpath = "lib/"
-sys.path.append(scriptpath)
-from lib.functions import rng_bin_lst
+from lib.functions import rng_basis_lst, sift_frame
 
 
 
 class BobProtocol(NodeProtocol):
-    def __init__(self, node, photonCount, portNames=["B.Q.In","B.C.In","B.C.Out"]):
+    def __init__(self, node, photonCount, portNames=["B.Q.In","B.C.In","B.C.Out"], basisList=None, pZ=None):
         super().__init__()
         self.node         = node
         self.photon_count = photonCount
         self.port_qi_name = portNames[0]
         self.port_ci_name = portNames[1]
         self.port_co_name = portNames[2]
-        self.basis_list   = rng_bin_lst(photonCount)
+        # measurement bases, Z-basis with probability pZ; `basisList` fixes them (e.g. lib.crn
+        # inputs) instead of drawing them
+        self.p_z          = pZ
+        self.basis_list   = rng_basis_lst(photonCount, pZ) if basisList is None else list(basisList)
 
         self.meas_results = []
         self.mask         = []
         self.key          = []
         self.end_time     = None
+        # in efficient BB84 (pZ given) the key is Z-basis only; X-basis bits are test bits
+        self.test_mask    = []
+        self.test_key     = []
 
         self.bits = []
 
+        # measure with the batched lib.tableau engine instead of qubit operations
+        self.tableau = False
+        # lib.pool.QubitPool measured photons are handed back to; discarded if None
+        self.qubit_pool = None
+        # lib.memory.MemoryMonitor sampling every received frame, if any
+        self.memory_monitor = None
+
+        # optional lib.detector.DetectorModel; photon slots are 1 / source_freq apart
+        self.detector    = None
+        self.source_freq = None
+        self.clicks      = []
+        # time (ns) the detector recovers from its last click, carried across frames
+        self.blocked_until = -np.inf
+        # bases announced to Alice: own basis where the detector clicked, -1 otherwise
+        self.announced_bases = self.basis_list
+
 
     def receive_and_measure(self):
         """
@@ -36,35 +56,103 @@ class BobProtocol(NodeProtocol):
         # wait for qubit array input to port
         port = self.node.ports[self.port_qi_name]
         yield self.await_port_input(port)
-        qubit_batch = port.rx_input().items
-        
-        # measure and store
-        for i, q in enumerate(qubit_batch):
-            basis = self.basis_list[i]
-            if basis: ns.qubits.operate(q,ns.H)  # if: X basis, then: rotate
-            meas = ns.qubits.measure(q)[0]       # Z basis measurement
-            self.meas_results.append(meas)       # outcome bit
-            self.bits.append((basis, meas))
-        
+        msg = port.rx_input()
+
+        meas = self.measure(msg, self.basis_list)
+        if self.detector is not None:
+            meas, self.announced_bases, self.clicks = self.apply_detector(meas, self.basis_list)
+        self.meas_results.extend(meas)
+        self.bits.extend(zip(self.basis_list, meas))
+
         self.key = self.meas_results
+        del msg
+
+
+    def measure(self, msg, basis_list):
+        """
+        Measure a received frame in the given bases and return the outcome bits
+
+        Parameters:
+            msg         message received on the quantum port
+            basis_list  basis per photon (0 = Z-basis, 1 = X-basis)
+        """
+        qubit_batch = msg.items
+        if self.memory_monitor is not None:
+            self.memory_monitor.frame_received(msg)
+
+        if self.tableau:
+            frame = msg.meta["tableau"]
+            frame.apply_h(0, np.asarray(basis_list[:frame.n_frames]) == 1)
+            meas = frame.measure(0).tolist()
+        else:
+            meas = []
+            for i, q in enumerate(qubit_batch):
+                if basis_list[i]: ns.qubits.operate(q,ns.H)  # if: X basis, then: rotate
+                meas.append(ns.qubits.measure(q)[0])         # Z basis measurement
+
+        # photons are no longer needed: release them now rather than when the protocol is collected
+        self.release_qubits(qubit_batch)
+        return meas
+
+
+    def apply_detector(self, meas, basis_list, start=None):
+        """
+        Pass a measured frame through self.detector
+
+        Parameters:
+            start       arrival time (ns) of the frame's first photon when frames share one
+                        detector back to back, so dead time carries over from the previous
+                        frame; None for a frame on a freshly recovered detector
+
+        Returns:
+            (outcomes, announced bases, clicks): slots without a click are announced with
+            basis -1 (and so sifted out), dark-count/afterpulse clicks get a random outcome
+        """
+        n = len(meas)
+        times = (start or 0.) + np.arange(n) * 1e9 / self.source_freq
+        if start is None:
+            clicks, noise = self.detector.detect(times)
+        else:
+            clicks, noise = self.detector.detect(times, blockedUntil=self.blocked_until)
+            if clicks.any():
+                self.blocked_until = times[clicks][-1] + self.detector.dead_time
+
+        meas = np.asarray(meas)
+        if noise.any():
+            meas[noise] = np.random.randint(0, 2, size=int(noise.sum()))
+        announced = np.where(clicks, basis_list[:n], -1)
+        return meas.tolist(), announced.tolist(), clicks.tolist()
+
+
+    def release_qubits(self, qubits):
+        """
+        Hand measured photons back to the qubit pool so they can be reused, or discard
+        them if there is no pool (lost photons arrive as None and are skipped)
+        """
+        if self.qubit_pool is not None:
+            self.qubit_pool.release(qubits)
+        else:
+            for q in qubits:
+                if q is not None:
+                    ns.qubits.discard(q)
 
 
     def basis_reconciliation(self):
         """
         Receive basis choices from Alice, send Bob's and sift common bits into self.key
         """
-        # send to Alice
-        self.node.ports[self.port_co_name].tx_output(self.basis_list)
+        # send to Alice (no-click slots announced as -1 so both sides drop them)
+        self.node.ports[self.port_co_name].tx_output(self.announced_bases)
 
         # identify classical in port and await Alice's basis list
         port = self.node.ports[self.port_ci_name]
         yield self.await_port_input(port)
         alice_bases = port.rx_input().items
 
-        self.mask = [i for i, b in enumerate(alice_bases) if b == self.basis_list[i]]
-        
         # finalise key output by matching bases
-        self.key = [bit for i, bit in enumerate(self.meas_results) if self.basis_list[i] == alice_bases[i]]
+        n = len(self.meas_results)
+        self.mask, self.key, self.test_mask, self.test_key = sift_frame(self.announced_bases[:n], alice_bases[:n],
+                                                                        self.meas_results, self.p_z)
 
 
     def run(self):
@@ -0,0 +1,275 @@
+import time
+
+import netsquid as ns
+
+from netsquid.nodes import Node
+from netsquid.components import Clock, QuantumChannel, ClassicalChannel
+
+from lib.functions import HybridDelayModel, quantum_channel_models, restore_formalism, set_formalism, sift_frame
+from lib.noise import channel_flip_probabilities
+from lib.profiling import profiled
+
+from BB84.BB84_Alice import AliceProtocol
+from BB84.BB84_Bob import BobProtocol
+
+
+
+class MultiplexedAliceProtocol(AliceProtocol):
+    """
+    Alice for BB84 over K parallel (wavelength/time multiplexed) sub-channels of one link.
+
+    One clock drives all sub-channel sources: every tick emits one photon per sub-channel
+    in a single event, so event count does not grow with K. The sub-channel sources are
+    ideal single-photon sources modelled by that tick handler (photons are created, or
+    drawn from qubit_pool, directly) rather than K SinglePhotonSource components, whose
+    trigger events would make the cost linear in K, so no a_source is attached.
+
+    Sub-channel k carries photons k * photon_count ... (k + 1) * photon_count - 1 of
+    basis_list/bit_list, and the bases of all sub-channels are reconciled in one
+    classical message.
+
+    Attributes:
+        channels        number of sub-channels K
+        port_qo_names   quantum out port per sub-channel
+        frames          photons emitted so far, per sub-channel
+
+    Parameters:
+        channels        number of sub-channels K
+        portNames       K quantum out ports followed by the classical out and in ports
+    """
+    def __init__(self, node, photonCount, sourceFreq, channels, portNames=None, basisList=None, bitList=None, pZ=None):
+        portNames = portNames or [f"A.Q.Out.{k}" for k in range(channels)] + ["A.C.Out", "A.C.In"]
+        super().__init__(node, photonCount * channels, sourceFreq, portNames=[portNames[0]] + portNames[channels:],
+                         basisList=basisList, bitList=bitList, pZ=pZ)
+        # photon_count is per sub-channel; basis_list/bit_list span all of them
+        self.photon_count  = photonCount
+        self.channels      = channels
+        self.port_qo_names = portNames[:channels]
+        self.frames        = [[] for _ in range(channels)]
+
+
+    def attach_source(self, sourceFreq, sourceEff):
+        # photons are emitted by `emit` on every clock tick
+        return None
+
+
+    def emit(self, message):
+        """
+        Clock tick handler emitting one photon on every sub-channel
+        """
+        if self.qubit_pool is not None:
+            qubits = [self.qubit_pool.acquire() for _ in range(self.channels)]
+        else:
+            qubits = ns.qubits.create_qubits(self.channels)
+        for frame, q in zip(self.frames, qubits):
+            frame.append(q)
+
+        if len(self.frames[0]) == self.photon_count:
+            n = self.photon_count
+            for k, frame in enumerate(self.frames):
+                lo, hi = k * n, (k + 1) * n
+                msg = self.encode(frame, self.basis_list[lo:hi], self.bit_list[lo:hi], channel=k)
+                self.node.ports[self.port_qo_names[k]].tx_output(msg)
+            self.frames = [[] for _ in range(self.channels)]
+
+
+    def gen_qubits(self):
+        clock = Clock("[A: Clock]", frequency=self.source_freq, max_ticks=self.photon_count)
+        clock.ports["cout"].bind_output_handler(self.emit)
+        clock.start()
+
+
+class MultiplexedBobProtocol(BobProtocol):
+    """
+    Bob for multiplexed BB84: measures each sub-channel's frame as it arrives (with its
+    own detector, if a detector model is set) and announces the bases of all
+    sub-channels in one message once every frame is in.
+
+    Attributes:
+        channels        number of sub-channels K
+        port_qi_names   quantum in port per sub-channel
+        channel_meas    outcomes per sub-channel (None until received)
+        channel_bases   announced bases per sub-channel (None until received)
+    """
+    def __init__(self, node, photonCount, channels, portNames=None, basisList=None, pZ=None):
+        portNames = portNames or [f"B.Q.In.{k}" for k in range(channels)] + ["B.C.In", "B.C.Out"]
+        super().__init__(node, photonCount * channels, portNames=[portNames[0]] + portNames[channels:],
+                         basisList=basisList, pZ=pZ)
+        self.photon_count  = photonCount
+        self.channels      = channels
+        self.port_qi_names = portNames[:channels]
+        self.channel_meas  = [None] * channels
+        self.channel_bases = [None] * channels
+
+
+    def handle_frame(self, msg):
+        """
+        Quantum input handler shared by all sub-channels (the channel index travels in the metadata)
+        """
+        k = msg.meta["channel"]
+        n = self.photon_count
+        bases = self.basis_list[k * n:(k + 1) * n]
+        meas = self.measure(msg, bases)
+        announced = bases
+        if self.detector is not None:
+            # every sub-channel has its own detector: dead time does not carry across
+            meas, announced, _ = self.apply_detector(meas, bases)
+        self.channel_meas[k], self.channel_bases[k] = meas, announced
+
+        if all(m is not None for m in self.channel_meas):
+            self.meas_results = [m for meas in self.channel_meas for m in meas]
+            self.announced_bases = [b for bases in self.channel_bases for b in bases]
+            self.bits = list(zip(self.basis_list, self.meas_results))
+            self.node.ports[self.port_co_name].tx_output(self.announced_bases)
+
+
+    def run(self):
+        for name in self.port_qi_names:
+            self.node.ports[name].bind_input_handler(self.handle_frame)
+
+        port = self.node.ports[self.port_ci_name]
+        yield self.await_port_input(port)
+        alice_bases = port.rx_input().items
+        self.sift(alice_bases)
+        self.end_time = ns.sim_time(magnitude=ns.NANOSECOND)
+
+
+    def sift(self, alice_bases):
+        """
+        Sift all sub-channels at once against Alice's bases
+        """
+        self.mask, self.key, self.test_mask, self.test_key = sift_frame(self.announced_bases, alice_bases,
+                                                                        self.meas_results, self.p_z)
+
+
+@restore_formalism
+def run_BB84_multiplexed_sims(runtimes=10,
+                              channels=4,
+                              fibreLen=1,
+                              qDelay=0,
+                              qSpeed=0.8,
+                              photonCount=1024,
+                              sourceFreq=1e7,
+                              attack=None,
+                              noise=None,
+                              fastNoise=False,
+                              formalism=None,
+                              qubitPool=None,
+                              detector=None,
+                              pZ=None,
+                              profiler=None):
+    """
+    Run `runtimes` BB84 simulations over a link of `channels` parallel sub-channels, each
+    carrying `photonCount` photons per run with its own quantum channel (sharing the
+    attack/noise models) and detector.
+
+    `pZ` selects efficient BB84 as in run_BB84_sims: keys are then Z-basis bits only.
+    `profiler` is as in run_BB84_sims; the profiles of every K are merged into it.
+
+    Returns:
+        (KeyListA, KeyListB, KeyRateList, WallList) with the wall-clock seconds per run
+    """
+    useTableau = set_formalism(formalism)
+    if useTableau and noise is not None and not fastNoise:
+        raise ValueError("the tableau engine does not act on netsquid qubits; "
+                         "per-qubit noise needs a netsquid formalism (use fastNoise)")
+
+    KeyListA    = []
+    KeyListB    = []
+    KeyRateList = []
+    WallList    = []
+
+    for _ in range(runtimes):
+        wallStart = time.perf_counter()
+        with profiled(profiler):
+            ns.sim_reset()
+
+            # nodes =================================================
+            qOut = [f"A.Q.Out.{k}" for k in range(channels)]
+            qIn  = [f"B.Q.In.{k}" for k in range(channels)]
+            alice = Node("Alice", port_names=qOut + ["A.C.Out", "A.C.In"])
+            bob   = Node("Bob", port_names=qIn + ["B.C.In", "B.C.Out"])
+
+            # channels ==============================================
+            for k in range(channels):
+                QChann = QuantumChannel(f"[A: -Q{k}-> :B]",
+                                        delay=qDelay,
+                                        length=fibreLen,
+                                        models=quantum_channel_models(qSpeed, None if fastNoise else noise))
+
+                alice.connect_to(bob,
+                                 QChann,
+                                 local_port_name=alice.ports[qOut[k]].name,
+                                 remote_port_name=bob.ports[qIn[k]].name)
+
+            CChann1 = ClassicalChannel("[A: -C-> :B]",
+                                    delay=0,
+                                    length=fibreLen,
+                                    models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)})
+
+            CChann2 = ClassicalChannel("[B: -C-> :A]",
+                                    delay=0,
+                                    length=fibreLen,
+                                    models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)})
+
+            alice.connect_to(bob,
+                             CChann1,
+                             local_port_name=alice.ports["A.C.Out"].name,
+                             remote_port_name=bob.ports["B.C.In"].name)
+
+            bob.connect_to(alice,
+                           CChann2,
+                           local_port_name=bob.ports["B.C.Out"].name,
+                           remote_port_name=alice.ports["A.C.In"].name)
+
+            # protocols =============================================
+            aliceProt = MultiplexedAliceProtocol(alice, photonCount, sourceFreq, channels, portNames=list(alice.ports.keys()), pZ=pZ)
+            bobProt = MultiplexedBobProtocol(bob, photonCount, channels, portNames=list(bob.ports.keys()), pZ=pZ)
+
+            aliceProt.tableau = bobProt.tableau = useTableau
+            aliceProt.qubit_pool = bobProt.qubit_pool = qubitPool
+            bobProt.detector, bobProt.source_freq = detector, sourceFreq
+            aliceProt.attack = attack
+            if fastNoise and noise is not None:
+                aliceProt.flip_probs = channel_flip_probabilities(noise, fibreLen)
+
+            bobProt.start()
+            aliceProt.start()
+
+            startTime = ns.util.simtools.sim_time(magnitude=ns.NANOSECOND)
+            stats = ns.sim_run()
+
+        endTime = bobProt.end_time
+
+        keyA, keyB = aliceProt.key, bobProt.key
+
+        KeyListA.append(keyA)
+        KeyListB.append(keyB)
+        KeyRateList.append(len(keyA) * 10**9 / (endTime - startTime))
+        WallList.append(time.perf_counter() - wallStart)
+
+    return KeyListA, KeyListB, KeyRateList, WallList
+
+
+def multiplexing_scaling(channelCounts=(1, 2, 4, 8), runtimes=5, **kwargs):
+    """
+    Aggregate key rate and simulation cost against the number of sub-channels K.
+
+    Returns:
+        list of dicts (one per K) with avg_key_rate, rate_per_channel, rate_gain and
+        rate_efficiency (gain / K) relative to the smallest K, wall_seconds per run and
+        cost_ratio (wall time relative to the smallest K; below K means sub-linear cost)
+    """
+    rows = []
+    for K in channelCounts:
+        _, _, rates, walls = run_BB84_multiplexed_sims(runtimes=runtimes, channels=K, **kwargs)
+        rows.append({"channels": K,
+                     "avg_key_rate": sum(rates) / len(rates),
+                     "wall_seconds": sum(walls) / len(walls)})
+    base = rows[0]
+    for row in rows:
+        row["rate_per_channel"] = row["avg_key_rate"] / row["channels"]
+        row["rate_gain"]        = row["avg_key_rate"] / base["avg_key_rate"] if base["avg_key_rate"] else float('nan')
+        row["rate_efficiency"]  = row["rate_gain"] * base["channels"] / row["channels"]
+        row["cost_ratio"]       = row["wall_seconds"] / base["wall_seconds"]
+    return rows
@@ -0,0 +1,362 @@
+import netsquid as ns
+
+from netsquid.nodes import Node
+from netsquid.components import Clock, QuantumChannel, ClassicalChannel
+from netsquid.components.component import Message
+
+from lib.functions import HybridDelayModel, quantum_channel_models, restore_formalism, set_formalism, set_seed, sift_frame
+from lib.noise import channel_flip_probabilities
+from lib.profiling import profiled
+
+from BB84.BB84_Alice import AliceProtocol
+from BB84.BB84_Bob import BobProtocol
+from BB84.BB84_run import run_BB84_sims
+
+
+
+class PipelinedAliceProtocol(AliceProtocol):
+    """
+    Alice for multi-round BB84 where sifting of round k overlaps with the
+    transmission of round k+1.
+
+    Every quantum and classical message carries its round number in the message
+    metadata, so rounds can be handled out of order on either port. Round k carries
+    photons k * photon_count ... (k + 1) * photon_count - 1 of basis_list/bit_list and
+    is sifted like a sequential frame (lib.functions.sift_frame).
+
+    Attributes:
+        rounds          number of rounds of `photon_count` photons each
+        round_keys      sifted key per round (None until sifted)
+        round_masks     kept photon indices per round (None until sifted)
+        round_tests     (test mask, test key) per round, efficient BB84 only
+        sent_rounds     number of rounds already transmitted
+
+    Parameters:
+        rounds          number of rounds to transmit
+    """
+    def __init__(self, node, photonCount, sourceFreq, rounds, sourceEff=1, portNames=["A.Q.Out","A.C.Out","A.C.In"],
+                 basisList=None, bitList=None, pZ=None):
+        super().__init__(node, photonCount * rounds, sourceFreq, sourceEff=sourceEff, portNames=portNames,
+                         basisList=basisList, bitList=bitList, pZ=pZ)
+        # photon_count is per round; basis_list/bit_list span all of them
+        self.photon_count = photonCount
+        self.rounds       = rounds
+        self.round_keys   = [None] * rounds
+        self.round_masks  = [None] * rounds
+        self.round_tests  = [None] * rounds
+        self.sent_rounds  = 0
+
+
+    def round_slice(self, k):
+        return slice(k * self.photon_count, (k + 1) * self.photon_count)
+
+
+    def store_source_output(self, qubit):
+        """
+        Batch source output into rounds and send each round as soon as it is complete
+        """
+        self.source_Qlist.append(qubit.items[0])
+
+        if len(self.source_Qlist) == self.photon_count:
+            k = self.sent_rounds
+            s = self.round_slice(k)
+            msg = self.encode(self.source_Qlist, self.basis_list[s], self.bit_list[s], round=k)
+            self.node.ports[self.port_qo_name].tx_output(msg)
+            self.source_Qlist = []
+            self.sent_rounds += 1
+
+
+    def handle_bob_bases(self, msg):
+        """
+        Classical input handler: reply with Alice's bases for that round and sift it
+        """
+        k = msg.meta["round"]
+        s = self.round_slice(k)
+        self.node.ports[self.port_co_name].tx_output(Message(self.basis_list[s], round=k))
+
+        mask, key, test_mask, test_key = sift_frame(self.basis_list[s], msg.items, self.bit_list[s], self.p_z)
+        self.round_masks[k] = [s.start + i for i in mask]
+        self.round_keys[k]  = key
+        self.round_tests[k] = ([s.start + i for i in test_mask], test_key)
+
+        if all(key is not None for key in self.round_keys):
+            self.finalise()
+
+
+    def finalise(self):
+        """
+        Concatenate the per-round keys in round order
+        """
+        self.key       = [b for key in self.round_keys for b in key]
+        self.mask      = [i for mask in self.round_masks for i in mask]
+        self.test_key  = [b for _, key in self.round_tests for b in key]
+        self.test_mask = [i for mask, _ in self.round_tests for i in mask]
+
+
+    def gen_qubits(self):
+        clock = Clock("[A: Clock]", frequency=self.source_freq, max_ticks=self.photon_count * self.rounds)
+        if self.qubit_pool is not None:
+            clock.ports["cout"].bind_output_handler(self.emit_pooled)
+        else:
+            clock.ports["cout"].connect(self.a_source.ports["trigger"])
+        clock.start()
+
+
+    def run(self):
+        """
+        Start transmission; everything else is driven by port input handlers
+        """
+        self.node.ports[self.port_ci_name].bind_input_handler(self.handle_bob_bases)
+        self.gen_qubits()
+
+
+class PipelinedBobProtocol(BobProtocol):
+    """
+    Bob for multi-round BB84: each photon frame is measured and its bases announced
+    as soon as it arrives, while earlier rounds are still being sifted. All rounds reach
+    the same detector back to back, so its dead time carries over from round to round;
+    with a detector, rounds are therefore detected and announced in emission order even
+    if delay jitter delivers a later round first.
+
+    Attributes:
+        rounds              number of rounds expected
+        round_meas          outcomes per round
+        round_announced     bases announced per round (-1 for no click)
+        round_keys          sifted key per round (None until sifted)
+        round_masks         kept photon indices per round (None until sifted)
+        round_tests         (test mask, test key) per round, efficient BB84 only
+        first_key_time      simulation time (ns) the first round finished sifting
+        detected_rounds     rounds passed through the detector so far (in round order)
+    """
+    def __init__(self, node, photonCount, rounds, portNames=["B.Q.In","B.C.In","B.C.Out"], basisList=None, pZ=None):
+        super().__init__(node, photonCount * rounds, portNames=portNames, basisList=basisList, pZ=pZ)
+        self.photon_count    = photonCount
+        self.rounds          = rounds
+        self.round_meas      = [None] * rounds
+        self.round_announced = [None] * rounds
+        self.round_keys      = [None] * rounds
+        self.round_masks     = [None] * rounds
+        self.round_tests     = [None] * rounds
+        self.first_key_time  = None
+        self.detected_rounds = 0
+
+
+    def round_bases(self, k):
+        n = self.photon_count
+        return self.basis_list[k * n:(k + 1) * n]
+
+
+    def handle_photons(self, msg):
+        """
+        Quantum input handler: measure the round and announce its bases
+        """
+        k = msg.meta["round"]
+        self.round_meas[k] = self.measure(msg, self.round_bases(k))
+        if self.detector is None:
+            self.announce(k, self.round_bases(k))
+            return
+
+        # the detector sees rounds in emission order: a round delivered early waits for
+        # the ones before it, so their clicks' dead time is applied to it and not the reverse
+        n = self.photon_count
+        while self.detected_rounds < self.rounds and self.round_meas[self.detected_rounds] is not None:
+            j = self.detected_rounds
+            self.round_meas[j], announced, _ = self.apply_detector(self.round_meas[j], self.round_bases(j),
+                                                                   start=j * n * 1e9 / self.source_freq)
+            self.detected_rounds += 1
+            self.announce(j, announced)
+
+
+    def announce(self, k, announced):
+        """
+        Send the bases announced for round k to Alice
+        """
+        self.round_announced[k] = announced
+        self.node.ports[self.port_co_name].tx_output(Message(announced, round=k))
+
+
+    def handle_alice_bases(self, msg):
+        """
+        Classical input handler: sift the round Alice's bases belong to
+        """
+        k = msg.meta["round"]
+        offset = k * self.photon_count
+        mask, key, test_mask, test_key = sift_frame(self.round_announced[k], msg.items, self.round_meas[k], self.p_z)
+        self.round_masks[k] = [offset + i for i in mask]
+        self.round_keys[k]  = key
+        self.round_tests[k] = ([offset + i for i in test_mask], test_key)
+
+        now = ns.sim_time(magnitude=ns.NANOSECOND)
+        if self.first_key_time is None:
+            self.first_key_time = now
+        if all(key is not None for key in self.round_keys):
+            self.key       = [b for key in self.round_keys for b in key]
+            self.mask      = [i for mask in self.round_masks for i in mask]
+            self.test_key  = [b for _, key in self.round_tests for b in key]
+            self.test_mask = [i for mask, _ in self.round_tests for i in mask]
+            self.meas_results = [m for meas in self.round_meas for m in meas]
+            self.announced_bases = [b for bases in self.round_announced for b in bases]
+            self.bits = list(zip(self.basis_list, self.meas_results))
+            self.end_time = now
+
+
+    def run(self):
+        self.node.ports[self.port_qi_name].bind_input_handler(self.handle_photons)
+        self.node.ports[self.port_ci_name].bind_input_handler(self.handle_alice_bases)
+
+
+@restore_formalism
+def run_BB84_pipelined_sims(runtimes=10,
+                            rounds=8,
+                            fibreLen=1,
+                            qDelay=0,
+                            qSpeed=0.8,
+                            photonCount=1024,
+                            sourceFreq=1e7,
+                            attack=None,
+                            noise=None,
+                            fastNoise=False,
+                            formalism=None,
+                            detector=None,
+                            qubitPool=None,
+                            crn=None,
+                            pZ=None,
+                            profiler=None):
+    """
+    Run `runtimes` pipelined BB84 simulations of `rounds` rounds of `photonCount` photons.
+
+    `detector`, `qubitPool`, `crn`, `pZ` and `profiler` are as in run_BB84_sims. The
+    detector sees all rounds of a run back to back, and crn inputs of run i cover all of
+    its rounds.
+
+    Returns:
+        (KeyListA, KeyListB, KeyRateList, TimingList) where TimingList holds per run
+        the total time and the time to the first sifted round, both in ns
+    """
+    useTableau = set_formalism(formalism)
+    if useTableau and noise is not None and not fastNoise:
+        raise ValueError("the tableau engine does not act on netsquid qubits; "
+                         "per-qubit noise needs a netsquid formalism (use fastNoise)")
+
+    KeyListA    = []
+    KeyListB    = []
+    KeyRateList = []
+    TimingList  = []
+
+    for run in range(runtimes):
+        with profiled(profiler):
+            ns.sim_reset()
+            if crn is not None:
+                set_seed(crn.run_seed(run))
+
+            # nodes =================================================
+            alice = Node("Alice", port_names=["A.Q.Out", "A.C.Out", "A.C.In"])
+            bob   = Node("Bob", port_names=["B.Q.In", "B.C.In", "B.C.Out"])
+
+            # channels ==============================================
+            QChann = QuantumChannel("[A: -Q-> :B]",
+                                    delay=qDelay,
+                                    length=fibreLen,
+                                    models=quantum_channel_models(qSpeed, None if fastNoise else noise))
+
+            alice.connect_to(bob,
+                             QChann,
+                             local_port_name=alice.ports["A.Q.Out"].name,
+                             remote_port_name=bob.ports["B.Q.In"].name)
+
+            CChann1 = ClassicalChannel("[A: -C-> :B]",
+                                    delay=0,
+                                    length=fibreLen,
+                                    models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)})
+
+            CChann2 = ClassicalChannel("[B: -C-> :A]",
+                                    delay=0,
+                                    length=fibreLen,
+                                    models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)})
+
+            alice.connect_to(bob,
+                             CChann1,
+                             local_port_name=alice.ports["A.C.Out"].name,
+                             remote_port_name=bob.ports["B.C.In"].name)
+
+            bob.connect_to(alice,
+                           CChann2,
+                           local_port_name=bob.ports["B.C.Out"].name,
+                           remote_port_name=alice.ports["A.C.In"].name)
+
+            # protocols =============================================
+            basesA = bitsA = basesB = None
+            if crn is not None:
+                basesA, bitsA = crn.inputs(run, "alice", photonCount * rounds, pZ)
+                basesB, _     = crn.inputs(run, "bob", photonCount * rounds, pZ)
+
+            aliceProt = PipelinedAliceProtocol(alice, photonCount, sourceFreq, rounds, portNames=list(alice.ports.keys()),
+                                               basisList=basesA, bitList=bitsA, pZ=pZ)
+            bobProt = PipelinedBobProtocol(bob, photonCount, rounds, portNames=list(bob.ports.keys()),
+                                           basisList=basesB, pZ=pZ)
+
+            aliceProt.tableau = bobProt.tableau = useTableau
+            aliceProt.qubit_pool = bobProt.qubit_pool = qubitPool
+            bobProt.detector, bobProt.source_freq = detector, sourceFreq
+            aliceProt.attack = attack
+            if fastNoise and noise is not None:
+                aliceProt.flip_probs = channel_flip_probabilities(noise, fibreLen)
+
+            bobProt.start()
+            aliceProt.start()
+
+            startTime = ns.util.simtools.sim_time(magnitude=ns.NANOSECOND)
+            stats = ns.sim_run()
+
+        endTime = bobProt.end_time
+
+        keyA, keyB = aliceProt.key, bobProt.key
+
+        KeyListA.append(keyA)
+        KeyListB.append(keyB)
+
+        keyRate = len(keyA) * 10**9 / (endTime - startTime)
+        KeyRateList.append(keyRate)
+        TimingList.append({"total_ns": endTime - startTime, "first_key_ns": bobProt.first_key_time - startTime})
+
+    return KeyListA, KeyListB, KeyRateList, TimingList
+
+
+def pipelining_gain(rounds=8, runtimes=5, **kwargs):
+    """
+    Compare pipelined BB84 against running the same rounds back to back with the
+    sequential protocols.
+
+    Parameters:
+        rounds      rounds per pipelined run (= sequential runs per comparison)
+        runtimes    repetitions to average over
+        kwargs      forwarded to both run functions (fibreLen, photonCount, ...)
+
+    Returns:
+        dict with mean total time, first-key latency and throughput of both variants
+        and the resulting speed-up
+    """
+    _, keysP, _, timings = run_BB84_pipelined_sims(runtimes=runtimes, rounds=rounds, **kwargs)
+    totalP = sum(t["total_ns"] for t in timings) / runtimes
+    firstP = sum(t["first_key_ns"] for t in timings) / runtimes
+    bitsP  = sum(len(k) for k in keysP) / runtimes
+
+    # one sequential run is one round; K rounds take K back-to-back runs, each timed from
+    # the simulation reset (time 0) to the end of Bob's sifting like the pipelined runs
+    durations = []
+    hook = lambda prots: durations.append(prots["bob"].end_time)
+    _, keysS, _ = run_BB84_sims(runtimes=runtimes * rounds, runHook=hook, **kwargs)
+    roundS = sum(durations) / len(durations) if durations else float('nan')
+    totalS = roundS * rounds
+    bitsS  = sum(len(k) for k in keysS) / runtimes
+
+    return {
+        "rounds":                 rounds,
+        "sequential_total_ns":    totalS,
+        "pipelined_total_ns":     totalP,
+        "sequential_first_key_ns": roundS,
+        "pipelined_first_key_ns": firstP,
+        "sequential_throughput":  bitsS * 1e9 / totalS,
+        "pipelined_throughput":   bitsP * 1e9 / totalP,
+        "speedup":                totalS / totalP,
+    }
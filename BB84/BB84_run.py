@@ -4,87 +4,200 @@ import netsquid as ns
 from netsquid.nodes import Node
 from netsquid.components import QuantumChannel, ClassicalChannel
 
-import sys
-scriptpath = "lib/"
-sys.path.append(scriptpath)
-from lib.functions import HybridDelayModel
+from lib.functions import HybridDelayModel, quantum_channel_models, restore_formalism, set_formalism, set_seed
+from lib.noise import channel_flip_probabilities
+from lib.profiling import profiled
+from lib.stats import RunAggregator
 
-from BB84_Alice import AliceProtocol
-from BB84_Bob import BobProtocol
+from BB84.BB84_Alice import AliceProtocol
+from BB84.BB84_Bob import BobProtocol
 
 
 
+@restore_formalism
 def run_BB84_sims(runtimes=10,
                   fibreLen=1,
                   qDelay=0,
                   qSpeed=0.8,
                   photonCount=1024,
-                  sourceFreq=1e7):
-    
+                  sourceFreq=1e7,
+                  summaryOnly=False,
+                  keyDir=None,
+                  returnBases=False,
+                  attack=None,
+                  noise=None,
+                  fastNoise=False,
+                  formalism=None,
+                  qubitPool=None,
+                  memoryMonitor=None,
+                  detector=None,
+                  runHook=None,
+                  crn=None,
+                  profiler=None,
+                  pZ=None):
+    """
+    Run `runtimes` independent BB84 simulations.
+
+    Returns (KeyListA, KeyListB, KeyRateList), or with `summaryOnly` a
+    lib.stats.RunAggregator into which each run is reduced as soon as it
+    finishes (raw keys are written to `keyDir` if given, otherwise dropped).
+    With `returnBases` a fourth list holds the basis of every sifted bit per run.
+
+    `attack` is an optional lib.attacks.EavesdropperModel at the start of the quantum
+    channel between A.Q.Out and B.Q.In; it attacks Alice's frames before any channel
+    noise (and works with every formalism, the tableau engine included).
+
+    `noise` is an optional lib.noise.FibreNoiseModel for the quantum channel. With
+    `fastNoise` it is applied as its equivalent in-basis bit-flip probability on
+    Alice's encoded bits instead of operating on each qubit in the channel.
+
+    `formalism` selects the netsquid state formalism ("ket", "dm", "stab", "gslc"), or
+    "tableau" for the batched lib.tableau engine acting on whole photon frames.
+
+    `qubitPool` is an optional lib.pool.QubitPool shared by all runs: senders draw
+    photons from it and receivers return them once measured; its `peak_live` and
+    `stats()` report the live-qubit high-water mark afterwards. QubitPool(reuse=False)
+    reports it without recycling; with no pool measured photons are discarded.
+
+    `memoryMonitor` is an optional lib.memory.MemoryMonitor sampling traced memory
+    around each run; with a budget it aborts (MemoryBudgetExceeded) or shrinks the
+    frame size of a run predicted not to fit. Photon frames are sampled as they enter
+    and leave the quantum channel(s), for the qubit_lists / channel_queues holders.
+
+    `detector` is an optional lib.detector.DetectorModel for Bob (efficiency, dark
+    counts, dead time, afterpulsing); slots without a click are sifted out.
+
+    `runHook` is an optional callable given the dict of protocols of every finished
+    run, e.g. to collect statistics the returned lists do not carry.
+
+    `crn` is an optional lib.crn.CommonRandomNumbers: run i then uses its basis/bit
+    strings and RNG substream for run i, so every point of a sweep (and both protocols)
+    sees the same randomness and differences between points are not sampling noise.
+
+    `profiler` is an optional lib.profiling.RunProfiler; every repetition (network set-up
+    and simulation) is profiled and merged into its statistics.
+
+    `pZ` is an optional probability of choosing the Z-basis, which selects efficient BB84:
+    the returned keys and key rates then count Z-basis bits only, a fraction pZ^2 of the
+    photons (1/4 for pZ = 0.5), and the sifted X-basis bits stay on the protocols as
+    `test_key` for parameter estimation. With None (default) bases are uniform and every
+    sifted bit is key.
+    """
+    useTableau = set_formalism(formalism)
+    if useTableau and noise is not None and not fastNoise:
+        raise ValueError("the tableau engine does not act on netsquid qubits; "
+                         "per-qubit noise needs a netsquid formalism (use fastNoise)")
+
+    aggregator  = RunAggregator(key_dir=keyDir, prefix="bb84") if summaryOnly else None
+
     KeyListA    = []
     KeyListB    = []
     KeyRateList = []
+    BasisList   = []
 
     counts = []
 
-    for _ in range(runtimes):
-
-        ns.sim_reset()
-
-        # nodes =================================================
-        alice = Node("Alice", port_names=["A.Q.Out", "A.C.Out", "A.C.In"])
-        bob   = Node("Bob", port_names=["B.Q.In", "B.C.In", "B.C.Out"])
-
-        # channels ==============================================
-        QChann = QuantumChannel("[A: -Q-> :B]",
-                                delay=qDelay,
-                                length=fibreLen,
-                                models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)})
+    for run in range(runtimes):
+        runPhotons = photonCount
+        if memoryMonitor is not None:
+            runPhotons = memoryMonitor.plan(photonCount)
+            memoryMonitor.start_run(runPhotons)
+        with profiled(profiler):
+            ns.sim_reset()
+            if crn is not None:
+                set_seed(crn.run_seed(run))
+
+            # nodes =================================================
+            alice = Node("Alice", port_names=["A.Q.Out", "A.C.Out", "A.C.In"])
+            bob   = Node("Bob", port_names=["B.Q.In", "B.C.In", "B.C.Out"])
+
+            # channels ==============================================
+            qModels = quantum_channel_models(qSpeed, None if fastNoise else noise)
+
+            QChann = QuantumChannel("[A: -Q-> :B]",
+                                    delay=qDelay,
+                                    length=fibreLen,
+                                    models=qModels)
         
-        alice.connect_to(bob,
-                         QChann,
-                         local_port_name=alice.ports["A.Q.Out"].name,
-                         remote_port_name=bob.ports["B.Q.In"].name)
+            alice.connect_to(bob,
+                             QChann,
+                             local_port_name=alice.ports["A.Q.Out"].name,
+                             remote_port_name=bob.ports["B.Q.In"].name)
         
 
-        CChann1 = ClassicalChannel("[A: -C-> :B]",
-                                delay=0,
-                                length=fibreLen,
-                                models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)})
+            CChann1 = ClassicalChannel("[A: -C-> :B]",
+                                    delay=0,
+                                    length=fibreLen,
+                                    models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)})
         
-        CChann2 = ClassicalChannel("[B: -C-> :A]",
-                                delay=0,
-                                length=fibreLen,
-                                models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)})
+            CChann2 = ClassicalChannel("[B: -C-> :A]",
+                                    delay=0,
+                                    length=fibreLen,
+                                    models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)})
         
-        alice.connect_to(bob,
-                         CChann1,
-                         local_port_name=alice.ports["A.C.Out"].name,
-                         remote_port_name=bob.ports["B.C.In"].name)
+            alice.connect_to(bob,
+                             CChann1,
+                             local_port_name=alice.ports["A.C.Out"].name,
+                             remote_port_name=bob.ports["B.C.In"].name)
         
-        bob.connect_to(alice,
-                       CChann2,
-                       local_port_name=bob.ports["B.C.Out"].name,
-                       remote_port_name=alice.ports["A.C.In"].name)
+            bob.connect_to(alice,
+                           CChann2,
+                           local_port_name=bob.ports["B.C.Out"].name,
+                           remote_port_name=alice.ports["A.C.In"].name)
         
-        # protocols =============================================
-        aliceProt = AliceProtocol(alice, photonCount, sourceFreq, portNames=list(alice.ports.keys()))
-        bobProt = BobProtocol(bob, photonCount, portNames=list(bob.ports.keys()))
+            # protocols =============================================
+            basesA = bitsA = basesB = None
+            if crn is not None:
+                basesA, bitsA = crn.inputs(run, "alice", runPhotons, pZ)
+                basesB, _     = crn.inputs(run, "bob", runPhotons, pZ)
 
-        bobProt.start()
-        aliceProt.start()
+            aliceProt = AliceProtocol(alice, runPhotons, sourceFreq, portNames=list(alice.ports.keys()),
+                                      basisList=basesA, bitList=bitsA, pZ=pZ)
+            bobProt = BobProtocol(bob, runPhotons, portNames=list(bob.ports.keys()), basisList=basesB, pZ=pZ)
 
-        startTime = ns.util.simtools.sim_time(magnitude=ns.NANOSECOND)
-        stats = ns.sim_run()
+            aliceProt.tableau = bobProt.tableau = useTableau
+            if crn is not None and useTableau and not (fastNoise and noise is not None):
+                aliceProt.frame_template = crn.encoded_frame(run, "alice", runPhotons, pZ)
+            aliceProt.qubit_pool = bobProt.qubit_pool = qubitPool
+            aliceProt.memory_monitor = bobProt.memory_monitor = memoryMonitor
+            bobProt.detector, bobProt.source_freq = detector, sourceFreq
+
+            aliceProt.attack = attack
+            if fastNoise and noise is not None:
+                aliceProt.flip_probs = channel_flip_probabilities(noise, fibreLen)
+
+            bobProt.start()
+            aliceProt.start()
+
+            startTime = ns.util.simtools.sim_time(magnitude=ns.NANOSECOND)
+            stats = ns.sim_run()
 
         endTime = bobProt.end_time
 
+        if memoryMonitor is not None:
+            memoryMonitor.end_run({"alice": aliceProt, "bob": bobProt}, keepKeys=not summaryOnly)
+
+        if runHook is not None:
+            runHook({"alice": aliceProt, "bob": bobProt})
+
         keyA, keyB = aliceProt.key, bobProt.key
+        keyRate = len(keyA) * 10**9 / (endTime - startTime)
+
+        bases = [aliceProt.basis_list[i] for i in aliceProt.mask]
+
+        if aggregator is not None:
+            aggregator.add_run(keyA, keyB, keyRate, bases=bases)
+            continue
 
         KeyListA.append(keyA)
         KeyListB.append(keyB)
-
-        keyRate = len(keyA) * 10**9 / (endTime - startTime)
         KeyRateList.append(keyRate)
+        BasisList.append(bases)
+
+    if aggregator is not None:
+        return aggregator
+
+    if returnBases:
+        return KeyListA, KeyListB, KeyRateList, BasisList
 
     return KeyListA, KeyListB, KeyRateList
\ No newline at end of file
@@ -1,13 +1,15 @@
+import numpy as np
 import netsquid as ns
 
 from netsquid.protocols import NodeProtocol
 from netsquid.components import Clock
+from netsquid.components.component import Message
 from netsquid.components.qsource import SourceStatus
 
-import sys
-import os
-sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib"))
-from lib.functions import rng_bin_lst, SinglePhotonSource
+from lib import kernels
+from lib.functions import rng_basis_lst, rng_bin_lst, split_test_bits, SinglePhotonSource
+from lib.noise import sample_flips
+from lib.tableau import TableauFrame
 
 
 
@@ -27,14 +29,29 @@ class EndNodeProtocol(NodeProtocol):
         q_source        ====
         q_list          list of qubits emitted by attached photon source
         source_freq     frequency of attached photon source in Hz
-        mask            ====
+        mask            indices of the photons kept in the final key
+        keep            boolean array of bits not (yet) discarded during sifting
         flipper         ====
+        flip_probs      (p_z, p_x) classical-equivalent channel noise applied at encoding, or None
+        attack          lib.attacks.EavesdropperModel attacking each frame before channel noise, or None
+        tableau         encode the frame with the batched lib.tableau engine instead of qubit operations
+        qubit_pool      lib.pool.QubitPool to draw photons from instead of the photon source, or None
+        memory_monitor  lib.memory.MemoryMonitor sampling the encoded frame, or None
+        frame_template  pre-encoded TableauFrame of basis_list/bit_list to send instead of encoding, or None
+        p_z             probability of choosing the Z-basis (None: symmetric BB84)
+        test_key        X-basis sifted bits disclosed for parameter estimation (efficient BB84 only)
+        test_mask       photon indices of test_key
 
     Parameters:
         sourceEff       ====
         portNames       ====
+        basisList       basis choices to use instead of drawing them (e.g. lib.crn inputs)
+        bitList         bit choices to use instead of drawing them
+        pZ              Z-basis probability of efficient BB84, where only Z-basis bits form the
+                        key; None (default) for symmetric BB84 with uniform bases
     """
-    def __init__(self, node, name, photonCount, sourceFreq, sourceEff=1, portNames=["Q.Out", "C.Out", "C.In"]):
+    def __init__(self, node, name, photonCount, sourceFreq, sourceEff=1, portNames=["Q.Out", "C.Out", "C.In"],
+                 basisList=None, bitList=None, pZ=None):
         super().__init__()
         # distinguish node on which the protocol runs
         self.node = node
@@ -45,9 +62,10 @@ class EndNodeProtocol(NodeProtocol):
         self.port_qo_name = portNames[0]
         self.port_co_name = portNames[1]
         self.port_ci_name = portNames[2]
-        # basis and bit list for transmission
-        self.basis_list = rng_bin_lst(self.photon_count)
-        self.bit_list = rng_bin_lst(self.photon_count)
+        # basis and bit list for transmission, Z-basis with probability pZ (uniform if None)
+        self.p_z = pZ
+        self.basis_list = rng_basis_lst(self.photon_count, pZ) if basisList is None else list(basisList)
+        self.bit_list = rng_bin_lst(self.photon_count) if bitList is None else list(bitList)
         # key
         self.key = self.bit_list.copy()
         # source and handling for source
@@ -57,12 +75,29 @@ class EndNodeProtocol(NodeProtocol):
         self.source_eff = sourceEff
         # qubit list for batched released
         self.q_list = []
-        # mask for bit flips and discards
+        # indices kept in the final key
         self.mask = []
+        # X-basis bits (and their indices) disclosed for parameter estimation in efficient BB84
+        self.test_key = []
+        self.test_mask = []
+        # bits still eligible for the key (non-measurements and basis mismatches dropped)
+        self.keep = np.ones(photonCount, dtype=bool)
         # boolean to flip bits or not
         self.flipper = False
         # end time for timing data
         self.end_time = None
+        # fast path for channel noise, applied to the encoded bits
+        self.flip_probs = None
+        # eavesdropper on the outgoing link, applied to the frame before any noise
+        self.attack = None
+        # batched tableau engine instead of per-qubit operations
+        self.tableau = False
+        # lib.pool.QubitPool to draw photons from instead of the photon source
+        self.qubit_pool = None
+        # lib.memory.MemoryMonitor sampling the frame on its way to the channel
+        self.memory_monitor = None
+        # pre-encoded tableau frame (lib.crn), used once in place of encoding
+        self.frame_template = None
 
 
     def store_source_output(self, qubit):
@@ -84,11 +119,45 @@ class EndNodeProtocol(NodeProtocol):
         """
         Encode basis and bit and send batch on quantum port
         """
+        # eavesdropper at the start of the link: the states leaving Eve are sent instead
+        sent_bases, sent_bits = self.basis_list, self.bit_list
+        if self.attack is not None:
+            sent_bases, sent_bits = self.attack.intercept(self.basis_list, self.bit_list)
+        # fast noise path: flip the encoded (not the recorded) bit as the channel would
+        flips = sample_flips(sent_bases, self.flip_probs) if self.flip_probs is not None else None
+
+        if self.tableau:
+            # whole frame in one go; the state travels alongside the (untouched) photons
+            bits = np.asarray(sent_bits) if flips is None else np.asarray(sent_bits) ^ np.asarray(flips)
+            if flips is None and self.attack is None and self.frame_template is not None:
+                frame, self.frame_template = self.frame_template, None
+            else:
+                frame = TableauFrame.bb84(sent_bases, bits)
+            self.send_frame(Message(self.q_list, tableau=frame))
+            return
+
         for i, q in enumerate(self.q_list):
-            basis, bit = self.basis_list[i], self.bit_list[i]
+            basis, bit = sent_bases[i], sent_bits[i]
+            if flips is not None: bit ^= flips[i]
             if bit: ns.qubits.operate(q, ns.X)
             if basis: ns.qubits.operate(q, ns.H)
-        self.node.ports[self.port_qo_name].tx_output(self.q_list)
+        self.send_frame(self.q_list)
+
+
+    def send_frame(self, frame):
+        """
+        Send an encoded frame on the quantum port, sampled by the memory monitor (if any)
+        """
+        if self.memory_monitor is not None:
+            self.memory_monitor.frame_sent(frame)
+        self.node.ports[self.port_qo_name].tx_output(frame)
+
+
+    def emit_pooled(self, message):
+        """
+        Clock tick handler emitting a photon taken from self.qubit_pool
+        """
+        self.store_source_output(Message([self.qubit_pool.acquire()]))
 
 
     def gen_qubits(self):
@@ -98,6 +167,11 @@ class EndNodeProtocol(NodeProtocol):
         clock = Clock(f"[{self.name[0]}: Clock]", 
                         frequency=self.source_freq, 
                         max_ticks=self.photon_count)
+        if self.qubit_pool is not None:
+            # each tick emits a recycled photon instead of triggering the source
+            clock.ports["cout"].bind_output_handler(self.emit_pooled)
+            clock.start()
+            return
         try:
             clock.ports["cout"].connect(self.q_source.ports["trigger"])
         except Exception as e:
@@ -116,9 +190,9 @@ class EndNodeProtocol(NodeProtocol):
         self.meas = port.rx_input().items
 
         # discard non-measurements
-        for i, m in enumerate(self.meas):
-            if m == 0:
-                self.key[i] = "x"
+        n = len(self.meas)
+        self.keep = np.ones(len(self.key), dtype=bool)
+        self.keep[:n] = kernels.as_array(self.meas) != 0
 
 
     def discard_basis_mismatch(self):
@@ -129,35 +203,29 @@ class EndNodeProtocol(NodeProtocol):
         yield self.await_port_input(port)
         # collect discard list of indices
         discard = port.rx_input().items
-        # discard basis mismatches
-        for i in discard:
-            if i >= 0:
-                self.key[i] = "x"
+        # discard basis mismatches ([-1] when there are none)
+        discard = np.asarray(discard, dtype=np.int64)
+        self.keep[discard[discard >= 0]] = False
 
 
     def flip(self):
-        for i, m in enumerate(self.meas):
-            if not isinstance(self.key[i], int):
-                continue
-            if m == 0:
-                continue
-            if self.basis_list[i] == 0:  # Z-basis: always disagree before flip, so always flip
-                self.key[i] = (self.key[i] + 1) % 2
-            else:  # X-basis: need to determine correct condition
-                if m == -1:  # try this first
-                    self.key[i] = (self.key[i] + 1) % 2
+        """
+        Flip kept bits the relay's outcome shows to be anticorrelated with the partner's
+        """
+        meas = np.zeros(len(self.key), dtype=np.int8)
+        meas[:len(self.meas)] = kernels.as_array(self.meas)
+        self.key = kernels.mdi_flip(kernels.as_array(self.key), kernels.as_array(self.basis_list),
+                                    meas, self.keep).tolist()
 
 
     def discard(self):
         """
         Remove discarded bits from final key list
         """
-        key_new = []
-        for b in self.key:
-            if b == 0 or b == 1:
-                key_new.append(b)
-
-        self.key = key_new
+        key, mask = kernels.compress(kernels.as_array(self.key), self.keep)
+        self.key, self.mask = key.tolist(), mask.tolist()
+        if self.p_z is not None:
+            self.mask, self.key, self.test_mask, self.test_key = split_test_bits(self.mask, self.key, self.basis_list)
 
 
     def run(self):
@@ -3,6 +3,9 @@ import netsquid as ns
 from netsquid.components.qsource import SourceStatus
 from netsquid.protocols import NodeProtocol
 
+from lib import kernels
+from lib.tableau import bsm_outcomes
+
 
 
 class RelayNodeProtocol(NodeProtocol):
@@ -31,6 +34,14 @@ class RelayNodeProtocol(NodeProtocol):
         self.port_c1_o_name = portNames[5]
         # measurement list
         self.meas = []
+        # BSMs with the batched lib.tableau engine instead of qubit operations
+        self.tableau = False
+        # lib.pool.QubitPool measured photons are handed back to; discarded if None
+        self.qubit_pool = None
+        # received photon frames not yet handed back to the pool
+        self.frames = []
+        # lib.memory.MemoryMonitor sampling every received frame, if any
+        self.memory_monitor = None
 
 
     def bsm_total(self):
@@ -42,11 +53,22 @@ class RelayNodeProtocol(NodeProtocol):
         # receive from 1
         port = self.node.ports[self.port_q0_i_name]
         yield self.await_port_input(port)
-        q_list0 = port.rx_input().items
+        msg0 = port.rx_input()
+        q_list0 = msg0.items
+        self.frames.append(q_list0)
+        self.sample_frame(msg0)
         # receive from 2
         port = self.node.ports[self.port_q1_i_name]
         yield self.await_port_input(port)
-        q_list1 = port.rx_input().items
+        msg1 = port.rx_input()
+        q_list1 = msg1.items
+        self.frames.append(q_list1)
+        self.sample_frame(msg1)
+
+        if self.tableau:
+            self.meas = bsm_outcomes(msg0.meta["tableau"], msg1.meta["tableau"]).tolist()
+            self.release_frames()
+            return
 
         for q0, q1 in zip(q_list0, q_list1):
             # BSM
@@ -65,6 +87,44 @@ class RelayNodeProtocol(NodeProtocol):
             # otherwise (modelling the BS/PBS setup of Lo et al. 2012)
             else:
                 self.meas.append(0)
+
+        # photons are no longer needed: release them now rather than when the protocol is collected
+        self.release_frames()
+
+
+    def sample_frame(self, msg):
+        """
+        Hand a received frame to the memory monitor (if any) before it is measured
+        """
+        if self.memory_monitor is not None:
+            self.memory_monitor.frame_received(msg)
+
+
+    def release_qubits(self, *qubit_lists):
+        """
+        Hand measured photons back to the qubit pool so they can be reused, or discard
+        them if there is no pool (lost photons arrive as None and are skipped)
+        """
+        for qubits in qubit_lists:
+            if self.qubit_pool is not None:
+                self.qubit_pool.release(qubits)
+            else:
+                for q in qubits:
+                    if q is not None:
+                        ns.qubits.discard(q)
+
+
+    def release_frames(self):
+        """
+        Release every received frame, measured or not (e.g. when the other end's frame
+        never arrived before the run ended), including one still waiting on its port
+        """
+        frames, self.frames = self.frames, []
+        for name in (self.port_q0_i_name, self.port_q1_i_name):
+            msg = self.node.ports[name].rx_input()
+            if msg is not None:
+                frames.append(msg.items)
+        self.release_qubits(*frames)
     
 
     def basis_matching(self):
@@ -80,10 +140,8 @@ class RelayNodeProtocol(NodeProtocol):
         yield self.await_port_input(port)
         basis_list1 = port.rx_input().items
         
-        discard=[]
-        for i, b in enumerate(basis_list0):
-            if b != basis_list1[i]:
-                discard.append(i)
+        n = len(basis_list0)
+        discard = kernels.mismatch(kernels.as_array(basis_list0), kernels.as_array(basis_list1[:n])).tolist()
 
         self.node.ports[self.port_c0_o_name].tx_output(discard if len(discard) > 0 else [-1])
         self.node.ports[self.port_c1_o_name].tx_output(discard if len(discard) > 0 else [-1])
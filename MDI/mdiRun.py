@@ -3,132 +3,252 @@ import netsquid as ns
 from netsquid.nodes import Node
 from netsquid.components import QuantumChannel, ClassicalChannel
 
-import sys
-import os
-sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib"))
-from lib.functions import HybridDelayModel
+from lib.functions import HybridDelayModel, quantum_channel_models, restore_formalism, set_formalism, set_seed
+from lib.noise import channel_flip_probabilities
+from lib.profiling import profiled
+from lib.stats import RunAggregator
 
-from mdiEndUser import EndNodeProtocol
-from mdiRelayNode import RelayNodeProtocol
+from MDI.mdiEndUser import EndNodeProtocol
+from MDI.mdiRelayNode import RelayNodeProtocol
 
 
 
+@restore_formalism
 def run_mdi_sims(runtimes=10,
                  qDelay=0,
                  fibreLen=1,
                  qSpeed=0.8,
                  photonCount=1024,
-                 sourceFreq=1e7):
-    
+                 sourceFreq=1e7,
+                 summaryOnly=False,
+                 keyDir=None,
+                 returnBases=False,
+                 attackA=None,
+                 attackB=None,
+                 noise=None,
+                 fastNoise=False,
+                 formalism=None,
+                 qubitPool=None,
+                 memoryMonitor=None,
+                 runHook=None,
+                 crn=None,
+                 profiler=None,
+                 pZ=None):
+    """
+    Run `runtimes` independent MDI-QKD simulations.
+
+    Returns (KeyListA, KeyListB, KeyRateList), or with `summaryOnly` a
+    lib.stats.RunAggregator into which each run is reduced as soon as it
+    finishes (raw keys are written to `keyDir` if given, otherwise dropped).
+    With `returnBases` a fourth list holds the basis of every sifted bit per run.
+
+    `attackA` / `attackB` are optional lib.attacks.EavesdropperModel objects at the
+    start of the Alice -> Charlie and Bob -> Charlie input links respectively; each
+    attacks its end node's frames before any channel noise.
+
+    `noise` is an optional lib.noise.FibreNoiseModel applied to both quantum links.
+    With `fastNoise` it is applied as its equivalent in-basis bit-flip probability on
+    each end node's encoded bits instead of operating on each qubit in the channels.
+
+    `formalism` selects the netsquid state formalism ("ket", "dm", "stab", "gslc"), or
+    "tableau" for the batched lib.tableau engine acting on whole photon frames.
+
+    `qubitPool` is an optional lib.pool.QubitPool shared by all runs: senders draw
+    photons from it and receivers return them once measured; its `peak_live` and
+    `stats()` report the live-qubit high-water mark afterwards. QubitPool(reuse=False)
+    reports it without recycling; with no pool measured photons are discarded.
+
+    `memoryMonitor` is an optional lib.memory.MemoryMonitor sampling traced memory
+    around each run; with a budget it aborts (MemoryBudgetExceeded) or shrinks the
+    frame size of a run predicted not to fit. Photon frames are sampled as they enter
+    and leave the quantum channel(s), for the qubit_lists / channel_queues holders.
+
+    `runHook` is an optional callable given the dict of protocols of every run once
+    it has finished (or timed out), e.g. to collect the relay's BSM outcomes.
+
+    `crn` is an optional lib.crn.CommonRandomNumbers: run i then uses its basis/bit
+    strings and RNG substream for run i, so every point of a sweep (and both protocols)
+    sees the same randomness and differences between points are not sampling noise.
+
+    `profiler` is an optional lib.profiling.RunProfiler; every repetition (network set-up
+    and simulation) is profiled and merged into its statistics.
+
+    `pZ` is an optional probability of choosing the Z-basis, which selects efficient BB84:
+    the returned keys and key rates then count Z-basis bits only, a fraction pZ^2 of the
+    photons (1/4 for pZ = 0.5), and the sifted X-basis bits stay on the protocols as
+    `test_key` for parameter estimation. With None (default) bases are uniform and every
+    sifted bit is key.
+    """
+    useTableau = set_formalism(formalism)
+    if useTableau and noise is not None and not fastNoise:
+        raise ValueError("the tableau engine does not act on netsquid qubits; "
+                         "per-qubit noise needs a netsquid formalism (use fastNoise)")
+
+    aggregator  = RunAggregator(key_dir=keyDir, prefix="mdi") if summaryOnly else None
+
     KeyListA    = []
     KeyListB    = []
     KeyRateList = []
+    BasisList   = []
 
-    for _ in range(runtimes):
-        ns.sim_reset()
+    for run in range(runtimes):
+        runPhotons = photonCount
+        if memoryMonitor is not None:
+            runPhotons = memoryMonitor.plan(photonCount)
+            memoryMonitor.start_run(runPhotons)
+        with profiled(profiler):
+            ns.sim_reset()
+            if crn is not None:
+                set_seed(crn.run_seed(run))
 
-        # nodes =================================================
-        alice   = Node("Alice", port_names=["A.Q.Out", "A.C.Out", "A.C.In"])
-        bob     = Node("Bob", port_names=["B.Q.Out", "B.C.Out", "B.C.In"])
-        charlie = Node("Charlie", port_names=["C.Q.In.A", "C.Q.In.B", "C.C.In.A", "C.C.In.B", "C.C.Out.A", "C.C.Out.B"])
+            # nodes =================================================
+            alice   = Node("Alice", port_names=["A.Q.Out", "A.C.Out", "A.C.In"])
+            bob     = Node("Bob", port_names=["B.Q.Out", "B.C.Out", "B.C.In"])
+            charlie = Node("Charlie", port_names=["C.Q.In.A", "C.Q.In.B", "C.C.In.A", "C.C.In.B", "C.C.Out.A", "C.C.Out.B"])
 
-        # channels ==============================================
-        ### quantum
-        QChann1 = QuantumChannel("[A: -Q-> :C]",
-                                delay=qDelay,
-                                length=fibreLen,
-                                models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)})
+            # channels ==============================================
+            ### quantum
+            qModels1 = quantum_channel_models(qSpeed, None if fastNoise else noise)
+            qModels2 = quantum_channel_models(qSpeed, None if fastNoise else noise)
+
+            QChann1 = QuantumChannel("[A: -Q-> :C]",
+                                    delay=qDelay,
+                                    length=fibreLen,
+                                    models=qModels1)
         
-        QChann2 = QuantumChannel("[B: -Q-> :C]",
-                                delay=qDelay,
-                                length=fibreLen,
-                                models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)})
+            QChann2 = QuantumChannel("[B: -Q-> :C]",
+                                    delay=qDelay,
+                                    length=fibreLen,
+                                    models=qModels2)
         
-        alice.connect_to(charlie,
-                         QChann1,
-                         local_port_name=alice.ports["A.Q.Out"].name,
-                         remote_port_name=charlie.ports["C.Q.In.A"].name)
+            alice.connect_to(charlie,
+                             QChann1,
+                             local_port_name=alice.ports["A.Q.Out"].name,
+                             remote_port_name=charlie.ports["C.Q.In.A"].name)
         
-        bob.connect_to(charlie,
-                         QChann2,
-                         local_port_name=bob.ports["B.Q.Out"].name,
-                         remote_port_name=charlie.ports["C.Q.In.B"].name)
+            bob.connect_to(charlie,
+                             QChann2,
+                             local_port_name=bob.ports["B.Q.Out"].name,
+                             remote_port_name=charlie.ports["C.Q.In.B"].name)
         
-        ### classical
-        CChann1 = ClassicalChannel("[A: -C-> :C]",
-                                delay=0,
-                                length=fibreLen,
-                                models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)}
-                                )
+            ### classical
+            CChann1 = ClassicalChannel("[A: -C-> :C]",
+                                    delay=0,
+                                    length=fibreLen,
+                                    models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)}
+                                    )
         
-        CChann2 = ClassicalChannel("[B: -C-> :C]",
-                                delay=0,
-                                length=fibreLen,
-                                models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)}
-                                )
+            CChann2 = ClassicalChannel("[B: -C-> :C]",
+                                    delay=0,
+                                    length=fibreLen,
+                                    models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)}
+                                    )
         
-        CChann3 = ClassicalChannel("[C: -C-> :A]",
-                                delay=0,
-                                length=fibreLen,
-                                models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)}
-                                )
+            CChann3 = ClassicalChannel("[C: -C-> :A]",
+                                    delay=0,
+                                    length=fibreLen,
+                                    models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)}
+                                    )
         
-        CChann4 = ClassicalChannel("[C: -C-> :B]",
-                                delay=0,
-                                length=fibreLen,
-                                models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)}
-                                )
+            CChann4 = ClassicalChannel("[C: -C-> :B]",
+                                    delay=0,
+                                    length=fibreLen,
+                                    models={"delay_model": HybridDelayModel(SoL_fraction=qSpeed,stddev=0.05)}
+                                    )
         
-        alice.connect_to(charlie,
-                         CChann1,
-                         local_port_name=alice.ports["A.C.Out"].name,
-                         remote_port_name=charlie.ports["C.C.In.A"].name)
+            alice.connect_to(charlie,
+                             CChann1,
+                             local_port_name=alice.ports["A.C.Out"].name,
+                             remote_port_name=charlie.ports["C.C.In.A"].name)
         
-        bob.connect_to(charlie,
-                         CChann2,
-                         local_port_name=bob.ports["B.C.Out"].name,
-                         remote_port_name=charlie.ports["C.C.In.B"].name)
+            bob.connect_to(charlie,
+                             CChann2,
+                             local_port_name=bob.ports["B.C.Out"].name,
+                             remote_port_name=charlie.ports["C.C.In.B"].name)
         
-        charlie.connect_to(alice,
-                         CChann3,
-                         local_port_name=charlie.ports["C.C.Out.A"].name,
-                         remote_port_name=alice.ports["A.C.In"].name)
+            charlie.connect_to(alice,
+                             CChann3,
+                             local_port_name=charlie.ports["C.C.Out.A"].name,
+                             remote_port_name=alice.ports["A.C.In"].name)
         
-        charlie.connect_to(bob,
-                         CChann4,
-                         local_port_name=charlie.ports["C.C.Out.B"].name,
-                         remote_port_name=bob.ports["B.C.In"].name)
+            charlie.connect_to(bob,
+                             CChann4,
+                             local_port_name=charlie.ports["C.C.Out.B"].name,
+                             remote_port_name=bob.ports["B.C.In"].name)
         
-        # protocols =============================================
-        aliceProt = EndNodeProtocol(alice, 'alice', photonCount, sourceFreq, 
-                                    portNames=["A.Q.Out", "A.C.Out", "A.C.In"])
-        bobProt = EndNodeProtocol(bob, 'bob', photonCount, sourceFreq,
-                                  portNames=["B.Q.Out", "B.C.Out", "B.C.In"])
-        charlieProt = RelayNodeProtocol(charlie, 'charlie', photonCount,
-                                        portNames=["C.Q.In.A", "C.Q.In.B", "C.C.In.A", "C.C.In.B", "C.C.Out.A", "C.C.Out.B"])
+            # protocols =============================================
+            basesA = bitsA = basesB = bitsB = None
+            if crn is not None:
+                basesA, bitsA = crn.inputs(run, "alice", runPhotons, pZ)
+                basesB, bitsB = crn.inputs(run, "bob", runPhotons, pZ)
+
+            aliceProt = EndNodeProtocol(alice, 'alice', runPhotons, sourceFreq, 
+                                        portNames=["A.Q.Out", "A.C.Out", "A.C.In"],
+                                        basisList=basesA, bitList=bitsA, pZ=pZ)
+            bobProt = EndNodeProtocol(bob, 'bob', runPhotons, sourceFreq,
+                                      portNames=["B.Q.Out", "B.C.Out", "B.C.In"],
+                                      basisList=basesB, bitList=bitsB, pZ=pZ)
+            charlieProt = RelayNodeProtocol(charlie, 'charlie', runPhotons,
+                                            portNames=["C.Q.In.A", "C.Q.In.B", "C.C.In.A", "C.C.In.B", "C.C.Out.A", "C.C.Out.B"])
         
-        bobProt.flipper = True
+            bobProt.flipper = True
+            aliceProt.tableau = bobProt.tableau = charlieProt.tableau = useTableau
+            if crn is not None and useTableau and not (fastNoise and noise is not None):
+                aliceProt.frame_template = crn.encoded_frame(run, "alice", runPhotons, pZ)
+                bobProt.frame_template = crn.encoded_frame(run, "bob", runPhotons, pZ)
+            aliceProt.qubit_pool = bobProt.qubit_pool = charlieProt.qubit_pool = qubitPool
+            aliceProt.memory_monitor = bobProt.memory_monitor = charlieProt.memory_monitor = memoryMonitor
+
+            aliceProt.attack, bobProt.attack = attackA, attackB
+            if fastNoise and noise is not None:
+                aliceProt.flip_probs = channel_flip_probabilities(noise, fibreLen)
+                bobProt.flip_probs = channel_flip_probabilities(noise, fibreLen)
 
-        charlieProt.start()
-        aliceProt.start()
-        bobProt.start()
+            charlieProt.start()
+            aliceProt.start()
+            bobProt.start()
 
-        startTime = ns.util.simtools.sim_time(magnitude=ns.NANOSECOND)
-        stats = ns.sim_run(end_time=ns.SECOND)
+            startTime = ns.util.simtools.sim_time(magnitude=ns.NANOSECOND)
+            stats = ns.sim_run(end_time=ns.SECOND)
+            # a failed run leaves frames at the relay unmeasured; hand them back either way
+            charlieProt.release_frames()
+
+        if memoryMonitor is not None:
+            memoryMonitor.end_run({"alice": aliceProt, "bob": bobProt, "charlie": charlieProt},
+                                  keepKeys=not summaryOnly)
+
+        if runHook is not None:
+            runHook({"alice": aliceProt, "bob": bobProt, "charlie": charlieProt})
 
         if aliceProt.end_time is not None and bobProt.end_time is not None:
             endTime = max(aliceProt.end_time, bobProt.end_time)
             keyA, keyB = aliceProt.key, bobProt.key
+            keyRate = len(keyA) * 10**9 / (endTime - startTime)
+
+            bases = [aliceProt.basis_list[i] for i in aliceProt.mask]
+
+            if aggregator is not None:
+                aggregator.add_run(keyA, keyB, keyRate, bases=bases)
+                continue
 
             KeyListA.append(keyA)
             KeyListB.append(keyB)
-
-            keyRate = len(keyA) * 10**9 / (endTime - startTime)
             KeyRateList.append(keyRate)
+            BasisList.append(bases)
         else:
+            if aggregator is not None:
+                aggregator.add_failed()
+                continue
             KeyListA.append("nan")
             KeyListB.append("nan")
             KeyRateList.append("nan")
+            BasisList.append("nan")
             continue
 
+    if aggregator is not None:
+        return aggregator
+
+    if returnBases:
+        return KeyListA, KeyListB, KeyRateList, BasisList
+
     return KeyListA, KeyListB, KeyRateList
\ No newline at end of file
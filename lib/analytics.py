@@ -0,0 +1,222 @@
+"""
+Vectorised key-quality analytics over all runs at once.
+
+Keys of every run are stacked into one zero-padded 2-D array (runs x bits) with a
+validity mask, and all metrics are computed on that array in a single pass instead of
+per-run Python loops.
+"""
+
+import numpy as np
+
+
+
+def key_matrix(keys):
+    """
+    Stack a list of key lists into a zero-padded 2-D uint8 array.
+
+    Returns:
+        (matrix, lengths) where matrix has shape (runs, max_len)
+    """
+    lengths = np.fromiter((len(k) for k in keys), dtype=np.int64, count=len(keys))
+    width = int(lengths.max()) if len(keys) else 0
+    matrix = np.zeros((len(keys), width), dtype=np.uint8)
+    valid = np.arange(width) < lengths[:, None]
+    if width:
+        matrix[valid] = np.concatenate([np.asarray(k, dtype=np.uint8) for k in keys])
+    return matrix, lengths
+
+
+def wilson_interval(errors, n, z=1.96):
+    """
+    Wilson score confidence interval for an error proportion, element-wise.
+
+    Returns:
+        (low, high) arrays, NaN where n == 0
+    """
+    errors = np.asarray(errors, dtype=float)
+    n = np.asarray(n, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p = errors / n
+        denom = 1 + z**2 / n
+        centre = (p + z**2 / (2 * n)) / denom
+        half = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denom
+    return centre - half, centre + half
+
+
+def runs_test(matrix, lengths):
+    """
+    Wald-Wolfowitz runs test z-score per row of a padded bit matrix.
+    |z| > 1.96 rejects randomness of the bit sequence at the 5% level.
+    """
+    runs, width = matrix.shape
+    if width < 2:
+        return np.full(runs, np.nan)
+    valid = np.arange(width) < lengths[:, None]
+    ones = (matrix.astype(bool) & valid).sum(axis=1).astype(float)
+    zeros = lengths - ones
+    transitions = ((matrix[:, 1:] != matrix[:, :-1]) & valid[:, 1:]).sum(axis=1)
+    n = lengths.astype(float)
+    r = transitions + 1.
+    with np.errstate(invalid="ignore", divide="ignore"):
+        expected = 2 * zeros * ones / n + 1
+        variance = 2 * zeros * ones * (2 * zeros * ones - n) / (n**2 * (n - 1))
+        score = (r - expected) / np.sqrt(variance)
+    return np.where(variance > 0, score, np.nan)
+
+
+def analyse_keys(KeyListA, KeyListB, bases=None, photonCount=None, z=1.96):
+    """
+    Key-quality metrics for every completed run in one vectorised pass.
+
+    Parameters:
+        KeyListA        list of Alice's keys per run ("nan" entries mark failed runs)
+        KeyListB        list of Bob's keys per run
+        bases           list of per-run sifted basis lists (0 = Z, 1 = X), optional
+        photonCount     photons sent per run (one count, or one per run), for sifting efficiency, optional
+        z               normal quantile for the confidence intervals
+
+    Returns:
+        dict of per-run arrays (key_len, errors, qber, qber_low, qber_high, z_count,
+        x_count, z_errors, x_errors, z_qber, x_qber, bias, runs_z, sifting_eff)
+    """
+    done = [i for i, k in enumerate(KeyListA) if not isinstance(k, str)]
+    keysA = [KeyListA[i] for i in done]
+    keysB = [KeyListB[i] for i in done]
+    length = [min(len(a), len(b)) for a, b in zip(keysA, keysB)]
+    A, lengths = key_matrix([a[:l] for a, l in zip(keysA, length)])
+    B, _ = key_matrix([b[:l] for b, l in zip(keysB, length)])
+
+    valid = np.arange(A.shape[1]) < lengths[:, None]
+    err = (A != B) & valid
+    errors = err.sum(axis=1)
+
+    res = {"run_index": np.asarray(done, dtype=np.int64), "key_len": lengths, "errors": errors}
+
+    if bases is not None:
+        X, _ = key_matrix([bases[i][:l] for i, l in zip(done, length)])
+        x_mask = X.astype(bool) & valid
+        res["x_count"]  = x_mask.sum(axis=1)
+        res["z_count"]  = lengths - res["x_count"]
+        res["x_errors"] = (err & x_mask).sum(axis=1)
+        res["z_errors"] = errors - res["x_errors"]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        res["bias"] = (A.astype(bool) & valid).sum(axis=1) / lengths - 0.5
+    res["runs_z"] = runs_test(A, lengths)
+
+    return _finish(res, photonCount, z)
+
+
+def analyse_summaries(summaries, photonCount=None, z=1.96):
+    """
+    Same metrics as `analyse_keys` from compact per-run summaries (lib.stats.summarise_run),
+    for results where the raw keys were not kept. Bias and runs tests need the raw bits
+    and are not available.
+    """
+    def column(name):
+        return np.array([s[name] if s.get(name) is not None else -1 for s in summaries], dtype=np.int64)
+
+    res = {"run_index": np.arange(len(summaries)), "key_len": column("key_len"), "errors": column("errors")}
+    if summaries and all(s.get("x_count") is not None for s in summaries):
+        for name in ("z_count", "x_count", "z_errors", "x_errors"):
+            res[name] = column(name)
+    return _finish(res, photonCount, z)
+
+
+def _finish(res, photonCount, z):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        res["qber"] = res["errors"] / res["key_len"]
+        res["qber_low"], res["qber_high"] = wilson_interval(res["errors"], res["key_len"], z)
+        if "x_count" in res:
+            res["z_qber"] = res["z_errors"] / res["z_count"]
+            res["x_qber"] = res["x_errors"] / res["x_count"]
+        if photonCount is not None:
+            sent = np.asarray(photonCount, dtype=float)
+            res["sifting_eff"] = res["key_len"] / (sent[res["run_index"]] if sent.ndim else sent)
+    return res
+
+
+def pooled(analysis, z=1.96):
+    """
+    Pool a per-run analysis into overall estimates: mean per-run values plus
+    QBER and per-basis QBER with confidence intervals over all bits of all runs.
+    """
+    def mean(name):
+        v = analysis.get(name)
+        if v is None or len(v) == 0:
+            return float('nan')
+        v = v[~np.isnan(v)] if v.dtype.kind == "f" else v
+        return float(v.mean()) if len(v) else float('nan')
+
+    out = {"runs": int(len(analysis["key_len"]))}
+    for name in ("key_len", "qber", "bias", "runs_z", "sifting_eff", "z_qber", "x_qber"):
+        out[f"avg_{name}"] = mean(name)
+
+    bits, errs = int(analysis["key_len"].sum()), int(analysis["errors"].sum())
+    out["pooled_qber"] = errs / bits if bits else float('nan')
+    low, high = wilson_interval(errs, bits, z)
+    out["pooled_qber_low"], out["pooled_qber_high"] = float(low), float(high)
+
+    for basis in ("z", "x"):
+        if f"{basis}_count" not in analysis:
+            continue
+        n, e = int(analysis[f"{basis}_count"].sum()), int(analysis[f"{basis}_errors"].sum())
+        out[f"pooled_{basis}_qber"] = e / n if n else float('nan')
+        low, high = wilson_interval(e, n, z)
+        out[f"pooled_{basis}_qber_low"], out[f"pooled_{basis}_qber_high"] = float(low), float(high)
+    return out
+
+
+def pooled_from_aggregator(aggregator, photonCount=None, z=1.96):
+    """
+    Overall estimates from a summary-only lib.stats.RunAggregator (sums are mean * n).
+    A per-run `photonCount` is averaged over the runs.
+    """
+    stats = aggregator.stats
+    if photonCount is not None:
+        photonCount = float(np.mean(photonCount))
+
+    def total(name):
+        s = stats[name]
+        return int(round(s.mean * s.n)) if s.n else 0
+
+    out = {"runs": aggregator.n_runs,
+           "avg_key_len": stats["key_len"].mean if stats["key_len"].n else float('nan'),
+           "avg_qber": stats["qber"].mean if stats["qber"].n else float('nan')}
+    if photonCount and stats["key_len"].n:
+        out["avg_sifting_eff"] = stats["key_len"].mean / photonCount
+
+    for prefix, count, errors in (("", "key_len", "errors"), ("z_", "z_count", "z_errors"), ("x_", "x_count", "x_errors")):
+        n, e = total(count), total(errors)
+        out[f"pooled_{prefix}qber"] = e / n if n else float('nan')
+        low, high = wilson_interval(e, n, z)
+        out[f"pooled_{prefix}qber_low"], out[f"pooled_{prefix}qber_high"] = float(low), float(high)
+    return out
+
+
+def test_errors(testA, testB):
+    """
+    Compared bits and errors of one run's disclosed X-basis test bits, to be summed
+    over runs for `test_estimate` without keeping the bits themselves.
+
+    Returns:
+        (bits, errors)
+    """
+    m = min(len(testA), len(testB))
+    return m, int(np.count_nonzero(np.asarray(testA[:m]) != np.asarray(testB[:m])))
+
+
+def test_estimate(n, e, z=1.96):
+    """
+    Parameter estimate of biased-basis runs from their disclosed X-basis test bits.
+
+    Parameters:
+        n       test bits compared over all completed runs (see `test_errors`)
+        e       errors among them
+
+    Returns:
+        dict with test_bits and the pooled est_qber with its confidence interval
+    """
+    low, high = wilson_interval(e, n, z)
+    return {"test_bits": n, "est_qber": e / n if n else float('nan'),
+            "est_qber_low": float(low), "est_qber_high": float(high)}
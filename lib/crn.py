@@ -0,0 +1,89 @@
+"""
+Common random numbers for parameter sweeps.
+
+With independent randomness at every point of a sweep, the difference between two fibre
+lengths (or between BB84 and MDI at one length) carries the full sampling noise of both
+points. Driving run i of every point from the same inputs (Alice's and Bob's basis/bit
+strings) and the same RNG substream for everything else (netsquid measurements, noise,
+detector and tableau outcomes) correlates the points, so trends resolve with far fewer
+runs. Inputs are derived from (seed, run, role, kind) and cached, so a sweep draws them
+once per run and reuses them at every distance and for both protocols.
+"""
+import numpy as np
+
+from lib.tableau import TableauFrame
+
+
+
+ROLES = {"alice": 0, "bob": 1, "run": 2}
+KINDS = {"basis": 0, "bit": 1}
+
+
+class CommonRandomNumbers:
+    """
+    Source of per-run inputs and seeds shared by every point of a sweep.
+
+    Attributes:
+        seed        base seed of the sweep
+        cache       (run, role, n[, pZ]) -> (basis list, bit list) already drawn
+        frames      (run, role, n[, pZ]) -> encoded TableauFrame template
+        hits        number of input lookups served from the cache
+        offset      added to every run index (see `shifted`)
+    """
+    def __init__(self, seed=0):
+        self.seed   = seed
+        self.cache  = {}
+        self.frames = {}
+        self.hits   = 0
+        self.offset = 0
+
+
+    def shifted(self, offset):
+        """
+        Same streams with run i drawn as run `offset` + i, for callers simulating one
+        repetition at a time (e.g. the lib.pipeline workers); the cache starts empty.
+        """
+        crn = CommonRandomNumbers(self.seed)
+        crn.offset = self.offset + offset
+        return crn
+
+
+    def _stream(self, run, role, kind=0):
+        entropy = np.random.SeedSequence([self.seed, run + self.offset, ROLES[role], kind]).generate_state(4)
+        return np.random.RandomState(entropy)
+
+
+    def inputs(self, run, role, n, pZ=None):
+        """
+        Basis and bit lists of `n` photons for `role` ("alice" or "bob") in run `run`,
+        with Z-basis probability `pZ` (uniform bases if None).
+
+        Bases and bits come from separate substreams, so the first m entries are the
+        same for any n >= m (runs shrunk by a memory budget stay aligned).
+        """
+        key = (run, role, n) if pZ is None else (run, role, n, pZ)
+        if key in self.cache:
+            self.hits += 1
+        else:
+            stream = self._stream(run, role, KINDS["basis"])
+            bases = stream.randint(0, 2, size=n) if pZ is None else (stream.random_sample(n) >= pZ).astype(int)
+            bits = self._stream(run, role, KINDS["bit"]).randint(0, 2, size=n)
+            self.cache[key] = (bases.tolist(), bits.tolist())
+        return self.cache[key]
+
+
+    def run_seed(self, run):
+        """Seed for the numpy and netsquid streams of run `run` (see lib.functions.set_seed)."""
+        return int(np.random.SeedSequence([self.seed, run + self.offset, ROLES["run"]]).generate_state(1)[0])
+
+
+    def encoded_frame(self, run, role, n, pZ=None):
+        """
+        Copy of the noiseless tableau encoding of `role`'s photons in run `run`; the
+        encoding does not depend on distance, so it is built once per run.
+        """
+        key = (run, role, n) if pZ is None else (run, role, n, pZ)
+        if key not in self.frames:
+            bases, bits = self.inputs(run, role, n, pZ)
+            self.frames[key] = TableauFrame.bb84(bases, bits)
+        return self.frames[key].copy()
@@ -0,0 +1,108 @@
+from bisect import bisect_left
+
+import numpy as np
+
+
+
+class DetectorModel:
+    """
+    Event-sparse single-photon detector with efficiency, dark counts, dead time and
+    afterpulsing.
+
+    A frame is evaluated as one vectorised pass over per-photon arrival times: photon
+    detections and dark counts are sampled for the whole frame at once. Dead time and
+    afterpulsing are then applied by jumping from click to click: the next click is the
+    first candidate at or after the detector recovers (found by binary search over the
+    candidate times), or the afterpulse in the first gate after recovery (and after the
+    click) if one fires earlier. That costs O(clicks * log N) with clicks <= frame duration / dead time,
+    independent of the number of slots skipped while dead. With no afterpulsing and a
+    dead time shorter than the slot spacing every candidate clicks and no jumps are made.
+
+    Parameters:
+        efficiency          probability an arriving photon produces a click
+        darkCountRate       dark counts per second
+        deadTime            detector dead time after a click in ns
+        afterpulseProb      probability a click is followed by an afterpulse
+        gateWidth           detection window per time bin in ns (for dark counts)
+    """
+    def __init__(self, efficiency=1., darkCountRate=0., deadTime=0., afterpulseProb=0., gateWidth=1.):
+        if not 0 <= efficiency <= 1 or not 0 <= afterpulseProb <= 1:
+            raise ValueError("efficiency and afterpulseProb must be probabilities")
+        self.efficiency       = efficiency
+        self.dark_count_rate  = darkCountRate
+        self.dead_time        = deadTime
+        self.afterpulse_prob  = afterpulseProb
+        self.gate_width       = gateWidth
+
+
+    def dark_probability(self):
+        """Probability of a dark count within one detection gate."""
+        return -np.expm1(-self.dark_count_rate * self.gate_width * 1e-9)
+
+
+    def detect(self, arrival_times, rng=None, blockedUntil=-np.inf):
+        """
+        Evaluate the detector over one frame.
+
+        Parameters:
+            arrival_times   (N,) sorted arrival time of each photon slot in ns
+            rng             numpy RandomState / Generator (defaults to the global one)
+            blockedUntil    time (ns) the detector recovers from a click in an earlier frame
+
+        Returns:
+            (clicks, noise) boolean arrays: `clicks` marks slots with a registered click,
+            `noise` those whose click came from a dark count or afterpulse only (and so
+            carries a random outcome)
+        """
+        rng = np.random if rng is None else rng
+        times = np.asarray(arrival_times, dtype=float)
+        n = len(times)
+
+        photon = rng.random_sample(n) < self.efficiency if self.efficiency < 1 else np.ones(n, dtype=bool)
+
+        dark = np.zeros(n, dtype=bool)
+        p_dark = self.dark_probability()
+        if p_dark > 0:
+            # sample only the bins that actually see a dark count
+            k = rng.binomial(n, p_dark)
+            dark[rng.choice(n, size=k, replace=False)] = True
+
+        candidate = photon | dark
+        if blockedUntil > -np.inf:
+            candidate &= times >= blockedUntil
+        spacing = np.diff(times).min() if n > 1 else np.inf
+        if self.afterpulse_prob <= 0 and self.dead_time <= spacing:
+            return candidate, candidate & ~photon
+
+        # plain lists: the scalar binary searches below are cheaper on them than on arrays
+        cand = np.flatnonzero(candidate).tolist()
+        slot_times = times.tolist()
+        cand_times = times[cand].tolist()
+        fired = []
+        k = 0
+        i = cand[0] if cand else None
+        while i is not None:
+            fired.append(i)
+            blocked_until = slot_times[i] + self.dead_time
+            afterpulse = None
+            if self.afterpulse_prob > 0 and rng.random_sample() < self.afterpulse_prob:
+                # afterpulse fires in the first gate after the detector recovers, and
+                # never in the clicking gate itself (with no dead time it recovers at once)
+                j = max(bisect_left(slot_times, blocked_until), i + 1)
+                if j < n:
+                    afterpulse = j
+            # first candidate after this click that finds the detector recovered
+            k = max(bisect_left(cand_times, blocked_until), k + 1)
+            i = cand[k] if k < len(cand) else None
+            if afterpulse is not None and (i is None or afterpulse < i):
+                i = afterpulse
+                k -= 1
+
+        clicks = np.zeros(n, dtype=bool)
+        clicks[fired] = True
+        return clicks, clicks & ~photon
+
+
+    def max_click_rate(self):
+        """Saturation click rate in Hz imposed by the dead time."""
+        return 1e9 / self.dead_time if self.dead_time > 0 else float('inf')
@@ -0,0 +1,354 @@
+"""
+Backend equivalence harness.
+
+Runs the netsquid reference path and alternative backends (other formalisms, the
+batched tableau engine, classical fast noise, ...) over the same parameter grid, and
+tests whether their outputs are statistically indistinguishable:
+
+    sifting     sifted bits / photons                   two-proportion z-test
+    qber        errors / sifted bits                    two-proportion z-test
+    outcomes    BB84: Bob's outcome per (Alice basis, Alice bit, Bob basis)
+                MDI: relay outcome per (basis A, basis B, bit A xor bit B)
+                                                        chi-square homogeneity test
+    bsm         MDI only: relay outcome frequencies of -1 / 1 / 0
+                                                        chi-square homogeneity test
+
+All tests are closed form (normal and chi-square tail probabilities), so no scipy is
+needed. A backend passes a grid point if every p-value clears `alpha` after a
+Bonferroni correction over that point's tests. Every candidate runs on its own seed,
+independent of the reference's: a backend consuming random numbers in the same order
+as the reference would otherwise reproduce its output exactly and pass trivially.
+
+A backend is skipped at a grid point only if `unsupported` says it cannot run it;
+any other error from a run propagates.
+
+`afterpulse_check` tests the detector model on its own: the share of afterpulse-only
+clicks against its closed-form expectation, with and without dead time.
+"""
+import math
+import time
+
+import numpy as np
+
+from lib import kernels
+from lib.detector import DetectorModel
+from lib.functions import set_seed
+from lib.noise import NOISE_MODELS, make_noise
+
+
+
+# run-function overrides per backend; the reference is netsquid's ket formalism
+BACKENDS = {
+    "reference":  {"formalism": "ket"},
+    "dm":         {"formalism": "dm"},
+    "stab":       {"formalism": "stab"},
+    "gslc":       {"formalism": "gslc"},
+    "tableau":    {"formalism": "tableau", "fastNoise": True},
+    "fast-noise": {"formalism": "ket", "fastNoise": True},
+}
+
+# grid points: fibre length in km, optional noise model name and rate per km
+DEFAULT_GRID = [
+    {"fibreLen": 1},
+    {"fibreLen": 50},
+    {"fibreLen": 25, "noise": "depolar", "noiseRate": 0.01},
+    {"fibreLen": 25, "noise": "dephase", "noiseRate": 0.01},
+]
+
+
+def normal_sf(z):
+    """Upper tail probability of the standard normal distribution."""
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def chi2_sf(x, dof):
+    """
+    Upper tail probability of the chi-square distribution, i.e. the regularised
+    upper incomplete gamma function Q(dof/2, x/2).
+    """
+    if dof <= 0:
+        return float('nan')
+    if x <= 0:
+        return 1.
+    a, y = dof / 2, x / 2
+    log_prefactor = -y + a * math.log(y) - math.lgamma(a)
+    if y < a + 1:
+        # series for the lower function P
+        term = total = 1 / a
+        ap = a
+        for _ in range(1000):
+            ap += 1
+            term *= y / ap
+            total += term
+            if abs(term) < abs(total) * 1e-15:
+                break
+        return max(1 - total * math.exp(log_prefactor), 0.)
+    # continued fraction for Q (modified Lentz)
+    tiny = 1e-300
+    b = y + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return math.exp(log_prefactor) * h
+
+
+def two_proportion_test(k1, n1, k2, n2):
+    """
+    Two-sided z-test of k1/n1 against k2/n2.
+
+    Returns:
+        p-value (nan if either sample is empty)
+    """
+    if n1 == 0 or n2 == 0:
+        return float('nan')
+    p = (k1 + k2) / (n1 + n2)
+    var = p * (1 - p) * (1 / n1 + 1 / n2)
+    diff = abs(k1 / n1 - k2 / n2)
+    if var == 0:
+        return 1. if diff == 0 else 0.
+    return 2 * normal_sf(diff / math.sqrt(var))
+
+
+def homogeneity_test(counts1, counts2):
+    """
+    Chi-square test that two count vectors come from the same categorical distribution.
+    Categories empty in both samples are dropped.
+
+    Returns:
+        (statistic, p-value)
+    """
+    table = np.array([counts1, counts2], dtype=float)
+    table = table[:, table.sum(axis=0) > 0]
+    if table.shape[1] < 2 or (table.sum(axis=1) == 0).any():
+        return 0., float('nan')
+    expected = table.sum(axis=1, keepdims=True) * table.sum(axis=0) / table.sum()
+    stat = float(((table - expected) ** 2 / expected).sum())
+    return stat, chi2_sf(stat, table.shape[1] - 1)
+
+
+class EquivalenceCollector:
+    """
+    runHook collecting the statistics the harness tests from every finished run.
+
+    Attributes:
+        protocol    "bb84" or "mdi"
+        photons     photons sent over all completed runs
+        sifted      sifted key bits over all completed runs
+        errors      key bits where Alice and Bob disagree
+        outcomes    outcome counts per basis/bit configuration (see module docstring)
+        bsm         MDI relay outcome counts ordered -1, 1, 0
+        failed      runs that did not complete
+    """
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.photons  = 0
+        self.sifted   = 0
+        self.errors   = 0
+        self.outcomes = np.zeros(16 if protocol == "bb84" else 24, dtype=np.int64)
+        self.bsm      = np.zeros(3, dtype=np.int64)
+        self.failed   = 0
+
+
+    def __call__(self, protocols):
+        alice, bob = protocols["alice"], protocols["bob"]
+        if self.protocol == "mdi" and (alice.end_time is None or bob.end_time is None):
+            self.failed += 1
+            return
+
+        self.photons += alice.photon_count
+        self.sifted  += len(alice.key)
+        m = min(len(alice.key), len(bob.key))
+        self.errors  += kernels.count_errors(kernels.as_array(alice.key[:m]), kernels.as_array(bob.key[:m]))
+
+        if self.protocol == "bb84":
+            n = len(bob.meas_results)
+            valid = np.asarray(bob.announced_bases[:n]) != -1
+            idx = (8 * np.asarray(alice.basis_list[:n]) + 4 * np.asarray(alice.bit_list[:n])
+                   + 2 * np.asarray(bob.basis_list[:n]) + np.asarray(bob.meas_results))
+            self.outcomes += np.bincount(idx[valid], minlength=16)
+        else:
+            meas = np.asarray(protocols["charlie"].meas, dtype=np.int64)
+            n = len(meas)
+            parity = np.asarray(alice.bit_list[:n]) ^ np.asarray(bob.bit_list[:n])
+            idx = ((2 * np.asarray(alice.basis_list[:n]) + np.asarray(bob.basis_list[:n])) * 2 + parity) * 3
+            self.outcomes += np.bincount(idx + meas + 1, minlength=24)
+            self.bsm += np.bincount(np.where(meas == 0, 2, (meas + 1) // 2), minlength=3)
+
+
+def backend_kwargs(backend):
+    """Run-function overrides of a backend name in BACKENDS or a dict of overrides."""
+    return dict(BACKENDS[backend]) if isinstance(backend, str) else dict(backend)
+
+
+def unsupported(backend, point):
+    """
+    Reason `backend` cannot run grid point `point`, or None if it can.
+    """
+    kwargs = backend_kwargs(backend)
+    if kwargs.get("formalism") == "tableau" and point.get("noise") and not kwargs.get("fastNoise"):
+        return "per-qubit noise needs a netsquid formalism (use fastNoise)"
+    return None
+
+
+def run_backend(protocol, backend, point, runtimes=20, photonCount=512, seed=1234):
+    """
+    Run one backend at one grid point from a fixed seed.
+
+    Returns:
+        dict with the collected statistics and wall time, or with "skipped" set to the
+        reason if the backend does not support the grid point (see `unsupported`)
+    """
+    if protocol == "bb84":
+        from BB84.BB84_run import run_BB84_sims as run
+    else:
+        from MDI.mdiRun import run_mdi_sims as run
+
+    reason = unsupported(backend, point)
+    if reason is not None:
+        return {"skipped": reason}
+
+    kwargs = backend_kwargs(backend)
+    collector = EquivalenceCollector(protocol)
+    noise = make_noise(point.get("noise"), point.get("noiseRate", 0.01))
+
+    set_seed(seed)
+    start = time.perf_counter()
+    run(runtimes=runtimes, fibreLen=point.get("fibreLen", 1), photonCount=photonCount,
+        noise=noise, summaryOnly=True, runHook=collector, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    return {"seconds": elapsed, "photons": collector.photons, "sifted": collector.sifted,
+            "errors": collector.errors, "outcomes": collector.outcomes, "bsm": collector.bsm,
+            "failed": collector.failed}
+
+
+def compare(ref, cand, alpha=0.01):
+    """
+    Test a candidate backend's statistics against the reference's.
+
+    Returns:
+        dict of p-values per test, the smallest one, speed-up and pass/fail
+    """
+    pvals = {
+        "sifting":  two_proportion_test(ref["sifted"], ref["photons"], cand["sifted"], cand["photons"]),
+        "qber":     two_proportion_test(ref["errors"], ref["sifted"], cand["errors"], cand["sifted"]),
+        "outcomes": homogeneity_test(ref["outcomes"], cand["outcomes"])[1],
+    }
+    if ref["bsm"].any() or cand["bsm"].any():
+        pvals["bsm"] = homogeneity_test(ref["bsm"], cand["bsm"])[1]
+
+    tested = [p for p in pvals.values() if not math.isnan(p)]
+    min_p = min(tested) if tested else float('nan')
+    res = {f"p_{name}": p for name, p in pvals.items()}
+    res.update({
+        "min_p":   min_p,
+        "qber_ref":  ref["errors"] / ref["sifted"] if ref["sifted"] else float('nan'),
+        "qber_cand": cand["errors"] / cand["sifted"] if cand["sifted"] else float('nan'),
+        "speedup": ref["seconds"] / cand["seconds"] if cand["seconds"] else float('nan'),
+        "passed":  bool(tested) and min_p >= alpha / len(tested),
+    })
+    return res
+
+
+def equivalence_harness(protocol="bb84", backends=("stab", "tableau", "fast-noise"), reference="reference",
+                        grid=None, runtimes=20, photonCount=512, seed=1234, alpha=0.01):
+    """
+    Compare every backend against the reference at every grid point.
+
+    Parameters:
+        protocol        "bb84" or "mdi"
+        backends        names in BACKENDS (or dicts of run-function overrides)
+        reference       reference backend
+        grid            list of grid point dicts (DEFAULT_GRID if None)
+        runtimes        runs per backend and grid point
+        photonCount     photons per run
+        seed            base seed; the reference runs grid point i on seed + i, every
+                        candidate on an independent seed derived from (seed, i, backend)
+        alpha           family-wise significance level per grid point and backend
+
+    Returns:
+        list of records, one per grid point and backend; `passed` is None for skipped ones
+    """
+    grid = DEFAULT_GRID if grid is None else grid
+    records = []
+    for i, point in enumerate(grid):
+        ref = run_backend(protocol, reference, point, runtimes, photonCount, seed + i)
+        if "skipped" in ref:
+            raise ValueError(f"reference backend cannot run grid point {point}: {ref['skipped']}")
+        for k, backend in enumerate(backends):
+            candSeed = int(np.random.SeedSequence([seed, i, k + 1]).generate_state(1)[0])
+            rec = {"protocol": protocol.upper(), "backend": str(backend),
+                   "fibre_km": point.get("fibreLen", 1), "noise": point.get("noise"),
+                   "noise_rate": point.get("noiseRate") if point.get("noise") else None,
+                   "runtimes": runtimes, "photons": photonCount, "seed": seed + i, "cand_seed": candSeed}
+            cand = run_backend(protocol, backend, point, runtimes, photonCount, candSeed)
+            if "skipped" in cand:
+                rec.update(skipped=cand["skipped"], passed=None)
+            else:
+                rec.update(compare(ref, cand, alpha))
+            records.append(rec)
+    return records
+
+
+def fast_noise_check(protocol="bb84", models=None, fibreLen=25, noiseRate=0.01, runtimes=20, photonCount=512,
+                     seed=1234, alpha=0.01):
+    """
+    Test the classical fast noise path against per-qubit noise: every noise model is one
+    grid point, run with fastNoise=False (the reference) and fastNoise=True, and compared
+    on sifting, QBER and outcome frequencies like any other backend.
+
+    Parameters:
+        models      noise model names (all of lib.noise.NOISE_MODELS if None)
+        fibreLen    fibre length in km
+        noiseRate   noise strength per km
+
+    Returns:
+        list of records as from `equivalence_harness`, one per noise model
+    """
+    grid = [{"fibreLen": fibreLen, "noise": name, "noiseRate": noiseRate} for name in (models or NOISE_MODELS)]
+    return equivalence_harness(protocol, backends=("fast-noise",), grid=grid, runtimes=runtimes,
+                               photonCount=photonCount, seed=seed, alpha=alpha)
+
+
+def afterpulse_check(deadTimes=(0., 50., 250.), afterpulseProb=0.2, efficiency=0.5, slots=20000,
+                     slotSpacing=100., seed=1234, alpha=0.01):
+    """
+    Test DetectorModel afterpulsing against its expected rate. Without dark counts a
+    click is afterpulse-only noise if the previous click afterpulsed and no photon was
+    detected in the gate it fell in, so a fraction afterpulseProb * (1 - efficiency) of
+    all clicks should be noise, whatever the dead time (including none).
+
+    Parameters:
+        deadTimes       dead times in ns, one check each
+        slots           photon slots per check, `slotSpacing` ns apart
+
+    Returns:
+        list of records with click and noise counts, the expected and observed noise
+        fraction, the two-sided p-value and `passed`
+    """
+    expected = afterpulseProb * (1 - efficiency)
+    times = np.arange(slots) * slotSpacing
+    records = []
+    for i, deadTime in enumerate(deadTimes):
+        model = DetectorModel(efficiency=efficiency, deadTime=deadTime, afterpulseProb=afterpulseProb)
+        clicks, noise = model.detect(times, np.random.RandomState(seed + i))
+        n, k = int(clicks.sum()), int(noise.sum())
+        sd = math.sqrt(n * expected * (1 - expected))
+        p = 2 * normal_sf(abs(k - n * expected) / sd) if sd > 0 else float(k == n * expected)
+        records.append({"dead_time_ns": deadTime, "afterpulse_prob": afterpulseProb, "efficiency": efficiency,
+                        "clicks": n, "noise_clicks": k, "expected_fraction": expected,
+                        "observed_fraction": k / n if n else float('nan'), "p": p,
+                        "passed": (k > 0 or expected == 0) and p >= alpha / len(deadTimes)})
+    return records
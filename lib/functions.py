@@ -1,9 +1,15 @@
+import functools
+
 import numpy as np
+import netsquid as ns
 
 from netsquid.components import QSource
 from netsquid.components.qsource import SourceStatus
 from netsquid.components.models import DelayModel
 
+from lib import kernels
+from lib.noise import CompositeErrorModel
+
 
 
 class HybridDelayModel(DelayModel):
@@ -24,8 +30,129 @@ class HybridDelayModel(DelayModel):
         return delay
     
 
-def rng_bin_lst(n):
-    return np.random.choice([0,1], size=n).tolist()
+def quantum_channel_models(qSpeed, *errorModels):
+    """
+    Model dict for a quantum channel: hybrid delay plus any non-None error models
+    (e.g. fibre noise) applied in the given order.
+    """
+    models = {"delay_model": HybridDelayModel(SoL_fraction=qSpeed, stddev=0.05)}
+    errorModels = [m for m in errorModels if m is not None]
+    if len(errorModels) == 1:
+        models["quantum_noise_model"] = errorModels[0]
+    elif errorModels:
+        models["quantum_noise_model"] = CompositeErrorModel(errorModels)
+    return models
+
+
+FORMALISMS = {
+    "ket":     "KET",
+    "dm":      "DM",
+    "stab":    "STAB",
+    "gslc":    "GSLC",
+    "tableau": "STAB",   # photons still flow as (untouched) netsquid qubits
+}
+
+
+def set_formalism(formalism):
+    """
+    Select the quantum state formalism for the following runs. The setting is global in
+    netsquid; run functions wrapped in `restore_formalism` put the previous one back.
+
+    Parameters:
+        formalism   one of FORMALISMS, or None to leave netsquid's current setting
+
+    Returns:
+        True if protocols should use the batched lib.tableau engine
+    """
+    if formalism is None:
+        return False
+    try:
+        name = FORMALISMS[formalism]
+    except KeyError:
+        raise ValueError(f"unknown formalism '{formalism}', expected one of {sorted(FORMALISMS)}")
+    ns.set_qstate_formalism(getattr(ns.QFormalism, name))
+    return formalism == "tableau"
+
+
+def restore_formalism(run):
+    """
+    Decorator for run functions: netsquid's formalism before the call is restored when the
+    run returns or raises, so a formalism chosen for one run does not leak into the next.
+    """
+    @functools.wraps(run)
+    def wrapper(*args, **kwargs):
+        previous = ns.get_qstate_formalism()
+        try:
+            return run(*args, **kwargs)
+        finally:
+            ns.set_qstate_formalism(previous)
+    return wrapper
+
+
+def set_seed(seed):
+    """
+    Seed both random streams the simulations draw from: numpy's global generator
+    (basis/bit choices, fast noise, tableau and detector outcomes) and netsquid's own
+    (qubit measurements and noise). None reseeds both from system entropy.
+    """
+    np.random.seed(seed)
+    ns.set_random_state(seed=seed)
+
+
+def rng_bin_lst(n, p=0.5):
+    """
+    `n` random bits from numpy's global (seeded) generator, each 1 with probability `p`.
+    """
+    if p == 0.5:
+        # unbiased draw kept as before so seeded runs reproduce earlier results
+        return np.random.choice([0,1], size=n).tolist()
+    return (np.random.random_sample(n) < p).astype(int).tolist()
+
+
+def rng_basis_lst(n, pZ=None):
+    """
+    Basis choices (0 = Z-basis, 1 = X-basis) for `n` photons: uniform for symmetric BB84
+    (pZ None), Z-basis with probability `pZ` for efficient BB84.
+    """
+    return rng_bin_lst(n) if pZ is None else rng_bin_lst(n, 1 - pZ)
+
+
+def split_test_bits(mask, key, bases):
+    """
+    Split a sifted key by basis for biased-basis BB84: Z-basis bits form the key, X-basis
+    bits are disclosed for parameter estimation.
+
+    Parameters:
+        mask    photon index of every sifted bit
+        key     sifted bits
+        bases   basis of every photon (0 = Z-basis, 1 = X-basis)
+
+    Returns:
+        (key mask, key bits, test mask, test bits) as lists
+    """
+    mask = np.asarray(mask, dtype=np.int64)
+    key = np.asarray(key)
+    x = np.asarray(bases)[mask] == 1 if len(mask) else np.zeros(0, dtype=bool)
+    return mask[~x].tolist(), key[~x].tolist(), mask[x].tolist(), key[x].tolist()
+
+
+def sift_frame(ownBases, otherBases, bits, pZ=None):
+    """
+    Sift a frame: keep the bits where both sides announced the same basis and, in
+    efficient BB84 (pZ given), split the X-basis bits off as test bits.
+
+    Parameters:
+        ownBases    bases announced by this side (-1 for a slot without a click)
+        otherBases  bases announced by the other side
+        bits        this side's bit per photon
+
+    Returns:
+        (mask, key, test mask, test key) as lists, indices relative to the frame
+    """
+    mask, key = kernels.sift(kernels.as_array(ownBases), kernels.as_array(otherBases), kernels.as_array(bits))
+    if pZ is None:
+        return mask.tolist(), key.tolist(), [], []
+    return split_test_bits(mask, key, ownBases)
 
 
 class SinglePhotonSource(QSource):
@@ -0,0 +1,143 @@
+"""
+Integer kernels for the classical post-processing steps.
+
+Every kernel exists as a Numba-compiled loop and as a vectorised NumPy fallback with the
+same signature; the module-level names are bound to one of them at import time. Numba is
+used when it is installed unless the environment variable QKD_KERNELS is set to "numpy"
+(or "numba" to insist on it). All kernels take and return numpy arrays, so callers holding
+lists convert at the boundary. Call them as `kernels.sift(...)` so that a later
+select_backend() takes effect.
+
+    sift(bases_a, bases_b, values)      -> (indices where bases agree, values there)
+    mismatch(bases_a, bases_b)          -> indices where bases differ
+    mdi_flip(key, bases, meas, keep)    -> MDI key with anticorrelated outcomes flipped
+    compress(values, keep)              -> (values where keep, their indices)
+    count_errors(a, b)                  -> number of positions where a and b differ
+"""
+import os
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+
+# ----------------------------------------------------------------------- numpy fallbacks
+
+def _sift_numpy(bases_a, bases_b, values):
+    mask = np.flatnonzero(bases_a == bases_b)
+    return mask, values[mask]
+
+
+def _mismatch_numpy(bases_a, bases_b):
+    return np.flatnonzero(bases_a != bases_b)
+
+
+def _mdi_flip_numpy(key, bases, meas, keep):
+    # Z basis: every heralded pair is anticorrelated; X basis: only psi minus (-1)
+    flip = keep & (meas != 0) & ((bases == 0) | (meas == -1))
+    return key ^ flip.astype(key.dtype)
+
+
+def _compress_numpy(values, keep):
+    mask = np.flatnonzero(keep)
+    return values[mask], mask
+
+
+def _count_errors_numpy(a, b):
+    return int(np.count_nonzero(a != b))
+
+
+# -------------------------------------------------------------------- loop implementations
+
+def _sift_loop(bases_a, bases_b, values):
+    n = len(values)
+    mask = np.empty(n, dtype=np.int64)
+    out = np.empty(n, dtype=values.dtype)
+    k = 0
+    for i in range(n):
+        if bases_a[i] == bases_b[i]:
+            mask[k] = i
+            out[k] = values[i]
+            k += 1
+    return mask[:k], out[:k]
+
+
+def _mismatch_loop(bases_a, bases_b):
+    n = len(bases_a)
+    out = np.empty(n, dtype=np.int64)
+    k = 0
+    for i in range(n):
+        if bases_a[i] != bases_b[i]:
+            out[k] = i
+            k += 1
+    return out[:k]
+
+
+def _mdi_flip_loop(key, bases, meas, keep):
+    out = key.copy()
+    for i in range(len(key)):
+        if keep[i] and meas[i] != 0 and (bases[i] == 0 or meas[i] == -1):
+            out[i] ^= 1
+    return out
+
+
+def _compress_loop(values, keep):
+    n = len(values)
+    mask = np.empty(n, dtype=np.int64)
+    out = np.empty(n, dtype=values.dtype)
+    k = 0
+    for i in range(n):
+        if keep[i]:
+            mask[k] = i
+            out[k] = values[i]
+            k += 1
+    return out[:k], mask[:k]
+
+
+def _count_errors_loop(a, b):
+    errors = 0
+    for i in range(len(a)):
+        if a[i] != b[i]:
+            errors += 1
+    return errors
+
+
+KERNEL_NAMES = ("sift", "mismatch", "mdi_flip", "compress", "count_errors")
+
+KERNELS = {
+    "numpy": {name: globals()[f"_{name}_numpy"] for name in KERNEL_NAMES},
+}
+if numba is not None:
+    KERNELS["numba"] = {name: numba.njit(cache=True)(globals()[f"_{name}_loop"]) for name in KERNEL_NAMES}
+
+
+def select_backend(name=None):
+    """
+    Bind the module-level kernels to a backend.
+
+    Parameters:
+        name    "numba", "numpy" or None for the best available
+
+    Returns:
+        name of the selected backend
+    """
+    global BACKEND, sift, mismatch, mdi_flip, compress, count_errors
+    if name is None:
+        name = "numba" if "numba" in KERNELS else "numpy"
+    if name not in KERNELS:
+        raise ValueError(f"kernel backend '{name}' is not available, expected one of {sorted(KERNELS)}")
+    BACKEND = name
+    sift, mismatch, mdi_flip, compress, count_errors = (KERNELS[name][k] for k in KERNEL_NAMES)
+    return name
+
+
+select_backend(os.environ.get("QKD_KERNELS") or None)
+
+
+def as_array(values, dtype=np.int8):
+    """Protocol-side list (or array) of small integers as a contiguous array."""
+    return np.ascontiguousarray(values, dtype=dtype)
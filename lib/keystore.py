@@ -0,0 +1,350 @@
+"""
+Append-only key store with an ETSI GS QKD 014 style key delivery API.
+
+Each end of a link keeps its own store directory:
+
+    links.json      link name -> link number
+    keys.bin        key blocks, bit-packed and byte-aligned, appended in order
+    index.bin       one record per block: key_ID (16-byte UUID), link, bits, byte offset
+    consumed.bin    uint64 index row of every block handed out, appended on delivery
+
+Nothing is ever rewritten: delivering a key only appends its row to consumed.bin. The
+index is loaded into a dict on open, so lookups by key_ID are O(1), and keys.bin is
+memory-mapped, so delivered keys are memoryview slices of the map rather than copies.
+
+`add_key_pair` splits Alice's and Bob's keys of a run into blocks stored under the same
+key_IDs at both ends; `KeyStoreWriter` does so for every finished run when passed as the
+`runHook` of run_BB84_sims / run_mdi_sims. Consumers then follow the ETSI flow: the master
+SAE takes keys with `get_key` at its end and passes their key_IDs to the slave SAE, which
+fetches the matching keys with `get_key_with_id` at the other end. `make_server` serves a
+store over HTTP (GET/POST /api/v1/keys/<SAE_ID>/{status,enc_keys,dec_keys}, SAE_ID being
+the link name), with keys base64-encoded in the JSON responses as in the standard.
+"""
+import base64
+import json
+import mmap
+import os
+import threading
+import uuid
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+
+
+INDEX_DTYPE = np.dtype([("key_id", "V16"), ("link", "<u4"), ("bits", "<u4"), ("offset", "<u8")])
+
+
+class KeyStore:
+    """
+    Append-only, memory-mapped key store of one end of one or more links.
+
+    Attributes:
+        directory   store directory
+        links       link name -> link number
+        n_keys      key blocks stored (delivered or not)
+        n_bytes     size of keys.bin
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        links_path = os.path.join(directory, "links.json")
+        self.links = {}
+        if os.path.exists(links_path):
+            with open(links_path) as f:
+                self.links = json.load(f)
+
+        index = self._load("index.bin", INDEX_DTYPE)
+        consumed = self._load("consumed.bin", np.dtype("<u8"))
+
+        # index rows (key_ID, link, bits, offset), key_ID -> row, and per link its rows in
+        # storage order with the position get_key resumes from
+        self._rows     = []
+        self._by_id    = {}
+        self._pending  = {link: [] for link in self.links.values()}
+        self._next     = {link: 0 for link in self.links.values()}
+        self._consumed = set(consumed.tolist())
+        for row, (key_id, link, bits, offset) in enumerate(index.tolist()):
+            self._rows.append((key_id, link, bits, offset))
+            self._by_id[key_id] = row
+            self._pending.setdefault(link, []).append(row)
+        self.n_keys  = len(self._rows)
+        self.n_bytes = os.path.getsize(os.path.join(directory, "keys.bin")) \
+            if os.path.exists(os.path.join(directory, "keys.bin")) else 0
+
+        self._data     = open(os.path.join(directory, "keys.bin"), "ab")
+        self._index    = open(os.path.join(directory, "index.bin"), "ab")
+        self._log      = open(os.path.join(directory, "consumed.bin"), "ab")
+        self._map      = None
+        self._map_size = 0
+        self._lock     = threading.RLock()
+
+
+    def _load(self, name, dtype):
+        path = os.path.join(self.directory, name)
+        return np.fromfile(path, dtype=dtype) if os.path.exists(path) else np.zeros(0, dtype=dtype)
+
+
+    def _link(self, link, create=False):
+        if link not in self.links:
+            if not create:
+                raise LookupError(f"no keys for link '{link}'")
+            self.links[link] = len(self.links)
+            self._pending[self.links[link]] = []
+            self._next[self.links[link]] = 0
+            with open(os.path.join(self.directory, "links.json"), "w") as f:
+                json.dump(self.links, f, indent=2)
+        return self.links[link]
+
+
+    def append(self, link, blocks, keyIds=None):
+        """
+        Append key blocks (sequences of 0/1) to `link`, one write per file.
+
+        Parameters:
+            blocks      list of key blocks
+            keyIds      UUID strings to store them under (default: fresh UUIDs)
+
+        Returns:
+            list of key_ID strings
+        """
+        with self._lock:
+            link_no = self._link(link, create=True)
+            ids = [uuid.uuid4() for _ in blocks] if keyIds is None else [uuid.UUID(k) for k in keyIds]
+            records = np.zeros(len(blocks), dtype=INDEX_DTYPE)
+            chunks = []
+            offset = self.n_bytes
+            for i, (block, key_id) in enumerate(zip(blocks, ids)):
+                packed = np.packbits(np.asarray(block, dtype=np.uint8))
+                records[i] = (key_id.bytes, link_no, len(block), offset)
+                chunks.append(packed.tobytes())
+                offset += len(packed)
+
+            self._data.write(b"".join(chunks))
+            self._index.write(records.tobytes())
+            for row, rec in enumerate(records.tolist(), start=self.n_keys):
+                self._rows.append(rec)
+                self._by_id[rec[0]] = row
+                self._pending[link_no].append(row)
+            self.n_keys  += len(blocks)
+            self.n_bytes  = offset
+            return [str(k) for k in ids]
+
+
+    def flush(self):
+        with self._lock:
+            for f in (self._data, self._index, self._log):
+                f.flush()
+
+
+    def _view(self, row):
+        """Bit-packed bytes of index row `row` as a memoryview of keys.bin (no copy)."""
+        _, _, bits, offset = self._rows[row]
+        end = offset + (bits + 7) // 8
+        if end > self._map_size:
+            # keys were appended since the file was mapped: map it again (views of the
+            # old map stay valid for as long as they are referenced)
+            self._data.flush()
+            with open(os.path.join(self.directory, "keys.bin"), "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._map_size = self.n_bytes
+        return memoryview(self._map)[offset:end]
+
+
+    def _deliver(self, rows):
+        self._consumed.update(rows)
+        self._log.write(np.asarray(rows, dtype="<u8").tobytes())
+        return [(str(uuid.UUID(bytes=self._rows[r][0])), self._view(r)) for r in rows]
+
+
+    def available(self, link):
+        """Number of undelivered keys of `link`."""
+        with self._lock:
+            link_no = self._link(link)
+            return sum(1 for row in self._pending[link_no][self._next[link_no]:] if row not in self._consumed)
+
+
+    def get_key(self, link, number=1, size=None):
+        """
+        Deliver the next `number` undelivered keys of `link` (ETSI "Get key").
+
+        Parameters:
+            size        required key size in bits (None accepts the stored block size)
+
+        Returns:
+            list of (key_ID, memoryview of the bit-packed key) pairs
+        """
+        with self._lock:
+            link_no = self._link(link)
+            pending, start = self._pending[link_no], self._next[link_no]
+            rows = []
+            i = start
+            while len(rows) < number and i < len(pending):
+                if pending[i] not in self._consumed:
+                    rows.append(pending[i])
+                i += 1
+            if len(rows) < number:
+                raise LookupError(f"only {len(rows)} keys available for link '{link}', {number} requested")
+            if size is not None and any(self._rows[r][2] != size for r in rows):
+                raise ValueError(f"keys of link '{link}' are {self._rows[rows[0]][2]} bits, {size} requested")
+            self._next[link_no] = i
+            return self._deliver(rows)
+
+
+    def get_key_with_id(self, link, keyIds):
+        """
+        Deliver the keys stored under the given key_IDs (ETSI "Get key with key IDs").
+
+        Returns:
+            list of (key_ID, memoryview of the bit-packed key) pairs, in request order
+        """
+        with self._lock:
+            link_no = self._link(link)
+            rows = []
+            for key_id in keyIds:
+                row = self._by_id.get(uuid.UUID(key_id).bytes)
+                if row is None or self._rows[row][1] != link_no:
+                    raise LookupError(f"no key {key_id} for link '{link}'")
+                if row in self._consumed:
+                    raise LookupError(f"key {key_id} has already been delivered")
+                rows.append(row)
+            return self._deliver(rows)
+
+
+    def status(self, link):
+        """ETSI "Get status" fields for `link`."""
+        with self._lock:
+            link_no = self._link(link)
+            sizes = {self._rows[r][2] for r in self._pending[link_no]}
+            return {"link": link,
+                    "key_size": min(sizes) if sizes else None,
+                    "stored_key_count": self.available(link),
+                    "max_key_count": None,
+                    "max_key_per_request": None,
+                    "max_key_size": max(sizes) if sizes else None,
+                    "min_key_size": min(sizes) if sizes else None}
+
+
+    def close(self):
+        with self._lock:
+            for f in (self._data, self._index, self._log):
+                f.close()
+            self._map = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def unpack_key(view, bits=None):
+    """Bits of a delivered key as an int8 array (copies; `bits` trims byte padding)."""
+    out = np.unpackbits(np.frombuffer(view, dtype=np.uint8)).astype(np.int8)
+    return out if bits is None else out[:bits]
+
+
+def add_key_pair(storeA, storeB, link, keyA, keyB, blockBits=256):
+    """
+    Split a run's keys into `blockBits`-bit blocks and store them at both ends under
+    shared key_IDs. A trailing partial block is dropped.
+
+    Returns:
+        list of key_ID strings
+    """
+    n = (min(len(keyA), len(keyB)) // blockBits) * blockBits
+    if n == 0:
+        return []
+    blocksA = np.asarray(keyA[:n], dtype=np.uint8).reshape(-1, blockBits)
+    blocksB = np.asarray(keyB[:n], dtype=np.uint8).reshape(-1, blockBits)
+    ids = storeA.append(link, blocksA)
+    storeB.append(link, blocksB, keyIds=ids)
+    return ids
+
+
+class KeyStoreWriter:
+    """
+    runHook storing the keys of every completed run in Alice's and Bob's key stores.
+
+    Attributes:
+        store_a, store_b    KeyStore of each end
+        link                link name the keys are stored under
+        block_bits          key block size in bits
+        n_keys              key blocks stored through this writer
+    """
+    def __init__(self, storeA, storeB, link, blockBits=256):
+        self.store_a    = storeA
+        self.store_b    = storeB
+        self.link       = link
+        self.block_bits = blockBits
+        self.n_keys     = 0
+
+
+    def __call__(self, protocols):
+        alice, bob = protocols["alice"], protocols["bob"]
+        # MDI end nodes both record an end time; BB84 only Bob does
+        if bob.end_time is None or getattr(alice, "end_time", 0) is None:
+            return
+        self.n_keys += len(add_key_pair(self.store_a, self.store_b, self.link, alice.key, bob.key, self.block_bits))
+
+
+def _key_container(keys):
+    return {"keys": [{"key_ID": key_id, "key": base64.b64encode(view).decode("ascii")} for key_id, view in keys]}
+
+
+def make_server(store, host="127.0.0.1", port=0):
+    """
+    HTTP server delivering keys of `store` with ETSI GS QKD 014 style endpoints:
+
+        GET/POST /api/v1/keys/<SAE_ID>/status
+        GET/POST /api/v1/keys/<SAE_ID>/enc_keys   ?number=N&size=BITS  or {"number", "size"}
+        GET/POST /api/v1/keys/<SAE_ID>/dec_keys   ?key_ID=ID           or {"key_IDs": [{"key_ID"}]}
+
+    where SAE_ID is the link name. Requests are handled on threads; call serve_forever()
+    on the returned server (its bound port is server.server_address[1]).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _handle(self, params):
+            parts = urlparse(self.path).path.strip("/").split("/")
+            if len(parts) != 5 or parts[:3] != ["api", "v1", "keys"]:
+                return self._reply(404, {"message": f"unknown path {self.path}"})
+            link, action = parts[3], parts[4]
+            try:
+                if action == "status":
+                    return self._reply(200, store.status(link))
+                if action == "enc_keys":
+                    size = params.get("size")
+                    keys = store.get_key(link, int(params.get("number", 1)), None if size is None else int(size))
+                    return self._reply(200, _key_container(keys))
+                if action == "dec_keys":
+                    ids = params.get("key_IDs")
+                    ids = [k["key_ID"] for k in ids] if ids is not None else [params["key_ID"]]
+                    return self._reply(200, _key_container(store.get_key_with_id(link, ids)))
+                return self._reply(404, {"message": f"unknown method {action}"})
+            except (LookupError, ValueError) as e:
+                return self._reply(400, {"message": str(e)})
+
+        def do_GET(self):
+            self._handle({k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self._handle(json.loads(self.rfile.read(length) or b"{}"))
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
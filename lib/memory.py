@@ -0,0 +1,260 @@
+import resource
+import sys
+import tracemalloc
+from collections import deque
+
+import numpy as np
+
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """Raised when a run is predicted to exceed the configured memory budget."""
+
+
+def deep_sizeof(obj, seen=None):
+    """
+    Approximate deep size in bytes of lists/tuples/dicts of plain values and numpy arrays.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) if obj.base is None else obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_sizeof(v, seen) for v in obj)
+    return size
+
+
+def object_sizeof(obj, seen=None, depth=3):
+    """
+    Approximate deep size in bytes of a photon frame's objects (netsquid qubits, their
+    shared quantum states, a TableauFrame): the object, the arrays and containers it holds
+    and, up to `depth` levels, the objects it refers to through its attributes.
+    """
+    seen = set() if seen is None else seen
+    if obj is None or id(obj) in seen:
+        return 0
+    if isinstance(obj, (np.ndarray, int, float, str, bytes, bool)):
+        return deep_sizeof(obj, seen)
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return size + sum(object_sizeof(v, seen, depth) for v in obj.values())
+    if isinstance(obj, (list, tuple, set)):
+        return size + sum(object_sizeof(v, seen, depth) for v in obj)
+    if depth > 0:
+        size += sum(object_sizeof(v, seen, depth - 1) for v in getattr(obj, "__dict__", {}).values())
+    return size
+
+
+def frame_sizeof(frame):
+    """
+    Bytes held by one photon frame: a netsquid Message (its qubits and metadata, e.g. a
+    batched TableauFrame) or a bare list of qubits.
+    """
+    seen = set()
+    items = getattr(frame, "items", frame)
+    return object_sizeof(items, seen) + object_sizeof(getattr(frame, "meta", None), seen)
+
+
+def current_rss():
+    """Current resident set size in bytes (None where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def peak_rss():
+    """Peak resident set size of the process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# protocol attributes attributed to each memory holder, sampled once the run is over
+HOLDERS = {
+    "basis_bit":   ("basis_list", "bit_list", "meas_results", "meas", "mask"),
+    "bits_tuples": ("bits",),
+    "keys":        ("key",),
+}
+
+# photon frames are gone by the end of a run, so they are sampled while in flight (see
+# MemoryMonitor.frame_sent / frame_received): qubit_lists is the largest frame a protocol
+# held, channel_queues the most bytes of frames sent but not yet received at once
+FRAME_HOLDERS = ("qubit_lists", "channel_queues")
+
+
+# conservative prior used to plan the first run before anything has been measured
+DEFAULT_BYTES_PER_PHOTON = 4096
+
+
+class MemoryMonitor:
+    """
+    Optional tracemalloc/RSS sampling around each repetition of a run function.
+
+    Attributes:
+        budget              bytes a single run may use (None for no budget)
+        on_exceed           "abort" to raise MemoryBudgetExceeded, "shrink" to reduce the frame size
+        records             per-run dicts: run, photons, peak_bytes, bytes_per_photon, rss_bytes, holders
+                            and frame_bytes_per_photon (in-flight frame bytes per photon)
+        bytes_per_photon    fitted traced bytes per photon, used to plan runs
+        overhead_bytes      fitted traced bytes per run independent of the photon count
+        retained_keys       cumulative bytes of key lists kept by the caller across runs
+    """
+    def __init__(self, budget=None, on_exceed="abort", bytesPerPhoton=None):
+        if on_exceed not in ("abort", "shrink"):
+            raise ValueError(f"on_exceed must be 'abort' or 'shrink', got '{on_exceed}'")
+        self.budget           = budget
+        self.on_exceed        = on_exceed
+        self.records          = []
+        self.bytes_per_photon = bytesPerPhoton
+        self.overhead_bytes   = 0.
+        self.retained_keys    = 0
+        self._started_tracing = False
+        self._baseline        = 0
+        self._photons         = 0
+        self._requested       = 0
+        self._frames          = dict.fromkeys(FRAME_HOLDERS, 0)
+        self._in_flight       = deque()
+
+
+    def plan(self, photons):
+        """
+        Photon count to use for the next run given the budget.
+
+        The peak of a run is predicted as overhead_bytes + bytes_per_photon * photons (see
+        `fit`), with DEFAULT_BYTES_PER_PHOTON before the first run has been measured.
+        """
+        self._requested = photons
+        if self.budget is None:
+            return photons
+        bpp = self.bytes_per_photon or DEFAULT_BYTES_PER_PHOTON
+        allowed = int(max(self.budget - self.overhead_bytes, 0) // bpp)
+        if photons <= allowed:
+            return photons
+        if self.on_exceed == "abort" or allowed < 1:
+            raise MemoryBudgetExceeded(
+                f"{photons} photons need ~{photons * bpp / 2**20:.1f} MiB, "
+                f"budget is {self.budget / 2**20:.1f} MiB (max ~{allowed} photons)")
+        return allowed
+
+
+    def start_run(self, photons):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        tracemalloc.reset_peak()
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        self._photons = photons
+        self._frames = dict.fromkeys(FRAME_HOLDERS, 0)
+        self._in_flight.clear()
+
+
+    def frame_sent(self, frame):
+        """
+        Sample a photon frame as its sender puts it on the quantum channel (a netsquid
+        Message or list of qubits, see `frame_sizeof`).
+        """
+        size = frame_sizeof(frame)
+        self._in_flight.append(size)
+        self._frames["qubit_lists"] = max(self._frames["qubit_lists"], size)
+        self._frames["channel_queues"] = max(self._frames["channel_queues"], sum(self._in_flight))
+
+
+    def frame_received(self, frame):
+        """
+        Sample a photon frame as its receiver takes it off the channel, before measuring.
+        """
+        self._frames["qubit_lists"] = max(self._frames["qubit_lists"], frame_sizeof(frame))
+        if self._in_flight:
+            self._in_flight.popleft()
+
+
+    def end_run(self, protocols, keepKeys=False):
+        """
+        Record memory use of the run that just finished.
+
+        Parameters:
+            protocols   dict of name -> protocol object of the run
+            keepKeys    whether the caller retains this run's keys (raw result mode)
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        peak_bytes = peak - self._baseline
+
+        holders = {name: 0 for name in HOLDERS}
+        seen = set()
+        for prot in protocols.values():
+            for name, attrs in HOLDERS.items():
+                for attr in attrs:
+                    if hasattr(prot, attr):
+                        holders[name] += deep_sizeof(getattr(prot, attr), seen)
+        if keepKeys:
+            self.retained_keys += sum(deep_sizeof(getattr(p, "key", []), set()) for p in protocols.values())
+        holders["key_lists"] = self.retained_keys
+        holders.update(self._frames)
+        # a frame in the channel is the same frame a protocol held, so only the larger
+        # frame figure counts against the peak
+        tracked = sum(holders[name] for name in HOLDERS) + max(self._frames.values())
+        holders["untracked_peak"] = max(peak_bytes - tracked, 0)
+
+        bpp = peak_bytes / self._photons if self._photons else float('nan')
+
+        record = {"run": len(self.records) + 1, "photons": self._photons,
+                  "shrunk": self._photons < self._requested, "peak_bytes": peak_bytes,
+                  "bytes_per_photon": bpp, "rss_bytes": current_rss(), "peak_rss_bytes": peak_rss(),
+                  "holders": holders,
+                  "frame_bytes_per_photon": max(self._frames.values()) / self._photons if self._photons else 0.}
+        self.records.append(record)
+        if self._photons:
+            self.overhead_bytes, self.bytes_per_photon = self.fit()
+        return record
+
+
+    def fit(self):
+        """
+        Fit the peak of a run as overhead + bytes per photon * photons.
+
+        A least-squares line goes through the largest peak seen at each photon count, so
+        the fixed overhead is not charged to every photon (which would make a shrunk run
+        look more expensive per photon and shrink the next one further). Until two photon
+        counts have been measured, or if the line is not physical, the whole peak is
+        charged to the photons. The slope is never below the largest in-flight frame bytes
+        per photon measured, since frames grow with the photon count whatever the fit says.
+
+        Returns:
+            (overhead bytes, bytes per photon)
+        """
+        peaks = {}
+        for r in self.records:
+            if r["photons"]:
+                peaks[r["photons"]] = max(peaks.get(r["photons"], 0), r["peak_bytes"])
+        photons = np.array(list(peaks), dtype=float)
+        peak = np.array(list(peaks.values()), dtype=float)
+        frame_bpp = max((r["frame_bytes_per_photon"] for r in self.records), default=0.)
+        if len(photons) >= 2:
+            slope, overhead = np.polyfit(photons, peak, 1)
+            if slope >= frame_bpp and slope > 0 and overhead >= 0:
+                return float(overhead), float(slope)
+        return 0., float(max((peak / photons).max(), frame_bpp))
+
+
+    def close(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+    def summary(self):
+        if not self.records:
+            return {}
+        return {"runs": len(self.records),
+                "max_peak_bytes": max(r["peak_bytes"] for r in self.records),
+                "bytes_per_photon": self.bytes_per_photon,
+                "overhead_bytes": self.overhead_bytes,
+                "peak_rss_bytes": peak_rss(),
+                "shrunk_runs": sum(r["shrunk"] for r in self.records)}
@@ -0,0 +1,166 @@
+import math
+
+import numpy as np
+import netsquid as ns
+
+from netsquid.components.models import QuantumErrorModel
+from netsquid.qubits.operators import create_rotation_op
+
+
+
+class FibreNoiseModel(QuantumErrorModel):
+    """
+    Base class for length-dependent fibre noise on a quantum channel.
+
+    Every model also exposes `flip_probabilities(length)`: the probability that a
+    BB84 state prepared in the Z or X basis arrives flipped within its basis. For
+    BB84 states the noisy channel is exactly equivalent to such a classical bit flip,
+    which is what the fast path (`fastNoise=True` in the run functions) applies to
+    the encoded bits instead of operating on every qubit.
+
+    Both paths act in the same order: flips are sampled on the states that leave the
+    sender after any eavesdropper (lib.attacks), just as the per-qubit model acts on the
+    resent photons in the channel. lib.equivalence.fast_noise_check tests the two paths
+    against each other for every model in NOISE_MODELS.
+
+    Parameters:
+        rate        noise strength per km of fibre
+    """
+    def __init__(self, rate):
+        super().__init__()
+        if rate < 0:
+            raise ValueError(f"noise rate must be non-negative, got {rate}")
+        self.properties["rate"] = rate
+        self.required_properties = ["length"] # in km
+
+
+    def probability(self, length):
+        """Probability the noise channel acts on a photon over `length` km."""
+        return 1 - math.exp(-self.properties["rate"] * length)
+
+
+    def flip_probabilities(self, length):
+        """Return (p_z, p_x), the in-basis flip probabilities of Z- and X-basis states."""
+        raise NotImplementedError
+
+
+    def expected_qber(self, length):
+        """Expected QBER of a sifted key with uniformly chosen bases."""
+        p_z, p_x = self.flip_probabilities(length)
+        return (p_z + p_x) / 2
+
+
+class FibreDepolarModel(FibreNoiseModel):
+    """
+    Depolarizing noise: rho -> (1-p) rho + p I/2 with p = 1 - exp(-rate * length).
+    """
+    def error_operation(self, qubits, delta_time=0, **kwargs):
+        p = self.probability(kwargs["length"])
+        for q in qubits:
+            if q is not None:
+                ns.qubits.depolarize(q, prob=p)
+
+
+    def flip_probabilities(self, length):
+        p = self.probability(length) / 2
+        return p, p
+
+
+class FibreDephaseModel(FibreNoiseModel):
+    """
+    Dephasing noise: rho -> (1-p) rho + p Z rho Z with p = 1 - exp(-rate * length).
+    Leaves Z-basis states untouched and flips X-basis states with probability p.
+    """
+    def error_operation(self, qubits, delta_time=0, **kwargs):
+        p = self.probability(kwargs["length"])
+        for q in qubits:
+            if q is not None:
+                ns.qubits.dephase(q, prob=p)
+
+
+    def flip_probabilities(self, length):
+        return 0., self.probability(length)
+
+
+class PolarisationDriftModel(FibreNoiseModel):
+    """
+    Polarisation drift: each photon is rotated about the Bloch-sphere Y axis by a random
+    angle drawn from N(0, rate * length), i.e. a random walk of the linear polarisation.
+    Averaged over the angle this flips Z- and X-basis states alike with probability
+    (1 - exp(-rate * length / 2)) / 2.
+    """
+    def error_operation(self, qubits, delta_time=0, **kwargs):
+        rng = self.properties["rng"]
+        std = math.sqrt(self.properties["rate"] * kwargs["length"])
+        angles = rng.normal(0, std, size=len(qubits)) if std > 0 else np.zeros(len(qubits))
+        for q, angle in zip(qubits, angles):
+            if q is not None and angle != 0:
+                ns.qubits.operate(q, create_rotation_op(angle, rotation_axis=(0, 1, 0)))
+
+
+    def flip_probabilities(self, length):
+        p = (1 - math.exp(-self.properties["rate"] * length / 2)) / 2
+        return p, p
+
+
+class CompositeErrorModel(QuantumErrorModel):
+    """
+    Apply several quantum error models to a frame in order.
+    """
+    def __init__(self, models):
+        super().__init__()
+        self.models = [m for m in models if m is not None]
+        self.required_properties = sorted({p for m in self.models for p in m.required_properties})
+
+
+    def error_operation(self, qubits, delta_time=0, **kwargs):
+        for m in self.models:
+            m.error_operation(qubits, delta_time=delta_time, **kwargs)
+
+
+def channel_flip_probabilities(noise, length):
+    """
+    (p_z, p_x) for the classical fast path of `noise` over `length` km, (0, 0) if no noise.
+    """
+    if noise is None:
+        return 0., 0.
+    return noise.flip_probabilities(length)
+
+
+def sample_flips(bases, flipProbs):
+    """
+    Vectorised in-basis flips for a frame of BB84 states.
+
+    Parameters:
+        bases       basis per photon (0 = Z-basis, 1 = X-basis)
+        flipProbs   (p_z, p_x) flip probabilities
+
+    Returns:
+        list of 0/1 flags, 1 where the photon arrives flipped
+    """
+    p_z, p_x = flipProbs
+    bases = np.asarray(bases)
+    if p_z == 0 and p_x == 0:
+        return np.zeros(len(bases), dtype=np.int8).tolist()
+    p = np.where(bases == 1, p_x, p_z)
+    return (np.random.random_sample(len(bases)) < p).astype(np.int8).tolist()
+
+
+NOISE_MODELS = {
+    "depolar": FibreDepolarModel,
+    "dephase": FibreDephaseModel,
+    "drift":   PolarisationDriftModel,
+}
+
+
+def make_noise(name, rate):
+    """
+    Build a fibre noise model by name ("depolar", "dephase" or "drift").
+    """
+    if name is None:
+        return None
+    try:
+        cls = NOISE_MODELS[name]
+    except KeyError:
+        raise ValueError(f"unknown noise model '{name}', expected one of {sorted(NOISE_MODELS)}")
+    return cls(rate)
@@ -0,0 +1,219 @@
+"""
+Producer/consumer key pipeline.
+
+Simulation workers run single repetitions of run_BB84_sims / run_mdi_sims and push the
+raw sifted keys into a bounded queue; post-processing workers take them off the queue
+for QBER estimation, Cascade error correction and Toeplitz privacy amplification
+(lib.postprocess). When post-processing falls behind, the full queue blocks the
+simulation workers (backpressure) instead of piling up keys in memory. Each
+post-processing worker keeps streaming lib.stats.Welford accumulators, which are merged
+once all keys are processed.
+"""
+import cProfile
+import multiprocessing as mp
+import os
+import queue
+import time
+import traceback
+
+import numpy as np
+
+from lib.postprocess import postprocess
+from lib.stats import Welford
+
+
+
+METRICS = ("key_rate", "sifted_len", "qber_est", "corrected", "leaked", "final_len", "final_rate", "latency")
+
+
+def _report_errors(kind, body, worker, args):
+    """
+    Run a worker body; an exception is reported on the results queue (args[-2]) instead
+    of leaving the parent waiting for a result that never comes.
+    """
+    try:
+        body(worker, *args)
+    except BaseException:
+        args[-2].put(("error", worker, f"{kind} worker {worker} failed:\n{traceback.format_exc()}"))
+
+
+def _simulate(worker, protocol, runs, seed, runKwargs, keys, results, profileDir=None):
+    """Simulation worker: one repetition per run index, keys pushed as they finish."""
+    from lib.functions import set_seed
+    from lib.profiling import RunProfiler
+    if protocol == "bb84":
+        from BB84.BB84_run import run_BB84_sims as run
+    else:
+        from MDI.mdiRun import run_mdi_sims as run
+
+    profiler = RunProfiler() if profileDir else None
+    runKwargs = dict(runKwargs)
+    crn = runKwargs.pop("crn", None)
+    # X-basis test bits of biased-basis runs, for parameter estimation
+    tests = []
+    hook = lambda prots: tests.append((prots["alice"].test_key, prots["bob"].test_key))
+    blocked = 0.
+    for r in runs:
+        set_seed(seed + r)
+        tests.clear()
+        if crn is not None:
+            # run r of the pipeline draws the inputs of run r of a sweep with the same crn
+            runKwargs["crn"] = crn.shifted(r)
+        KeyListA, KeyListB, KeyRateList = run(runtimes=1, profiler=profiler, runHook=hook, **runKwargs)
+        item = (r, KeyListA[0], KeyListB[0], KeyRateList[0], time.time()) + tests[0]
+        start = time.time()
+        keys.put(item)          # blocks while the queue is full
+        blocked += time.time() - start
+    if profiler is not None:
+        profiler.dump(os.path.join(profileDir, f"sim-{worker}.prof"))
+    results.put(("simulation", worker, {"runs": len(runs), "blocked_seconds": blocked}))
+
+
+def _postprocess(worker, seed, options, keys, results, profileDir=None):
+    """Post-processing worker: consume keys until the None sentinel arrives."""
+    rng = np.random.RandomState(seed + 7919 * (worker + 1))
+    prof = cProfile.Profile() if profileDir else None
+    stats = {m: Welford() for m in METRICS}
+    failed = aborted = unverified = residual = 0
+    busy = 0.
+    while True:
+        item = keys.get()
+        if item is None:
+            break
+        r, keyA, keyB, keyRate, queued, testA, testB = item
+        if isinstance(keyA, str):
+            failed += 1
+            continue
+        start = time.time()
+        if prof is not None:
+            prof.enable()
+        try:
+            res = postprocess(keyA, keyB, rng=rng, testA=testA or None, testB=testB or None, **options)
+        finally:
+            if prof is not None:
+                prof.disable()
+        busy += time.time() - start
+
+        if res["final_len"] == 0:
+            aborted += 1
+            unverified += res["residual_errors"] is not None and not res["verified"]
+        else:
+            # errors left in keys that were actually released
+            residual += res["residual_errors"]
+        for m in ("sifted_len", "qber_est", "corrected", "leaked", "final_len"):
+            if res[m] is not None:
+                stats[m].update(res[m])
+        stats["key_rate"].update(keyRate)
+        # secret bits per second of simulated time, scaling the sifted key rate
+        stats["final_rate"].update(keyRate * res["final_len"] / len(keyA) if len(keyA) else 0.)
+        stats["latency"].update(time.time() - queued)
+    if prof is not None and stats["sifted_len"].n:
+        prof.dump_stats(os.path.join(profileDir, f"post-{worker}.prof"))
+    results.put(("postprocess", worker, {"stats": stats, "failed": failed, "aborted": aborted,
+                                         "unverified": unverified, "residual_errors": residual, "busy_seconds": busy}))
+
+
+def _run_simulate(worker, *args):
+    _report_errors("simulation", _simulate, worker, args)
+
+
+def _run_postprocess(worker, *args):
+    _report_errors("post-processing", _postprocess, worker, args)
+
+
+def run_pipeline(protocol="bb84", runs=20, simWorkers=2, postWorkers=1, queueSize=4, seed=0,
+                 sampleFraction=0.1, passes=4, eps=1e-10, profileDir=None, pollSeconds=1., **runKwargs):
+    """
+    Simulate `runs` repetitions and post-process their keys concurrently.
+
+    Parameters:
+        protocol        "bb84" or "mdi"
+        runs            total repetitions (run i is seeded with seed + i, or drawn as run i
+                        of a lib.crn.CommonRandomNumbers passed as `crn`)
+        simWorkers      simulation processes
+        postWorkers     post-processing processes
+        queueSize       capacity of the key queue between them
+        sampleFraction  fraction of each sifted key disclosed for QBER estimation
+        passes          Cascade passes
+        eps             security parameter of privacy amplification
+        profileDir      directory every worker dumps its pstats file into (see lib.profiling)
+        pollSeconds     how often the parent checks that workers are still alive
+        runKwargs       passed to the run function (fibreLen, photonCount, noise, ...)
+
+    Returns:
+        dict with merged per-metric statistics (`stats`, Welford.as_dict per METRICS entry),
+        wall time, keys per second, time the simulation workers spent blocked on the
+        full queue, and failed / aborted run counts
+
+    Raises:
+        RuntimeError if a worker raises or dies; the remaining workers are terminated
+    """
+    ctx = mp.get_context()
+    keys = ctx.Queue(maxsize=queueSize)
+    results = ctx.Queue()
+    options = {"sampleFraction": sampleFraction, "passes": passes, "eps": eps}
+
+    producers = [ctx.Process(target=_run_simulate,
+                             args=(i, protocol, list(range(i, runs, simWorkers)), seed, runKwargs, keys, results, profileDir))
+                 for i in range(simWorkers)]
+    consumers = [ctx.Process(target=_run_postprocess, args=(i, seed, options, keys, results, profileDir))
+                 for i in range(postWorkers)]
+    workers = producers + consumers
+
+    def check_workers():
+        dead = [p for p in workers if p.exitcode not in (None, 0)]
+        if dead:
+            fail(f"{dead[0].name} exited with code {dead[0].exitcode}")
+
+    def fail(message):
+        for p in workers:
+            if p.is_alive():
+                p.terminate()
+        raise RuntimeError(f"key pipeline aborted: {message}")
+
+    start = time.time()
+    for p in consumers + producers:
+        p.start()
+
+    merged = {m: Welford() for m in METRICS}
+    summary = {"protocol": protocol.upper(), "runs": runs, "sim_workers": simWorkers,
+               "post_workers": postWorkers, "queue_size": queueSize,
+               "blocked_seconds": 0., "busy_seconds": 0., "failed": 0, "aborted": 0, "unverified": 0,
+               "residual_errors": 0}
+    simulated = received = 0
+    while received < len(workers):
+        try:
+            kind, _, res = results.get(timeout=pollSeconds)
+        except queue.Empty:
+            # a worker that crashed outright (e.g. killed) never reports: poll liveness
+            check_workers()
+            continue
+        received += 1
+        if kind == "error":
+            fail(res)
+        if kind == "simulation":
+            summary["blocked_seconds"] += res["blocked_seconds"]
+            simulated += 1
+            if simulated == simWorkers:
+                # all keys are queued: one sentinel per post-processing worker
+                for _ in consumers:
+                    while True:
+                        try:
+                            keys.put(None, timeout=pollSeconds)
+                            break
+                        except queue.Full:
+                            check_workers()
+            continue
+        for m in METRICS:
+            merged[m].merge(res["stats"][m])
+        for field in ("busy_seconds", "failed", "aborted", "unverified", "residual_errors"):
+            summary[field] += res[field]
+    for p in workers:
+        p.join()
+
+    summary["wall_seconds"] = time.time() - start
+    summary["keys_per_second"] = merged["sifted_len"].n / summary["wall_seconds"]
+    summary["stats"] = {m: merged[m].as_dict() for m in METRICS}
+    if profileDir:
+        summary["profiles"] = sorted(os.path.join(profileDir, f) for f in os.listdir(profileDir) if f.endswith(".prof"))
+    return summary
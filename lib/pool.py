@@ -0,0 +1,67 @@
+import netsquid as ns
+
+
+
+class QubitPool:
+    """
+    Pool of netsquid qubits reused across frames and runs.
+
+    Senders acquire photons from the pool instead of having the photon source allocate
+    fresh qubits, and receivers hand them back as soon as they have been measured, so a
+    long simulation recycles the same qubit objects instead of churning the allocator
+    and garbage collector. A released qubit is reset to |0> when it is next acquired.
+
+    Attributes:
+        reuse       keep released qubits for reuse (False only counts, for comparison)
+        free        released qubits waiting to be reused
+        live        qubits currently acquired and not yet released
+        peak_live   highest number of simultaneously live qubits seen
+        created     number of qubits ever allocated
+        reused      number of acquisitions served from `free`
+    """
+    def __init__(self, reuse=True):
+        self.reuse     = reuse
+        self.free      = []
+        self.live      = 0
+        self.peak_live = 0
+        self.created   = 0
+        self.reused    = 0
+
+
+    def acquire(self):
+        """
+        Return a qubit in state |0>.
+        """
+        if self.free:
+            q = self.free.pop()
+            ns.qubits.assign_qstate([q], ns.s0)
+            self.reused += 1
+        else:
+            q = ns.qubits.create_qubits(1)[0]
+            self.created += 1
+        self.live += 1
+        if self.live > self.peak_live:
+            self.peak_live = self.live
+        return q
+
+
+    def release(self, qubits):
+        """
+        Hand measured qubits back to the pool.
+
+        Parameters:
+            qubits      iterable of qubits (None entries, e.g. lost photons, are skipped)
+        """
+        for q in qubits:
+            if q is None:
+                continue
+            self.live -= 1
+            if self.reuse:
+                self.free.append(q)
+            else:
+                ns.qubits.discard(q)
+
+
+    def stats(self):
+        return {"live": self.live, "peak_live": self.peak_live, "created": self.created,
+                "reused": self.reused, "free": len(self.free)}
@@ -0,0 +1,181 @@
+"""
+Classical post-processing of sifted keys: parameter estimation, error correction and
+privacy amplification.
+
+    estimate_qber       disclose a random sample of the sifted key to estimate the QBER
+                        (biased-basis keys use their X-basis test bits instead)
+    cascade_correct     Cascade error correction, counting the parity bits leaked
+    toeplitz_hash       privacy amplification with a random Toeplitz matrix
+    postprocess         all three in sequence, with a hash check of the corrected keys,
+                        returning the final keys and their bookkeeping
+
+Both parties' keys are held in one process here, so the "public discussion" is simply
+reading the other array; the leaked parity bits are counted all the same.
+"""
+import math
+
+import numpy as np
+
+
+
+# hash length of the error-verification step (collision probability 2^-64)
+VERIFY_BITS = 64
+
+
+def binary_entropy(p):
+    if p <= 0 or p >= 1:
+        return 0.
+    return -p * math.log2(p) - (1 - p) * math.log2(1 - p)
+
+
+def estimate_qber(keyA, keyB, fraction=0.1, rng=None):
+    """
+    Compare a random `fraction` of the sifted bits publicly and drop them from the key.
+
+    Returns:
+        (estimated QBER, remaining keyA, remaining keyB)
+    """
+    rng = np.random if rng is None else rng
+    keyA, keyB = np.asarray(keyA, dtype=np.int8), np.asarray(keyB, dtype=np.int8)
+    n = len(keyA)
+    k = min(max(int(round(fraction * n)), 1), n) if n else 0
+    sample = np.zeros(n, dtype=bool)
+    sample[rng.choice(n, size=k, replace=False)] = True
+    q = float(np.count_nonzero(keyA[sample] != keyB[sample])) / k if k else float('nan')
+    return q, keyA[~sample], keyB[~sample]
+
+
+def _block_parities(bits, size):
+    return np.add.reduceat(bits, np.arange(0, len(bits), size)) & 1
+
+
+def cascade_correct(keyA, keyB, qber=0.05, passes=4, rng=None):
+    """
+    Correct keyB towards keyA with the Cascade protocol.
+
+    Pass 1 splits the key into blocks of ~0.73 / qber bits, later passes use a common
+    random permutation and double the block size. Every odd-parity block is searched
+    for one error by BINARY (one parity exchanged per halving); correcting a bit flips
+    the parity of the blocks containing it in earlier passes, which are then searched
+    in turn (Cascade's backtracking).
+
+    Returns:
+        (corrected keyB, parity bits leaked, errors corrected)
+    """
+    rng = np.random if rng is None else rng
+    a = np.asarray(keyA, dtype=np.int8)
+    b = np.asarray(keyB, dtype=np.int8).copy()
+    n = len(a)
+    if n == 0:
+        return b, 0, 0
+    first = max(int(0.73 / qber), 4) if qber > 0 else n
+    layers = []     # per pass: (permutation, position of each bit, block size, odd-parity flags)
+    leaked = corrected = 0
+
+    def search(perm, lo, hi):
+        nonlocal leaked
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            leaked += 1
+            idx = perm[lo:mid]
+            if (int(a[idx].sum()) ^ int(b[idx].sum())) & 1:
+                hi = mid
+            else:
+                lo = mid
+        return perm[lo]
+
+    for p in range(passes):
+        size = min(first * 2 ** p, n)
+        perm = np.arange(n) if p == 0 else rng.permutation(n)
+        pos = np.empty(n, dtype=np.int64)
+        pos[perm] = np.arange(n)
+        odd = _block_parities(a[perm], size) != _block_parities(b[perm], size)
+        leaked += len(odd)
+        layers.append((perm, pos, size, odd))
+
+        pending = [(p, blk) for blk in np.flatnonzero(odd)]
+        while pending:
+            layer, blk = pending.pop()
+            perm_l, _, size_l, odd_l = layers[layer]
+            if not odd_l[blk]:
+                continue
+            i = search(perm_l, blk * size_l, min(blk * size_l + size_l, n))
+            b[i] ^= 1
+            corrected += 1
+            for l, (_, pos_l, size_m, odd_m) in enumerate(layers):
+                k = pos_l[i] // size_m
+                odd_m[k] = not odd_m[k]
+                if odd_m[k]:
+                    pending.append((l, k))
+    return b, leaked, corrected
+
+
+def toeplitz_hash(bits, outLen, seedBits):
+    """
+    Multiply `bits` (length n) by the outLen x n binary Toeplitz matrix defined by the
+    n + outLen - 1 bits of `seedBits`, modulo 2.
+    """
+    bits = np.asarray(bits, dtype=np.int64)
+    n = len(bits)
+    if outLen <= 0 or n == 0:
+        return np.zeros(0, dtype=np.int8)
+    seed = np.asarray(seedBits, dtype=np.int64)[:n + outLen - 1]
+    # T[i, j] = seed[i - j + n - 1]: row i of T @ bits is entry i + n - 1 of the full convolution
+    return (np.convolve(seed, bits)[n - 1:n - 1 + outLen] & 1).astype(np.int8)
+
+
+def final_key_length(n, qber, leaked, eps=1e-10):
+    """Asymptotic-style secret key length n (1 - h(qber)) - leak - 2 log2(1/eps), floored at 0."""
+    return max(int(math.floor(n * (1 - binary_entropy(qber)) - leaked - 2 * math.log2(1 / eps))), 0)
+
+
+def postprocess(keyA, keyB, sampleFraction=0.1, passes=4, eps=1e-10, rng=None, testA=None, testB=None,
+                verifyBits=VERIFY_BITS):
+    """
+    Parameter estimation, error correction and privacy amplification of one sifted key.
+
+    With biased bases the QBER is estimated from the X-basis test bits `testA`/`testB`
+    instead, and the whole (Z-basis) key goes on to error correction.
+
+    A sample without errors does not mean a QBER of 0: block sizes and the key length use
+    the estimate floored at one error in the sample (1 / sample size), so an even number of
+    errors cannot hide in a single whole-key Cascade block. After correction both keys are
+    compared through a `verifyBits`-bit Toeplitz hash (counted as leaked), and the key is
+    aborted if the hashes differ.
+
+    Returns:
+        dict with sifted_len, qber_est, corrected, residual_errors, leaked, verified,
+        final_len and the final keys (final_a, final_b as int8 arrays)
+    """
+    rng = np.random if rng is None else rng
+    sifted_len = min(len(keyA), len(keyB))
+    if testA is not None and len(testA):
+        k = min(len(testA), len(testB))
+        q = float(np.count_nonzero(np.asarray(testA[:k]) != np.asarray(testB[:k]))) / k
+        a, b = np.asarray(keyA[:sifted_len], dtype=np.int8), np.asarray(keyB[:sifted_len], dtype=np.int8)
+    else:
+        q, a, b = estimate_qber(keyA[:sifted_len], keyB[:sifted_len], sampleFraction, rng)
+        k = sifted_len - len(a)
+    res = {"sifted_len": sifted_len, "qber_est": q}
+    if len(a) == 0 or math.isnan(q) or q >= 0.11:
+        # no key (or above the BB84 threshold): abort
+        res.update(corrected=0, residual_errors=None, leaked=0, verified=False, final_len=0,
+                   final_a=np.zeros(0, dtype=np.int8), final_b=np.zeros(0, dtype=np.int8))
+        return res
+
+    q_used = max(q, 1 / k)
+    b, leaked, corrected = cascade_correct(a, b, q_used, passes, rng)
+
+    # error verification: compare short hashes of both corrected keys
+    check = rng.randint(0, 2, size=len(a) + verifyBits - 1)
+    verified = bool(np.array_equal(toeplitz_hash(a, verifyBits, check), toeplitz_hash(b, verifyBits, check)))
+    leaked += verifyBits
+    res.update(corrected=corrected, residual_errors=int(np.count_nonzero(a != b)), leaked=leaked, verified=verified)
+    if not verified:
+        res.update(final_len=0, final_a=np.zeros(0, dtype=np.int8), final_b=np.zeros(0, dtype=np.int8))
+        return res
+
+    out_len = final_key_length(len(a), q_used, leaked, eps)
+    seed = rng.randint(0, 2, size=len(a) + max(out_len, 1) - 1)
+    res.update(final_len=out_len, final_a=toeplitz_hash(a, out_len, seed), final_b=toeplitz_hash(b, out_len, seed))
+    return res
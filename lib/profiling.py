@@ -0,0 +1,134 @@
+"""
+cProfile instrumentation merged across repetitions and worker processes.
+
+A RunProfiler is handed to run_BB84_sims / run_mdi_sims like a memory monitor: every
+repetition is profiled on its own (inside `profiled`, so a repetition that raises never
+leaves the profiler running) and folded into one pstats.Stats, and profiles dumped by
+worker processes are merged in with `add`. `hot_functions` splits the merged time into
+netsquid engine code (sim_run, qubit operations, channels), project code (protocols,
+HybridDelayModel.generate_delay, rng_bin_lst, lib), numpy and everything else.
+"""
+import cProfile
+import os
+import pstats
+from contextlib import contextmanager, nullcontext
+
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CATEGORIES = ("netsquid", "project", "numpy", "other")
+
+
+def categorise(filename, funcname):
+    """Category of a profiled function from its source file (or builtin description)."""
+    if "netsquid" in filename or "netsquid" in funcname:
+        return "netsquid"
+    if filename.startswith(PROJECT_ROOT) and "site-packages" not in filename:
+        return "project"
+    if "numpy" in filename or "numpy" in funcname:
+        return "numpy"
+    return "other"
+
+
+class RunProfiler:
+    """
+    Profile each repetition of a run function and merge the results.
+
+    Attributes:
+        stats       merged pstats.Stats (None until something was profiled)
+        runs        repetitions profiled in this process
+        sources     number of profiles merged (repetitions and worker dumps)
+    """
+    def __init__(self):
+        self.stats   = None
+        self.runs    = 0
+        self.sources = 0
+        self._prof   = None
+
+
+    def start_run(self):
+        self._prof = cProfile.Profile()
+        self._prof.enable()
+
+
+    def end_run(self):
+        self._prof.disable()
+        self.add(self._prof)
+        self._prof = None
+        self.runs += 1
+
+
+    def abort_run(self):
+        """Stop profiling a repetition that failed, without merging it."""
+        if self._prof is not None:
+            self._prof.disable()
+            self._prof = None
+
+
+    @contextmanager
+    def profile_run(self):
+        """Profile the enclosed repetition; one that raises is stopped and dropped."""
+        self.start_run()
+        try:
+            yield
+        except BaseException:
+            self.abort_run()
+            raise
+        self.end_run()
+
+
+    def add(self, source):
+        """
+        Merge a cProfile.Profile, pstats.Stats or pstats file path into the totals.
+        """
+        if self.stats is None:
+            self.stats = pstats.Stats(source)
+        else:
+            self.stats.add(source)
+        self.sources += 1
+
+
+    def dump(self, path):
+        """Write the merged statistics as one pstats file."""
+        if self.stats is not None:
+            self.stats.dump_stats(path)
+
+
+def profiled(profiler):
+    """Context manager profiling one repetition into `profiler`, or nothing if it is None."""
+    return nullcontext() if profiler is None else profiler.profile_run()
+
+
+def hot_functions(stats, top=15):
+    """
+    Split profiled time by category and list the hottest functions of each.
+
+    Parameters:
+        stats   pstats.Stats (e.g. RunProfiler.stats)
+        top     functions listed per category
+
+    Returns:
+        dict with total_seconds, per-category seconds and share, sim_run_seconds (cumulative
+        time inside netsquid's sim_run) and `top`: category -> list of dicts (function,
+        location, calls, self_seconds, cum_seconds) ordered by self time
+    """
+    totals = dict.fromkeys(CATEGORIES, 0.)
+    rows = {c: [] for c in CATEGORIES}
+    sim_run = 0.
+    for (filename, line, funcname), (cc, nc, tt, ct, _) in stats.stats.items():
+        cat = categorise(filename, funcname)
+        totals[cat] += tt
+        if funcname == "sim_run" and cat == "netsquid":
+            sim_run = max(sim_run, ct)
+        where = os.path.relpath(filename, PROJECT_ROOT) if cat == "project" else filename
+        rows[cat].append({"function": funcname, "location": f"{where}:{line}", "calls": nc,
+                          "self_seconds": tt, "cum_seconds": ct})
+
+    total = sum(totals.values())
+    out = {"total_seconds": total, "sim_run_seconds": sim_run}
+    for cat in CATEGORIES:
+        out[f"{cat}_seconds"] = totals[cat]
+        out[f"{cat}_share"] = totals[cat] / total if total else float('nan')
+    out["top"] = {c: sorted(rows[c], key=lambda r: r["self_seconds"], reverse=True)[:top] for c in CATEGORIES}
+    return out
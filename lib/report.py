@@ -0,0 +1,196 @@
+"""
+Shared result reporting for the simulation scripts and the qkd-sim CLI.
+
+Kept free of netsquid/numpy imports so the CLI can load it for free.
+"""
+import csv
+import json
+import math
+import sys
+
+
+
+def qber(keyA, keyB):
+    """Compute QBER between two key lists."""
+    if not keyA or not keyB:
+        return None
+    length = min(len(keyA), len(keyB))
+    if length == 0:
+        return None
+    from lib import kernels
+    errors = kernels.count_errors(kernels.as_array(keyA[:length]), kernels.as_array(keyB[:length]))
+    return errors / length
+
+
+def completed(key):
+    """Whether a run's key list is from a completed run (MDI marks failures with "nan")."""
+    return not isinstance(key, str)
+
+
+def print_run_summary(run_idx, keyA, keyB, keyRate, protocol):
+    """Print per-run metrics."""
+    if completed(keyA):
+        q = qber(keyA, keyB)
+        q_str = f"{q*100:.2f}%" if q is not None else "N/A"
+        print(f"  {protocol} run {run_idx+1:>3}:  key_len={len(keyA):>5} | QBER={q_str:>7} | key_rate={keyRate:.4f}")
+    else:
+        print(f"  {protocol} run {run_idx+1:>3}:  did not complete")
+
+
+def aggregate_summary(KeyListA, KeyListB, KeyRateList, bases=None, photonCount=None):
+    """
+    Aggregate metrics across all completed runs (vectorised, see lib.analytics).
+
+    Returns:
+        dict with runs, failed, avg_key_len, avg_qber, avg_key_rate, pooled QBER with
+        confidence interval, per-basis QBER (if `bases` given), bias, runs-test score
+        and sifting efficiency (if `photonCount` given)
+    """
+    from lib.analytics import analyse_keys, pooled
+
+    analysis = analyse_keys(KeyListA, KeyListB, bases=bases, photonCount=photonCount)
+    summary = pooled(analysis)
+    rates = [KeyRateList[i] for i in analysis["run_index"]]
+    summary["failed"] = len(KeyListA) - summary["runs"]
+    summary["avg_key_rate"] = sum(rates) / len(rates) if rates else float('nan')
+    return summary
+
+
+def aggregator_summary(aggregator, photonCount=None):
+    """
+    Same fields as `aggregate_summary`, read from a summary-only lib.stats.RunAggregator.
+    """
+    from lib.analytics import pooled_from_aggregator
+
+    summary = pooled_from_aggregator(aggregator, photonCount=photonCount)
+    rate = aggregator.stats["key_rate"]
+    summary["failed"] = aggregator.n_failed
+    summary["avg_key_rate"] = rate.mean if rate.n else float('nan')
+    return summary
+
+
+def print_aggregate_summary(summary, title="Aggregate Results"):
+    """Print aggregate metrics as returned by `aggregate_summary`."""
+    print()
+    print("=" * 65)
+    print(f"  {title}")
+    print("=" * 65)
+    print(f"  Runs completed  : {summary['runs']}")
+    if summary.get("failed"):
+        print(f"  Runs failed     : {summary['failed']}")
+    print(f"  Avg key length  : {summary['avg_key_len']:.1f}")
+    print(f"  Avg QBER        : {summary['avg_qber']*100:.2f}%")
+    if "pooled_qber_low" in summary:
+        print(f"  Pooled QBER     : {summary['pooled_qber']*100:.2f}% "
+              f"[{summary['pooled_qber_low']*100:.2f}%, {summary['pooled_qber_high']*100:.2f}%]")
+    if "pooled_z_qber" in summary:
+        print(f"  Z / X QBER      : {summary['pooled_z_qber']*100:.2f}% / {summary['pooled_x_qber']*100:.2f}%")
+    if "est_qber" in summary:
+        print(f"  X-basis est.    : {summary['est_qber']*100:.2f}% "
+              f"[{summary['est_qber_low']*100:.2f}%, {summary['est_qber_high']*100:.2f}%] from {summary['test_bits']} test bits")
+    if "avg_sifting_eff" in summary:
+        print(f"  Sifting eff.    : {summary['avg_sifting_eff']*100:.1f}%")
+    print(f"  Avg key rate    : {summary['avg_key_rate']:.4f}")
+    if "peak_live_qubits" in summary:
+        print(f"  Peak live qubits: {summary['peak_live_qubits']}")
+    if summary.get("peak_bytes") is not None:
+        print(f"  Peak run memory : {summary['peak_bytes'] / 2**20:.2f} MiB "
+              f"({summary['bytes_per_photon']:.0f} B/photon, peak RSS {summary['peak_rss_bytes'] / 2**20:.1f} MiB)")
+        if summary.get("shrunk_runs"):
+            print(f"  Shrunk runs     : {summary['shrunk_runs']}")
+    print("=" * 65)
+
+
+def print_streaming_summary(aggregator):
+    """Print aggregate metrics from a summary-only (streaming) result."""
+    stats = aggregator.stats
+    print()
+    print("=" * 65)
+    print("  Aggregate Results (summary mode)")
+    print("=" * 65)
+    print(f"  Runs completed  : {aggregator.n_runs}")
+    if aggregator.n_failed:
+        print(f"  Runs failed     : {aggregator.n_failed}")
+    print(f"  Avg key length  : {stats['key_len'].mean:.1f} (std {stats['key_len'].std:.1f})")
+    print(f"  Avg QBER        : {stats['qber'].mean*100:.2f}% (std {stats['qber'].std*100:.2f}%)")
+    print(f"  Avg key rate    : {stats['key_rate'].mean:.4f} (std {stats['key_rate'].std:.4f})")
+    print(f"  Avg Z / X bits  : {stats['z_count'].mean:.1f} / {stats['x_count'].mean:.1f}")
+    print("=" * 65)
+
+
+def print_parameters(title, params):
+    """Print the simulation parameter banner."""
+    print()
+    print("=" * 65)
+    print(f"  {title}")
+    print("=" * 65)
+    print(f"  Runtimes   : {params['runtimes']}")
+    print(f"  Photons    : {params['photons']}")
+    print(f"  Fibre      : {params['fibre']} km")
+    print(f"  Frequency  : {params['freq']:.2e} Hz")
+    print(f"  Speed      : {params['speed']}c")
+    print("=" * 65)
+    print()
+
+
+def comparative_stats(stats1, stats2):
+    """Print BB84 and MDI aggregate results side by side."""
+    print()
+    print("=" * 65)
+    print(f" Aggregate Results     |    BB84    |     MDI    |")
+    print("=" * 65)
+    print(f"  Runs completed       |    {stats1['runs']:>3}     |    {stats2['runs']:>3}     |")
+    print(f"  Avg key length       |   {stats1['avg_key_len']:.2f}   |   {stats2['avg_key_len']:.2f}   |")
+    print(f"  Avg QBER             |    {stats1['avg_qber']*100:.2f}%   |    {stats2['avg_qber']*100:.2f}%   |")
+    print(f"  Avg key rate (kbps)  |   {stats1['avg_key_rate']/1000:.2f}  |   {stats2['avg_key_rate']/1000:.2f}  |")
+
+
+def print_profile_report(hot, stream=None):
+    """Print the category split and hot functions returned by lib.profiling.hot_functions."""
+    stream = sys.stdout if stream is None else stream
+    print(file=stream)
+    print("=" * 65, file=stream)
+    print(f"  Profile: {hot['total_seconds']:.3f} s profiled, {hot['sim_run_seconds']:.3f} s inside sim_run", file=stream)
+    print("=" * 65, file=stream)
+    for cat in ("netsquid", "project", "numpy", "other"):
+        print(f"  {cat:<9}: {hot[cat + '_seconds']:>9.3f} s ({hot[cat + '_share']*100:5.1f}%)", file=stream)
+    for cat in ("netsquid", "project"):
+        print("-" * 65, file=stream)
+        print(f"  Hottest {cat} functions (self time / cumulative / calls)", file=stream)
+        for r in hot["top"][cat]:
+            print(f"  {r['self_seconds']:>8.3f} s {r['cum_seconds']:>8.3f} s {r['calls']:>9}  "
+                  f"{r['function']}  ({r['location']})", file=stream)
+    print("=" * 65, file=stream)
+
+
+def _clean(value):
+    # JSON has no NaN; emit null so the output stays strictly parseable
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    return value
+
+
+def write_records(records, fmt, stream=None):
+    """
+    Write a list of flat result dicts as JSON (one document) or CSV (header + rows).
+
+    Parameters:
+        records     list of dicts sharing the same keys
+        fmt         "json" or "csv"
+        stream      file-like object, defaults to stdout
+    """
+    stream = stream or sys.stdout
+    if fmt == "json":
+        json.dump([{k: _clean(v) for k, v in r.items()} for r in records], stream)
+        stream.write("\n")
+    elif fmt == "csv":
+        if not records:
+            return
+        fields = list(records[0].keys())
+        for r in records[1:]:
+            fields += [k for k in r if k not in fields]
+        writer = csv.DictWriter(stream, fieldnames=fields, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(records)
+    else:
+        raise ValueError(f"unknown output format '{fmt}'")
@@ -0,0 +1,208 @@
+import math
+import os
+
+import numpy as np
+
+
+
+class Welford:
+    """
+    Streaming mean/variance accumulator (Welford's online algorithm).
+
+    Attributes:
+        n       number of values seen
+        mean    running mean
+        min     smallest value seen
+        max     largest value seen
+    """
+    def __init__(self):
+        self.n    = 0
+        self.mean = 0.0
+        self.m2   = 0.0
+        self.min  = float('nan')
+        self.max  = float('nan')
+
+
+    def update(self, x):
+        """
+        Fold a single value into the running statistics.
+
+        Parameters:
+            x       value to add
+        """
+        x = float(x)
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = x if self.n == 1 else min(self.min, x)
+        self.max = x if self.n == 1 else max(self.max, x)
+
+
+    def merge(self, other):
+        """
+        Combine another accumulator into this one (Chan et al. parallel update).
+
+        Parameters:
+            other   Welford object to merge
+        """
+        if other.n == 0:
+            return
+        if self.n == 0:
+            self.n, self.mean, self.m2 = other.n, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta**2 * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else float('nan')
+
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance) if self.n > 1 else float('nan')
+
+
+    def as_dict(self):
+        return {"n": self.n, "mean": self.mean if self.n else float('nan'),
+                "std": self.std, "min": self.min, "max": self.max}
+
+
+def summarise_run(keyA, keyB, keyRate, bases=None):
+    """
+    Reduce a single run to summary statistics so its raw keys can be dropped.
+
+    Parameters:
+        keyA        Alice's sifted key
+        keyB        Bob's sifted key
+        keyRate     key rate of the run in bits per second
+        bases       basis of each sifted bit (0 = Z-basis, 1 = X-basis), optional
+
+    Returns:
+        dict with key_len, errors, qber, key_rate, z_count, x_count, z_errors, x_errors
+    """
+    length = min(len(keyA), len(keyB))
+    a = np.asarray(keyA[:length], dtype=np.int8)
+    b = np.asarray(keyB[:length], dtype=np.int8)
+    err = a != b
+    errors = int(err.sum())
+
+    summary = {
+        "key_len":  length,
+        "errors":   errors,
+        "qber":     errors / length if length else float('nan'),
+        "key_rate": float(keyRate),
+        "z_count":  None,
+        "x_count":  None,
+        "z_errors": None,
+        "x_errors": None,
+    }
+    if bases is not None:
+        bases = np.asarray(bases[:length], dtype=np.int8)
+        x_mask = bases == 1
+        summary["x_count"]  = int(x_mask.sum())
+        summary["z_count"]  = length - summary["x_count"]
+        summary["x_errors"] = int(err[x_mask].sum())
+        summary["z_errors"] = errors - summary["x_errors"]
+    return summary
+
+
+class RunAggregator:
+    """
+    Summary-only result of a set of runs: per-run summaries are folded into Welford
+    accumulators on the spot, so memory use does not depend on the number of runs.
+
+    Attributes:
+        stats       dict of metric name -> Welford accumulator
+        n_failed    number of runs that did not complete
+        errors      total number of bit errors over all runs
+        bits        total number of compared key bits over all runs
+        key_dir     directory raw keys are written to (None to keep nothing)
+    """
+    METRICS = ("key_len", "errors", "qber", "key_rate", "z_count", "x_count", "z_errors", "x_errors")
+
+    def __init__(self, key_dir=None, prefix="run"):
+        self.stats    = {m: Welford() for m in self.METRICS}
+        self.n_failed = 0
+        self.errors   = 0
+        self.bits     = 0
+        self.key_dir  = key_dir
+        self.prefix   = prefix
+        self._idx     = 0
+
+        if key_dir is not None:
+            os.makedirs(key_dir, exist_ok=True)
+
+
+    @property
+    def n_runs(self):
+        return self.stats["key_len"].n
+
+
+    def add_run(self, keyA, keyB, keyRate, bases=None):
+        """
+        Summarise a finished run, optionally dump its raw keys, and fold it in.
+        """
+        if self.key_dir is not None:
+            self.write_keys(keyA, keyB, bases)
+        self._idx += 1
+        summary = summarise_run(keyA, keyB, keyRate, bases=bases)
+        self.add(summary)
+        return summary
+
+
+    def add(self, summary):
+        """
+        Fold a summary produced by `summarise_run` into the aggregate.
+        """
+        for m in self.METRICS:
+            v = summary.get(m)
+            if v is None or (m == "qber" and math.isnan(v)):
+                continue
+            self.stats[m].update(v)
+        self.errors += summary["errors"]
+        self.bits   += summary["key_len"]
+
+
+    def add_failed(self):
+        self._idx += 1
+        self.n_failed += 1
+
+
+    def merge(self, other):
+        """
+        Merge another aggregator (e.g. from a worker process) into this one.
+        """
+        for m in self.METRICS:
+            self.stats[m].merge(other.stats[m])
+        self.n_failed += other.n_failed
+        self.errors   += other.errors
+        self.bits     += other.bits
+        self._idx     += other._idx
+
+
+    def write_keys(self, keyA, keyB, bases=None):
+        """
+        Write the raw keys of the current run to `key_dir` as a compressed .npz file.
+        """
+        arrays = {"keyA": np.asarray(keyA, dtype=np.uint8), "keyB": np.asarray(keyB, dtype=np.uint8)}
+        if bases is not None:
+            arrays["bases"] = np.asarray(bases, dtype=np.uint8)
+        path = os.path.join(self.key_dir, f"{self.prefix}_{self._idx:06d}.npz")
+        np.savez_compressed(path, **arrays)
+
+
+    def as_dict(self):
+        d = {m: self.stats[m].as_dict() for m in self.METRICS}
+        d["runs"]        = self.n_runs
+        d["failed"]      = self.n_failed
+        d["pooled_qber"] = self.errors / self.bits if self.bits else float('nan')
+        return d
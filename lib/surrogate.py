@@ -0,0 +1,359 @@
+"""
+Gaussian-process surrogate of key rate and QBER over the simulation parameters.
+
+Completed run_BB84_sims / run_mdi_sims results are reduced to one noisy observation per
+parameter point (mean log key rate and pooled QBER, each with its standard error) and
+fitted with a numpy-only GP (squared-exponential kernel with one length scale per
+parameter, heteroscedastic observation noise). Queries return a mean and standard
+deviation instantly; `suggest` picks the candidate points whose predictive uncertainty
+is largest, one after another, conditioning on each pick so a batch spreads out.
+`adaptive_sweep` drives simulations from those suggestions instead of a dense grid.
+
+Parameters are mapped onto [0, 1] before fitting; sourceFreq and photonCount are taken
+on a log scale. Key rate is modelled as log(key rate), since it falls off exponentially
+with fibre length.
+
+A point where no run produced a key is censored: it enters as a floor observation, the
+log of the detection floor (one key bit over the simulated duration of all its runs)
+with a large variance and a QBER of 1/2, so `suggest` sees it as explored instead of
+picking it again and again.
+"""
+import math
+
+import numpy as np
+
+
+
+PARAMS = ("fibreLen", "sourceFreq", "photonCount", "qSpeed")
+LOG_PARAMS = ("sourceFreq", "photonCount")
+
+DEFAULT_BOUNDS = {
+    "fibreLen":    (1, 100),
+    "sourceFreq":  (1e6, 1e9),
+    "photonCount": (256, 8192),
+    "qSpeed":      (0.6, 0.9),
+}
+
+# noise variances of a floor observation: it only bounds the log key rate from above and
+# says nothing about the QBER
+FLOOR_LOG_VAR  = 4.
+FLOOR_QBER_VAR = 0.25
+
+
+def run_duration(protocols):
+    """
+    Simulated duration in ns of a finished run, from the dict of protocols a run hook is
+    given: the latest end_time of its protocols, or the simulation time reached if none
+    finished (e.g. an MDI run that timed out). Runs start at time 0 after ns.sim_reset.
+    """
+    ends = [p.end_time for p in protocols.values() if getattr(p, "end_time", None) is not None]
+    if ends:
+        return max(ends)
+    import netsquid as ns
+    return ns.sim_time(magnitude=ns.NANOSECOND)
+
+
+def detection_floor(durations):
+    """
+    Key rate in bits/s of a single key bit over runs lasting `durations` ns in total
+    (see `run_duration`), the lowest rate a point can show. The durations include fibre
+    propagation and the classical round trips, which dominate at long distances.
+    """
+    return 1e9 / sum(durations)
+
+
+class GaussianProcess:
+    """
+    Zero-mean GP regression on standardised targets.
+
+    Attributes:
+        length_scales   per-dimension length scale (in unit-cube coordinates)
+        signal_var      prior variance of the standardised target
+        jitter          variance added to the diagonal for numerical stability
+    """
+    def __init__(self, lengthScales=None, signalVar=1., jitter=1e-8):
+        self.length_scales = None if lengthScales is None else np.asarray(lengthScales, dtype=float)
+        self.signal_var    = signalVar
+        self.jitter        = jitter
+
+
+    def kernel(self, A, B):
+        d = (A[:, None, :] - B[None, :, :]) / self.length_scales
+        return self.signal_var * np.exp(-0.5 * (d ** 2).sum(axis=2))
+
+
+    def _factor(self, X, noise):
+        K = self.kernel(X, X) + np.diag(noise + self.jitter)
+        return np.linalg.cholesky(K)
+
+
+    def log_marginal_likelihood(self, X, y, noise):
+        try:
+            L = self._factor(X, noise)
+        except np.linalg.LinAlgError:
+            return -np.inf
+        alpha = np.linalg.solve(L.T, np.linalg.solve(L, y))
+        return float(-0.5 * y @ alpha - np.log(np.diag(L)).sum() - 0.5 * len(y) * math.log(2 * math.pi))
+
+
+    def fit(self, X, y, noise=None, scales=(0.1, 0.2, 0.35, 0.5, 0.75, 1., 1.5, 2.5)):
+        """
+        Fit to unit-cube inputs X (n, d), targets y (n,) with per-point noise variances.
+
+        Without fixed length scales, a shared scale is picked from `scales` by marginal
+        likelihood and then refined one dimension at a time (a coarse ARD fit that needs
+        no optimiser).
+        """
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.y_mean = y.mean()
+        self.y_std  = y.std() if y.std() > 0 else 1.
+        ys = (y - self.y_mean) / self.y_std
+        noise = np.zeros(len(y)) if noise is None else np.asarray(noise, dtype=float) / self.y_std ** 2
+
+        if self.length_scales is None:
+            d = X.shape[1]
+            best = max(scales, key=lambda s: self._lml_with(np.full(d, s), X, ys, noise))
+            ls = np.full(d, best)
+            for j in range(d):
+                def trial(s, j=j):
+                    t = ls.copy()
+                    t[j] = s
+                    return self._lml_with(t, X, ys, noise)
+                ls[j] = max(scales + (10.,), key=trial)
+            self.length_scales = ls
+
+        self.X, self.noise = X, noise
+        self.L = self._factor(X, noise)
+        self.alpha = np.linalg.solve(self.L.T, np.linalg.solve(self.L, ys))
+        return self
+
+
+    def _lml_with(self, ls, X, y, noise):
+        self.length_scales = ls
+        return self.log_marginal_likelihood(X, y, noise)
+
+
+    def predict(self, Xq):
+        """
+        Returns:
+            (mean, std) arrays of the latent function at unit-cube points Xq
+        """
+        Xq = np.atleast_2d(np.asarray(Xq, dtype=float))
+        Ks = self.kernel(Xq, self.X)
+        mean = Ks @ self.alpha
+        v = np.linalg.solve(self.L, Ks.T)
+        var = np.maximum(self.signal_var - (v ** 2).sum(axis=0), 0)
+        return mean * self.y_std + self.y_mean, np.sqrt(var) * self.y_std
+
+
+class Surrogate:
+    """
+    Surrogate of one protocol's key rate and QBER over simulation parameters.
+
+    Attributes:
+        params      names of the varied parameters (subset of PARAMS)
+        bounds      parameter -> (low, high)
+        points      observed parameter dicts
+        obs         target -> list of (value, noise variance)
+        censored    per point, whether it is a floor observation of a point without a key
+        models      target -> fitted GaussianProcess
+    """
+    TARGETS = ("log_key_rate", "qber")
+
+    def __init__(self, params=PARAMS, bounds=None):
+        self.params = tuple(params)
+        self.bounds = dict(DEFAULT_BOUNDS, **(bounds or {}))
+        self.points = []
+        self.obs    = {t: [] for t in self.TARGETS}
+        self.censored = []
+        self.models = {}
+
+
+    def to_unit(self, points):
+        """Map parameter dicts onto the unit cube."""
+        out = np.empty((len(points), len(self.params)))
+        for j, name in enumerate(self.params):
+            lo, hi = self.bounds[name]
+            v = np.array([p[name] for p in points], dtype=float)
+            if name in LOG_PARAMS:
+                v, lo, hi = np.log(v), math.log(lo), math.log(hi)
+            out[:, j] = (v - lo) / (hi - lo)
+        return out
+
+
+    def from_unit(self, U):
+        points = []
+        for u in np.atleast_2d(U):
+            p = {}
+            for j, name in enumerate(self.params):
+                lo, hi = self.bounds[name]
+                if name in LOG_PARAMS:
+                    p[name] = math.exp(math.log(lo) + u[j] * (math.log(hi) - math.log(lo)))
+                else:
+                    p[name] = float(lo + u[j] * (hi - lo))
+            if "photonCount" in p:
+                p["photonCount"] = int(round(p["photonCount"]))
+            points.append(p)
+        return points
+
+
+    def add(self, point, logKeyRate, logKeyRateVar, qber, qberVar, censored=False):
+        """Add one reduced observation (values with their noise variances)."""
+        self.points.append({name: point[name] for name in self.params})
+        self.obs["log_key_rate"].append((logKeyRate, logKeyRateVar))
+        self.obs["qber"].append((qber, qberVar))
+        self.censored.append(censored)
+        self.models = {}
+
+
+    def add_floor(self, point, floorRate):
+        """
+        Add a point where no run produced a key as a floor observation at key rate
+        `floorRate` (see `detection_floor`).
+        """
+        self.add(point, math.log(floorRate), FLOOR_LOG_VAR, 0.5, FLOOR_QBER_VAR, censored=True)
+
+
+    def add_results(self, point, KeyListA, KeyListB, KeyRateList):
+        """
+        Reduce raw run-function output at `point` to one observation. Failed runs and
+        runs without a key are left out.
+        """
+        done = [i for i, k in enumerate(KeyListA)
+                if not isinstance(k, str) and len(k) and not isinstance(KeyRateList[i], str) and KeyRateList[i] > 0]
+        if not done:
+            raise ValueError(f"no completed runs with a key at {point}")
+        logs = np.log([KeyRateList[i] for i in done])
+        # a single run gives no spread: fall back to a nominal 10% rate uncertainty
+        log_var = logs.var(ddof=1) / len(logs) if len(logs) > 1 else 0.01
+        lengths = [min(len(KeyListA[i]), len(KeyListB[i])) for i in done]
+        errors = sum(int(np.count_nonzero(np.asarray(KeyListA[i][:m]) != np.asarray(KeyListB[i][:m])))
+                     for i, m in zip(done, lengths))
+        bits = sum(lengths)
+        q = errors / bits
+        # floor keeps a zero-error point from being treated as exact
+        q_var = max(q * (1 - q), 1 / bits) / bits
+        self.add(point, float(logs.mean()), log_var, q, q_var)
+
+
+    def fit(self):
+        if len(self.points) < 2:
+            raise ValueError("need at least two observed points to fit a surrogate")
+        X = self.to_unit(self.points)
+        for target in self.TARGETS:
+            y, noise = np.array(self.obs[target]).T
+            self.models[target] = GaussianProcess().fit(X, y, noise)
+        return self
+
+
+    def predict(self, points):
+        """
+        Returns:
+            dict with key_rate, key_rate_low/high (+-1 sd band, from the log model),
+            log_key_rate(_std), qber and qber_std arrays for the given parameter dicts
+        """
+        if not self.models:
+            self.fit()
+        U = self.to_unit(points)
+        m, s = self.models["log_key_rate"].predict(U)
+        q, qs = self.models["qber"].predict(U)
+        return {"key_rate": np.exp(m), "key_rate_low": np.exp(m - s), "key_rate_high": np.exp(m + s),
+                "log_key_rate": m, "log_key_rate_std": s, "qber": q, "qber_std": qs}
+
+
+    def suggest(self, n=1, target="log_key_rate", candidates=2048, fixed=None, rng=None):
+        """
+        Pick `n` new points where the surrogate is least certain.
+
+        Each pick maximises the predictive standard deviation of `target` over random
+        candidates; it is then added as a pseudo-observation (the GP variance does not
+        depend on the observed value), so the next pick moves elsewhere. Floor observations
+        count as explored as well as any other point here, whatever their variance.
+
+        Parameters:
+            fixed       parameter -> value held constant for all candidates
+        """
+        if not self.models:
+            self.fit()
+        rng = np.random.RandomState(0) if rng is None else rng
+        U = rng.random_sample((candidates, len(self.params)))
+        for name, value in (fixed or {}).items():
+            j = self.params.index(name)
+            U[:, j] = self.to_unit([self._fill(name, value)])[0, j]
+
+        gp = self.models[target]
+        X, noise = gp.X, gp.noise.copy()
+        censored = np.asarray(self.censored, dtype=bool)
+        typical = np.median(noise[~censored]) if (~censored).any() else 0.
+        noise[censored] = typical
+        picks = []
+        for _ in range(n):
+            trial = GaussianProcess(gp.length_scales, gp.signal_var, gp.jitter)
+            trial.y_mean, trial.y_std = gp.y_mean, gp.y_std
+            trial.X, trial.L = X, trial._factor(X, noise)
+            trial.alpha = np.zeros(len(X))
+            _, std = trial.predict(U)
+            best = int(np.argmax(std))
+            picks.append(U[best])
+            X = np.vstack([X, U[best]])
+            noise = np.append(noise, typical)
+        return self.from_unit(np.array(picks))
+
+
+    def _fill(self, name, value):
+        p = {k: self.bounds[k][0] for k in self.params}
+        p[name] = value
+        return p
+
+
+def adaptive_sweep(protocol="bb84", budget=10, params=("fibreLen",), bounds=None, initial=None,
+                   runtimes=5, seed=0, **runKwargs):
+    """
+    Explore the parameter space by simulating where the surrogate is least certain.
+
+    Parameters:
+        protocol    "bb84" or "mdi"
+        budget      total number of parameter points to simulate
+        params      parameters to vary (the rest come from `runKwargs` or the run defaults)
+        bounds      parameter -> (low, high), overriding DEFAULT_BOUNDS
+        initial     starting points (default: len(params) + 2 random points)
+        runtimes    simulation runs per point
+        seed        seed of the candidate sampling
+        runKwargs   passed to the run function at every point (noise, formalism, ...)
+
+    Returns:
+        (fitted Surrogate, list of points where no run produced a key); those points are
+        in the surrogate as floor observations
+    """
+    if protocol == "bb84":
+        from BB84.BB84_run import run_BB84_sims as run
+    else:
+        from MDI.mdiRun import run_mdi_sims as run
+
+    surrogate = Surrogate(params, bounds)
+    rng = np.random.RandomState(seed)
+    if initial is None:
+        initial = surrogate.from_unit(rng.random_sample((len(params) + 2, len(params))))
+
+    failed = []
+    def evaluate(point):
+        durations = []
+        hook = lambda prots: durations.append(run_duration(prots))
+        KeyListA, KeyListB, KeyRateList = run(runtimes=runtimes, runHook=hook, **dict(runKwargs, **point))
+        try:
+            surrogate.add_results(point, KeyListA, KeyListB, KeyRateList)
+        except ValueError:
+            failed.append(point)
+            surrogate.add_floor(point, detection_floor(durations))
+
+    for point in initial[:budget]:
+        evaluate(point)
+    for _ in range(budget - min(len(initial), budget)):
+        if len(surrogate.points) < 2:
+            point = surrogate.from_unit(rng.random_sample((1, len(params))))[0]
+        else:
+            point = surrogate.suggest(1, rng=rng)[0]
+        evaluate(point)
+
+    return surrogate.fit(), failed
@@ -0,0 +1,192 @@
+"""
+Columnar per-photon traces.
+
+A trace directory holds one flat binary column file per field (`<column>.bin`) that every
+run appends to in bulk, one write per column per frame, plus:
+
+    meta.json   protocol, column dtypes
+    runs.bin    int64 (offset, length, completed) per run, indexing into the columns
+
+Columns are raw little-endian arrays, so TraceReader memory-maps them and analyses over
+millions of photons only page in what they touch.
+
+BB84 columns: slot, emit_time_ns, alice_basis, alice_bit, bob_basis, bob_outcome,
+              click, kept
+MDI columns:  slot, emit_time_ns, alice_basis, alice_bit, bob_basis, bob_bit, bsm, kept
+
+Outcomes missing from a run (photons never measured, MDI runs that timed out) are -1
+(`bob_outcome`) or -2 (`bsm`); `click` is True throughout when Bob has no detector model.
+"""
+import json
+import os
+
+import numpy as np
+
+
+
+COLUMNS = {
+    "bb84": {"slot": "<i8", "emit_time_ns": "<f8", "alice_basis": "i1", "alice_bit": "i1",
+             "bob_basis": "i1", "bob_outcome": "i1", "click": "?", "kept": "?"},
+    "mdi":  {"slot": "<i8", "emit_time_ns": "<f8", "alice_basis": "i1", "alice_bit": "i1",
+             "bob_basis": "i1", "bob_bit": "i1", "bsm": "i1", "kept": "?"},
+}
+
+
+def _padded(values, n, fill):
+    out = np.full(n, fill, dtype=np.int8)
+    values = np.asarray(values, dtype=np.int8)[:n]
+    out[:len(values)] = values
+    return out
+
+
+class TraceWriter:
+    """
+    Append per-photon records of every run to a trace directory.
+
+    Instances are callables taking a run's protocol dict, so they can be passed as the
+    `runHook` of run_BB84_sims / run_mdi_sims directly. Opening an existing trace of the
+    same protocol appends to it.
+
+    Attributes:
+        directory   trace directory
+        protocol    "bb84" or "mdi"
+        n_runs      runs written so far (including earlier sessions)
+        n_photons   photon records written so far
+    """
+    def __init__(self, directory, protocol):
+        if protocol not in COLUMNS:
+            raise ValueError(f"unknown protocol '{protocol}', expected one of {sorted(COLUMNS)}")
+        self.directory = directory
+        self.protocol  = protocol
+        self.columns   = COLUMNS[protocol]
+        os.makedirs(directory, exist_ok=True)
+
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["protocol"] != protocol:
+                raise ValueError(f"{directory} holds a {meta['protocol']} trace, not {protocol}")
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"protocol": protocol, "columns": self.columns}, f, indent=2)
+
+        runs = np.fromfile(os.path.join(directory, "runs.bin"), dtype="<i8").reshape(-1, 3) \
+            if os.path.exists(os.path.join(directory, "runs.bin")) else np.zeros((0, 3), dtype="<i8")
+        self.n_runs    = len(runs)
+        self.n_photons = int(runs[-1, 0] + runs[-1, 1]) if len(runs) else 0
+
+        self._files = {name: open(os.path.join(directory, f"{name}.bin"), "ab") for name in self.columns}
+        self._runs  = open(os.path.join(directory, "runs.bin"), "ab")
+
+
+    def write_frame(self, columns, completed=True):
+        """
+        Append one run's columns (dict of equal-length arrays) in one write per column.
+        """
+        lengths = {len(v) for v in columns.values()}
+        if len(lengths) != 1 or set(columns) != set(self.columns):
+            raise ValueError(f"expected equal-length columns {sorted(self.columns)}")
+        n = lengths.pop()
+        for name, dtype in self.columns.items():
+            self._files[name].write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+        self._runs.write(np.array([self.n_photons, n, int(completed)], dtype="<i8").tobytes())
+        self.n_runs    += 1
+        self.n_photons += n
+
+
+    def __call__(self, protocols):
+        alice, bob = protocols["alice"], protocols["bob"]
+        n = alice.photon_count
+        slot = np.arange(n)
+        kept = np.zeros(n, dtype=bool)
+        kept[np.asarray(alice.mask, dtype=np.int64)] = True
+        cols = {"slot": slot, "emit_time_ns": slot * 1e9 / alice.source_freq,
+                "alice_basis": _padded(alice.basis_list, n, -1), "alice_bit": _padded(alice.bit_list, n, -1),
+                "bob_basis": _padded(bob.basis_list, n, -1), "kept": kept}
+
+        if self.protocol == "bb84":
+            cols["bob_outcome"] = _padded(bob.meas_results, n, -1)
+            cols["click"] = _padded(bob.clicks, n, 0).astype(bool) if len(bob.clicks) else np.ones(n, dtype=bool)
+            completed = bob.end_time is not None
+        else:
+            cols["bob_bit"] = _padded(bob.bit_list, n, -1)
+            cols["bsm"] = _padded(protocols["charlie"].meas, n, -2)
+            completed = alice.end_time is not None and bob.end_time is not None
+            if not completed:
+                cols["kept"][:] = False
+        self.write_frame(cols, completed)
+
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._runs.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TraceReader:
+    """
+    Memory-mapped read access to a trace directory.
+
+    Attributes:
+        protocol    "bb84" or "mdi"
+        columns     dict of column name -> dtype string
+        runs        (n_runs, 3) int64 array of (offset, length, completed)
+        n_photons   total photon records
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.protocol  = meta["protocol"]
+        self.columns   = meta["columns"]
+        path = os.path.join(directory, "runs.bin")
+        self.runs = np.fromfile(path, dtype="<i8").reshape(-1, 3) if os.path.exists(path) else np.zeros((0, 3), dtype="<i8")
+        self.n_photons = int(self.runs[-1, 0] + self.runs[-1, 1]) if len(self.runs) else 0
+        self._maps = {}
+
+
+    def __len__(self):
+        return len(self.runs)
+
+
+    def column(self, name):
+        """Whole column as a read-only memmap (nothing is loaded until indexed)."""
+        if name not in self._maps:
+            if name not in self.columns:
+                raise KeyError(f"no column '{name}', expected one of {sorted(self.columns)}")
+            if self.n_photons == 0:
+                return np.zeros(0, dtype=self.columns[name])
+            self._maps[name] = np.memmap(os.path.join(self.directory, f"{name}.bin"),
+                                         dtype=self.columns[name], mode="r", shape=(self.n_photons,))
+        return self._maps[name]
+
+
+    def run(self, i, columns=None):
+        """
+        Records of run `i` as a dict of memmap views.
+        """
+        offset, length, _ = self.runs[i]
+        return {name: self.column(name)[offset:offset + length] for name in (columns or self.columns)}
+
+
+    def run_index(self):
+        """Run number of every photon record (materialised; int32 per record)."""
+        return np.repeat(np.arange(len(self.runs), dtype=np.int32), self.runs[:, 1])
+
+
+    def iter_chunks(self, columns=None, chunk=1 << 20):
+        """
+        Yield dicts of column views of at most `chunk` records, for streaming analyses.
+        """
+        names = columns or list(self.columns)
+        for start in range(0, self.n_photons, chunk):
+            yield {name: self.column(name)[start:start + chunk] for name in names}
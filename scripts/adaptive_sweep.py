@@ -0,0 +1,80 @@
+"""
+Adaptive Sweep
+==============
+Explores key rate and QBER over fibre length (and optionally source frequency, photon
+count and speed) by simulating where a Gaussian-process surrogate is least certain
+instead of on a dense grid (see lib.surrogate), then prints surrogate predictions with
+uncertainty on a fine grid of fibre lengths.
+
+Usage:
+    python scripts/adaptive_sweep.py [--protocol {bb84,mdi}] [--budget N] [--runtimes N]
+                                     [--params P [P ...]] [--photons N] [--freq F]
+                                     [--fibre-max F] [--format {text,json,csv}]
+"""
+
+import argparse
+import sys
+import os
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import report
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Uncertainty-driven parameter sweep with a GP surrogate.")
+    parser.add_argument("--protocol",  type=str,   default="bb84", choices=["bb84", "mdi"])
+    parser.add_argument("--budget",    type=int,   default=8,      help="Parameter points to simulate")
+    parser.add_argument("--runtimes",  type=int,   default=5,      help="Simulation runs per point")
+    parser.add_argument("--params",    type=str,   nargs="+", default=["fibreLen"],
+                        choices=["fibreLen", "sourceFreq", "photonCount", "qSpeed"], help="Parameters to vary")
+    parser.add_argument("--photons",   type=int,   default=1024,   help="Photons per run (if not varied)")
+    parser.add_argument("--freq",      type=float, default=1e7,    help="Source frequency in Hz (if not varied)")
+    parser.add_argument("--fibre-max", type=float, default=100,    help="Upper fibre length bound in km")
+    parser.add_argument("--format",    type=str,   default="text", choices=["text", "json", "csv"])
+    args = parser.parse_args()
+
+    from lib.surrogate import adaptive_sweep
+
+    fixed = {"photonCount": args.photons, "sourceFreq": args.freq, "fibreLen": 1}
+    fixed = {k: v for k, v in fixed.items() if k not in args.params}
+    surrogate, failed = adaptive_sweep(args.protocol, budget=args.budget, params=args.params,
+                                       bounds={"fibreLen": (1, args.fibre_max)},
+                                       runtimes=args.runtimes, **fixed)
+
+    # predictions along fibre length, other varied parameters at their bound midpoints
+    grid = []
+    for i in range(11):
+        point = {name: 0.5 for name in surrogate.params}
+        if "fibreLen" in point:
+            point["fibreLen"] = i / 10
+        grid.append(point)
+    points = surrogate.from_unit(np.array([[p[n] for n in surrogate.params] for p in grid]))
+    pred = surrogate.predict(points)
+    records = [dict(p, key_rate=float(pred["key_rate"][i]), key_rate_low=float(pred["key_rate_low"][i]),
+                    key_rate_high=float(pred["key_rate_high"][i]), qber=float(pred["qber"][i]),
+                    qber_std=float(pred["qber_std"][i])) for i, p in enumerate(points)]
+
+    if args.format != "text":
+        report.write_records(records, args.format)
+        return
+
+    print()
+    print("=" * 65)
+    print(f"  {args.protocol.upper()} surrogate from {len(surrogate.points)} simulated points ({len(failed)} without a key)")
+    print("=" * 65)
+    for p, censored in zip(surrogate.points, surrogate.censored):
+        print(("  no key:    " if censored else "  simulated: ") + ", ".join(f"{k}={v:.4g}" for k, v in p.items()))
+    print("-" * 65)
+    for r in records:
+        where = ", ".join(f"{k}={r[k]:.4g}" for k in surrogate.params)
+        print(f"  {where:<30} | key_rate {r['key_rate']:.4g} [{r['key_rate_low']:.4g}, {r['key_rate_high']:.4g}]"
+              f" | QBER {r['qber']*100:.2f}% +- {r['qber_std']*100:.2f}%")
+    print("=" * 65)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Formalism Benchmark
+===================
+Times the BB84 and MDI-QKD simulations under every state formalism (netsquid's ket, dm,
+stab and gslc, plus the batched lib.tableau engine) so the fastest exact backend can be
+picked per protocol.
+
+Usage:
+    python scripts/bench_formalism.py [--runtimes N] [--photons N [N ...]] [--fibre F]
+                                      [--formalisms F [F ...]] [--format {text,json,csv}]
+"""
+
+import argparse
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import report
+
+
+
+def bench(protocol, formalism, runtimes, photons, fibre):
+    if protocol == "BB84":
+        from BB84.BB84_run import run_BB84_sims as run
+    else:
+        from MDI.mdiRun import run_mdi_sims as run
+
+    start = time.perf_counter()
+    aggregator = run(runtimes=runtimes, fibreLen=fibre, photonCount=photons,
+                     formalism=formalism, summaryOnly=True)
+    elapsed = time.perf_counter() - start
+
+    rec = {"protocol": protocol, "formalism": formalism, "photons": photons,
+           "runtimes": runtimes, "seconds": elapsed, "seconds_per_run": elapsed / runtimes}
+    rec.update(report.aggregator_summary(aggregator, photonCount=photons))
+    return rec
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark state formalisms for the QKD simulations.")
+    parser.add_argument("--runtimes",   type=int,   default=5,     help="Simulation runs per point")
+    parser.add_argument("--photons",    type=int,   nargs="+",     default=[256, 1024, 4096], help="Photons per run")
+    parser.add_argument("--fibre",      type=float, default=1,     help="Fibre length in km")
+    parser.add_argument("--formalisms", type=str,   nargs="+",     default=["ket", "dm", "stab", "gslc", "tableau"])
+    parser.add_argument("--format",     type=str,   default="text", choices=["text", "json", "csv"])
+    args = parser.parse_args()
+
+    records = []
+    for protocol in ("BB84", "MDI"):
+        for photons in args.photons:
+            for formalism in args.formalisms:
+                records.append(bench(protocol, formalism, args.runtimes, photons, args.fibre))
+
+    if args.format != "text":
+        report.write_records(records, args.format)
+        return
+
+    print()
+    print("=" * 65)
+    print("  Formalism benchmark (seconds per run)")
+    print("=" * 65)
+    for r in records:
+        print(f"  {r['protocol']:<5} {r['formalism']:<8} photons={r['photons']:>6} | "
+              f"{r['seconds_per_run']:.4f} s | QBER={r['avg_qber']*100:.2f}%")
+    print("-" * 65)
+    for protocol in ("BB84", "MDI"):
+        for photons in args.photons:
+            rows = [r for r in records if r["protocol"] == protocol and r["photons"] == photons]
+            best = min(rows, key=lambda r: r["seconds_per_run"])
+            print(f"  Fastest for {protocol:<5} at {photons:>6} photons: {best['formalism']}")
+    print("=" * 65)
+
+
+if __name__ == "__main__":
+    main()
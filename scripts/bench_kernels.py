@@ -0,0 +1,109 @@
+"""
+Kernel Benchmark
+================
+Times the classical post-processing kernels of lib.kernels (sifting, basis mismatch,
+MDI flip, discard/compress and error counting) for every available backend against the
+pure-Python loops they replace, and checks that all backends agree.
+
+Usage:
+    python scripts/bench_kernels.py [--sizes N [N ...]] [--repeats R] [--format {text,json,csv}]
+"""
+
+import argparse
+import sys
+import os
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import kernels, report
+
+
+
+def python_reference(name, args):
+    """The list-comprehension / loop versions used by the protocols before lib.kernels."""
+    if name == "sift":
+        a, b, v = (x.tolist() for x in args)
+        mask = [i for i, x in enumerate(b) if x == a[i]]
+        return mask, [bit for i, bit in enumerate(v) if a[i] == b[i]]
+    if name == "mismatch":
+        a, b = (x.tolist() for x in args)
+        return [i for i, x in enumerate(a) if x != b[i]]
+    if name == "mdi_flip":
+        key, bases, meas, keep = (x.tolist() for x in args)
+        for i, m in enumerate(meas):
+            if keep[i] and m != 0 and (bases[i] == 0 or m == -1):
+                key[i] = (key[i] + 1) % 2
+        return key
+    if name == "compress":
+        v, keep = (x.tolist() for x in args)
+        return [b for i, b in enumerate(v) if keep[i]], [i for i in range(len(v)) if keep[i]]
+    a, b = (x.tolist() for x in args)
+    return sum(x != y for x, y in zip(a, b))
+
+
+def make_inputs(n, rng):
+    bits  = lambda: rng.randint(0, 2, size=n).astype(np.int8)
+    meas  = rng.choice(np.array([-1, 0, 1], dtype=np.int8), size=n)
+    keep  = rng.random_sample(n) < 0.5
+    return {"sift":         (bits(), bits(), bits()),
+            "mismatch":     (bits(), bits()),
+            "mdi_flip":     (bits(), bits(), meas, keep),
+            "compress":     (bits(), keep),
+            "count_errors": (bits(), bits())}
+
+
+def as_plain(result):
+    if isinstance(result, tuple):
+        return tuple(as_plain(r) for r in result)
+    return np.asarray(result).tolist()
+
+
+def timed(fn, args, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the lib.kernels backends.")
+    parser.add_argument("--sizes",   type=int, nargs="+", default=[1024, 16384, 262144], help="Array lengths")
+    parser.add_argument("--repeats", type=int, default=5, help="Timing repetitions (best is kept)")
+    parser.add_argument("--format",  type=str, default="text", choices=["text", "json", "csv"])
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    records = []
+    for n in args.sizes:
+        inputs = make_inputs(n, rng)
+        for name in kernels.KERNEL_NAMES:
+            t_ref, expected = timed(lambda *a: python_reference(name, a), inputs[name], args.repeats)
+            for backend, impls in kernels.KERNELS.items():
+                impls[name](*inputs[name])      # warm-up (JIT compilation)
+                t, result = timed(impls[name], inputs[name], args.repeats)
+                records.append({"kernel": name, "backend": backend, "size": n, "seconds": t,
+                                "python_seconds": t_ref, "speedup": t_ref / t if t else float('nan'),
+                                "matches": as_plain(result) == as_plain(expected)})
+
+    if args.format != "text":
+        report.write_records(records, args.format)
+        return
+
+    print()
+    print("=" * 65)
+    print(f"  Kernel benchmark (default backend: {kernels.BACKEND})")
+    print("=" * 65)
+    for r in records:
+        ok = "ok" if r["matches"] else "MISMATCH"
+        print(f"  {r['kernel']:<13} {r['backend']:<6} n={r['size']:>7} | {r['seconds']*1e6:>10.1f} us | "
+              f"{r['speedup']:>7.1f}x vs Python | {ok}")
+    print("=" * 65)
+
+
+if __name__ == "__main__":
+    main()
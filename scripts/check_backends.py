@@ -0,0 +1,107 @@
+"""
+Backend Equivalence Check
+=========================
+Runs the netsquid reference path and alternative backends on independent seeds over a grid of
+fibre lengths and noise models, and tests key length, QBER, per-basis outcome and (MDI)
+Bell state measurement frequencies for statistical agreement (see lib.equivalence).
+A fast backend should pass before it is used for production runs. With --fast-noise only
+the classical fast noise path is checked against per-qubit noise, for every noise model.
+With --detector only the detector model's afterpulse rate is checked, with and without
+dead time.
+
+Usage:
+    python scripts/check_backends.py [--protocol {bb84,mdi,both}] [--backends B [B ...]]
+                                     [--fast-noise] [--detector] [--runtimes N] [--photons N] [--seed S] [--alpha A]
+                                     [--format {text,json,csv}]
+
+Exits with status 1 if any backend fails a grid point, and with status 2 if none fails
+but a backend was skipped at a grid point it does not support.
+"""
+
+import argparse
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import report
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check simulation backends against the netsquid reference.")
+    parser.add_argument("--protocol", type=str,   default="both", choices=["bb84", "mdi", "both"])
+    parser.add_argument("--backends", type=str,   nargs="+", default=["stab", "tableau", "fast-noise"])
+    parser.add_argument("--fast-noise", action="store_true",   help="Check fastNoise=True against per-qubit noise for every noise model")
+    parser.add_argument("--detector", action="store_true",   help="Check the detector model's afterpulse rate at several dead times")
+    parser.add_argument("--runtimes", type=int,   default=20,    help="Runs per backend and grid point")
+    parser.add_argument("--photons",  type=int,   default=512,   help="Photons per run")
+    parser.add_argument("--seed",     type=int,   default=1234,  help="Base seed (grid point i uses seed + i)")
+    parser.add_argument("--alpha",    type=float, default=0.01,  help="Significance level per grid point and backend")
+    parser.add_argument("--format",   type=str,   default="text", choices=["text", "json", "csv"])
+    args = parser.parse_args()
+
+    from lib.equivalence import afterpulse_check, equivalence_harness, fast_noise_check
+
+    if args.detector:
+        check_detector(afterpulse_check(seed=args.seed, alpha=args.alpha), args)
+
+    protocols = ["bb84", "mdi"] if args.protocol == "both" else [args.protocol]
+    records = []
+    for protocol in protocols:
+        if args.fast_noise:
+            records += fast_noise_check(protocol, runtimes=args.runtimes, photonCount=args.photons,
+                                        seed=args.seed, alpha=args.alpha)
+            continue
+        records += equivalence_harness(protocol, backends=args.backends, runtimes=args.runtimes,
+                                       photonCount=args.photons, seed=args.seed, alpha=args.alpha)
+
+    failed  = [r for r in records if r["passed"] is False]
+    skipped = [r for r in records if r["passed"] is None]
+    status  = 1 if failed else 2 if skipped else 0
+
+    if args.format != "text":
+        report.write_records(records, args.format)
+        sys.exit(status)
+
+    print()
+    print("=" * 65)
+    print("  Backend equivalence (reference: netsquid ket)")
+    print("=" * 65)
+    for r in records:
+        point = f"{r['fibre_km']:g} km" + (f" {r['noise']}" if r["noise"] else "")
+        if r["passed"] is None:
+            print(f"  {r['protocol']:<5} {r['backend']:<11} {point:<16} | skipped: {r['skipped']}")
+            continue
+        verdict = "PASS" if r["passed"] else "FAIL"
+        print(f"  {r['protocol']:<5} {r['backend']:<11} {point:<16} | {verdict} min p={r['min_p']:.3g} | "
+              f"QBER {r['qber_ref']*100:.2f}% vs {r['qber_cand']*100:.2f}% | {r['speedup']:.2f}x")
+    print("-" * 65)
+    print(f"  {len(records) - len(failed) - len(skipped)} passed, {len(failed)} failed, {len(skipped)} skipped")
+    print("=" * 65)
+    sys.exit(status)
+
+
+def check_detector(records, args):
+    failed = [r for r in records if not r["passed"]]
+    if args.format != "text":
+        report.write_records(records, args.format)
+        sys.exit(1 if failed else 0)
+
+    print()
+    print("=" * 65)
+    print("  Detector afterpulsing (expected noise fraction of clicks)")
+    print("=" * 65)
+    for r in records:
+        verdict = "PASS" if r["passed"] else "FAIL"
+        print(f"  dead time {r['dead_time_ns']:>6g} ns | {verdict} p={r['p']:.3g} | "
+              f"{r['noise_clicks']}/{r['clicks']} noise clicks, {r['observed_fraction']*100:.2f}% vs "
+              f"{r['expected_fraction']*100:.2f}% expected")
+    print("-" * 65)
+    print(f"  {len(records) - len(failed)} passed, {len(failed)} failed")
+    print("=" * 65)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Key Server
+==========
+Serves a key store written by `qkd-sim ... --key-store DIR` (see lib.keystore) over
+ETSI GS QKD 014 style HTTP endpoints, or load-tests key consumers against Alice's and
+Bob's stores: the master side takes keys with get_key, the slave side fetches the same
+key_IDs with get_key_with_id, and the matching keys are compared.
+
+Usage:
+    python scripts/key_server.py serve DIR [--host H] [--port P]
+    python scripts/key_server.py bench DIR --link LINK [--requests N] [--batch K] [--http]
+                                       [--format {text,json,csv}]
+
+`bench` takes keys from DIR/alice and DIR/bob (in process, or through two local servers
+with --http) and reports keys per second and the number of mismatching key pairs.
+"""
+
+import argparse
+import base64
+import json
+import sys
+import os
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import report
+from lib.keystore import KeyStore, make_server
+
+
+
+def serve(args):
+    store = KeyStore(args.directory)
+    server = make_server(store, args.host, args.port)
+    print(f"Serving {args.directory} ({store.n_keys} keys, links: {', '.join(store.links) or 'none'}) "
+          f"on http://{server.server_address[0]}:{server.server_address[1]}/api/v1/keys/<link>/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        store.close()
+
+
+def bench(args):
+    alice = KeyStore(os.path.join(args.directory, "alice"))
+    bob   = KeyStore(os.path.join(args.directory, "bob"))
+    requests = min(args.requests, alice.available(args.link) // args.batch)
+
+    if args.http:
+        servers = [make_server(s) for s in (alice, bob)]
+        for server in servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        urls = [f"http://127.0.0.1:{s.server_address[1]}/api/v1/keys/{args.link}" for s in servers]
+
+        def post(url, body):
+            req = urllib.request.Request(url, json.dumps(body).encode(), {"Content-Type": "application/json"})
+            with urllib.request.urlopen(req) as resp:
+                return [(k["key_ID"], base64.b64decode(k["key"])) for k in json.load(resp)["keys"]]
+
+        master = lambda: post(urls[0] + "/enc_keys", {"number": args.batch})
+        slave  = lambda ids: post(urls[1] + "/dec_keys", {"key_IDs": [{"key_ID": k} for k in ids]})
+    else:
+        master = lambda: alice.get_key(args.link, args.batch)
+        slave  = lambda ids: bob.get_key_with_id(args.link, ids)
+
+    mismatched = 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        keys = master()
+        peer = slave([key_id for key_id, _ in keys])
+        mismatched += sum(bytes(a) != bytes(b) for (_, a), (_, b) in zip(keys, peer))
+    elapsed = time.perf_counter() - start
+
+    if args.http:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+    alice.close()
+    bob.close()
+
+    n = requests * args.batch
+    return {"link": args.link, "transport": "http" if args.http else "in-process", "batch": args.batch,
+            "keys": n, "seconds": elapsed, "keys_per_second": n / elapsed if elapsed else float('nan'),
+            "mismatched": mismatched}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve or load-test QKD key stores.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_p = sub.add_parser("serve", help="Serve one key store over HTTP")
+    serve_p.add_argument("directory", type=str, help="Key store directory (e.g. DIR/alice)")
+    serve_p.add_argument("--host", type=str, default="127.0.0.1")
+    serve_p.add_argument("--port", type=int, default=8014)
+
+    bench_p = sub.add_parser("bench", help="Pull matching keys from both ends and time it")
+    bench_p.add_argument("directory", type=str, help="Directory holding the alice/ and bob/ stores")
+    bench_p.add_argument("--link",     type=str, required=True, help="Link name, e.g. bb84-100km")
+    bench_p.add_argument("--requests", type=int, default=1000,  help="Request pairs (capped by the keys available)")
+    bench_p.add_argument("--batch",    type=int, default=1,     help="Keys per request")
+    bench_p.add_argument("--http",     action="store_true",     help="Go through local HTTP servers instead of in-process calls")
+    bench_p.add_argument("--format",   type=str, default="text", choices=["text", "json", "csv"])
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        return serve(args)
+
+    res = bench(args)
+    if args.format != "text":
+        report.write_records([res], args.format)
+        return
+    print("=" * 65)
+    print(f"  Key delivery: {res['link']} ({res['transport']}, {res['batch']} keys per request)")
+    print("=" * 65)
+    print(f"  Keys delivered : {res['keys']} in {res['seconds']:.3f} s")
+    print(f"  Throughput     : {res['keys_per_second']:.1f} keys/s")
+    print(f"  Mismatched     : {res['mismatched']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,112 +3,34 @@ MDI-QKD Simulation Runner
 =========================
 Executes the MDI-QKD netsquid simulation and prints performance metrics.
 
+Thin wrapper around `qkd-sim mdi --per-run`; see scripts/qkd_sim.py for all options.
+
 Usage:
     python scripts/mdi_script.py [--runtimes N] [--photons N] [--fibre F] [--freq F] [--speed S]
+                          [--summary] [--key-dir DIR] [--attack NAME] [--intercept-fraction P]
+                          [--noise NAME] [--noise-rate R] [--fast-noise] [--format FMT]
 
 Defaults:
     runtimes    10
     photons     1024
-    fibre       1       (km)
+    fibre       100     (km)
     freq        1e7     (Hz)
     speed       0.8     (fraction of c)
 """
 
-import argparse
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-sys.path.append("MDI/") # For MDI protocols
-
-from MDI.mdiRun import run_mdi_sims
-
-
-def qber(keyA, keyB):
-    """Compute QBER between two key lists."""
-    if not keyA or not keyB:
-        return None
-    length = min(len(keyA), len(keyB))
-    if length == 0:
-        return None
-    errors = sum(a != b for a, b in zip(keyA[:length], keyB[:length]))
-    return errors / length
-
-
-def print_run_summary(run_idx, keyA, keyB, keyRate):
-    """Print per-run metrics."""
-    if keyA != "nan":
-        q = qber(keyA, keyB)
-        q_str = f"{q*100:.2f}%" if q is not None else "N/A"
-        print(f"  MDI run {run_idx+1:>3}:  key_len={len(keyA):>5} | QBER={q_str:>7} | key_rate={keyRate:.4f}")
-    else:
-        print(f"  MDI run {run_idx+1:>3}:  did not complete")
-
-
-def print_aggregate_summary(KeyListA, KeyListB, KeyRateList):
-    """Print aggregate metrics across all runs."""
-    qbers       = []
-    key_rates   = []
-    key_lengths = []
-
-    for i, (keyA, keyB) in enumerate(zip(KeyListA, KeyListB)):
-        q = qber(keyA, keyB)
-        if q is not None and keyA != "nan":
-            qbers.append(q)
-            key_rates.append(KeyRateList[i])
-            key_lengths.append(min(len(keyA), len(keyB)))
-
-    avg_qber     = sum(qbers) / len(qbers) if qbers else float('nan')
-    avg_kr       = sum(key_rates) / len(key_rates) if key_rates else float('nan')
-    avg_key_len  = sum(key_lengths) / len(key_lengths) if key_lengths else float('nan')
-
-    print()
-    print("=" * 65)
-    print("  Aggregate Results")
-    print("=" * 65)
-    print(f"  Runs completed  : {len(qbers)}")
-    print(f"  Avg key length  : {avg_key_len:.1f}")
-    print(f"  Avg QBER        : {avg_qber*100:.2f}%")
-    print(f"  Avg key rate    : {avg_kr:.4f}")
-    print("=" * 65)
-
-
-def main():
-    parser = argparse.ArgumentParser(description="Run MDI-QKD netsquid simulation.")
-    parser.add_argument("--runtimes", type=int,   default=10,    help="Number of simulation runs")
-    parser.add_argument("--photons",  type=int,   default=1024,  help="Photons per run")
-    parser.add_argument("--fibre",    type=float, default=100,   help="Fibre length in km")
-    parser.add_argument("--freq",     type=float, default=1e7,   help="Source frequency in Hz")
-    parser.add_argument("--speed",    type=float, default=0.8,   help="Speed of light fraction")
-    args = parser.parse_args()
 
-    print()
-    print("=" * 65)
-    print("  MDI-QKD Simulation")
-    print("=" * 65)
-    print(f"  Runtimes   : {args.runtimes}")
-    print(f"  Photons    : {args.photons}")
-    print(f"  Fibre      : {args.fibre} km")
-    print(f"  Frequency  : {args.freq:.2e} Hz")
-    print(f"  Speed      : {args.speed}c")
-    print("=" * 65)
-    print()
+from scripts.qkd_sim import main as qkd_main
 
-    KeyListA, KeyListB, KeyRateList = run_mdi_sims(
-        runtimes    = args.runtimes,
-        fibreLen    = args.fibre,
-        photonCount = args.photons,
-        sourceFreq  = args.freq,
-        qSpeed      = args.speed
-    )
 
-    print("\n  Per-run results:")
-    print("-" * 65)
-    for i, (keyA, keyB) in enumerate(zip(KeyListA, KeyListB)):
-        print_run_summary(i, keyA, keyB, KeyRateList[i])
 
-    print_aggregate_summary(KeyListA, KeyListB, KeyRateList)
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    qkd_main(["mdi", "--per-run"] + list(argv))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,549 @@
+"""
+qkd-sim: unified QKD simulation CLI
+===================================
+Runs the BB84 and MDI-QKD netsquid simulations from one entry point.
+
+Usage:
+    qkd-sim bb84    [options]
+    qkd-sim mdi     [options]
+    qkd-sim compare [options]
+    qkd-sim sweep   [options] [--protocol {bb84,mdi,both}] [--fibres F [F ...]] [--plot]
+    qkd-sim pipeline [options] [--rounds K]
+    qkd-sim multiplex [options] [--channels K [K ...]]
+    qkd-sim keygen  [options] [--sim-workers N] [--post-workers N] [--queue-size N]
+
+Common options:
+    --runtimes N  --photons N  --fibre F  --freq F  --speed S  --p-z P
+    --summary  --key-dir DIR
+    --attack NAME  --intercept-fraction P
+    --noise NAME  --noise-rate R  --fast-noise  --formalism NAME  --pool
+    --mem-report  --mem-budget MIB  --mem-policy {abort,shrink}
+    --det-eff E  --dark-rate HZ  --dead-time NS  --afterpulse P      (BB84 only)
+    --trace DIR  --crn SEED  --profile FILE  --profile-top N
+    --key-store DIR  --key-block BITS
+    --format {text,json,csv}  --output FILE  --per-run
+
+netsquid, numpy and matplotlib are only imported once a subcommand actually runs,
+so `--help` and argument errors return immediately. With --format json/csv only the
+results are written (to stdout or --output), one record per protocol and fibre length.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+if __package__ in (None, ""):
+    # executed as a file: make the repository root importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import report
+
+
+
+PROTOCOLS = {
+    "bb84": "BB84",
+    "mdi":  "MDI",
+}
+
+# options acting on the keys, traces and memory of individual runs, which the pipeline
+# and multiplex comparisons only average over
+RUN_OUTPUT_OPTIONS = ["summary", "key_dir", "key_store", "key_block", "per_run",
+                      "trace", "mem_report", "mem_budget", "mem_policy"]
+
+# common options a subcommand does not act on; giving them is an error rather than a no-op
+UNSUPPORTED = {
+    "pipeline":  RUN_OUTPUT_OPTIONS,
+    "multiplex": RUN_OUTPUT_OPTIONS + ["crn"],
+    "keygen":    RUN_OUTPUT_OPTIONS,
+}
+
+
+def add_common_arguments(parser):
+    parser.add_argument("--runtimes", type=int,   default=10,    help="Number of simulation runs")
+    parser.add_argument("--photons",  type=int,   default=1024,  help="Photons per run")
+    parser.add_argument("--fibre",    type=float, default=100,   help="Fibre length in km")
+    parser.add_argument("--freq",     type=float, default=1e7,   help="Source frequency in Hz")
+    parser.add_argument("--speed",    type=float, default=0.8,   help="Speed of light fraction")
+    parser.add_argument("--p-z",      type=float, default=None,  help="Z-basis probability; selects efficient (biased-basis) BB84")
+    parser.add_argument("--summary",  action="store_true",       help="Keep only streaming summary statistics")
+    parser.add_argument("--key-dir",  type=str,   default=None,  help="Write raw keys of each run to this directory (with --summary)")
+    parser.add_argument("--attack",   type=str,   default=None,  choices=["intercept", "partial"], help="Intercept-resend eavesdropper on the quantum link(s) (partial: half the photons)")
+    parser.add_argument("--intercept-fraction", type=float, default=None, help="Fraction of photons attacked")
+    parser.add_argument("--noise",    type=str,   default=None,  choices=["depolar", "dephase", "drift"], help="Fibre noise model on the quantum link(s)")
+    parser.add_argument("--noise-rate", type=float, default=0.01, help="Noise strength per km")
+    parser.add_argument("--fast-noise", action="store_true",     help="Use the classical bit-flip equivalent of the noise model")
+    parser.add_argument("--formalism", type=str,  default=None,  choices=["ket", "dm", "stab", "gslc", "tableau"], help="Quantum state formalism / backend")
+    parser.add_argument("--pool",     action="store_true",       help="Recycle photons through a qubit pool (peak live qubits are reported either way)")
+    parser.add_argument("--mem-report", action="store_true",     help="Sample traced memory around each run and report bytes per photon")
+    parser.add_argument("--mem-budget", type=float, default=None, help="Memory budget per run in MiB (implies --mem-report)")
+    parser.add_argument("--mem-policy", type=str, default="abort", choices=["abort", "shrink"], help="Abort or shrink the frame size when over budget")
+    parser.add_argument("--det-eff",  type=float, default=None,  help="BB84 detector efficiency (enables the detector model)")
+    parser.add_argument("--dark-rate", type=float, default=0.,   help="BB84 detector dark-count rate in Hz")
+    parser.add_argument("--dead-time", type=float, default=0.,   help="BB84 detector dead time in ns")
+    parser.add_argument("--afterpulse", type=float, default=0.,  help="BB84 detector afterpulsing probability")
+    parser.add_argument("--crn",      type=int,   default=None,  help="Common random numbers: reuse seeded inputs across fibre lengths and protocols")
+    parser.add_argument("--profile",  type=str,   default=None,  help="Profile every repetition and write the merged pstats to FILE")
+    parser.add_argument("--profile-top", type=int, default=15,   help="Hot functions listed per category with --profile")
+    parser.add_argument("--trace",    type=str,   default=None,  help="Write per-photon traces to DIR/<protocol>_<fibre>km (see lib.trace)")
+    parser.add_argument("--key-store", type=str,  default=None,  help="Store finished keys in DIR/alice and DIR/bob key stores (see lib.keystore)")
+    parser.add_argument("--key-block", type=int,  default=256,   help="Key block size in bits with --key-store")
+    parser.add_argument("--format",   type=str,   default="text", choices=["text", "json", "csv"], help="Output format")
+    parser.add_argument("--output",   type=str,   default=None,  help="Write json/csv output to this file instead of stdout")
+    parser.add_argument("--per-run",  action="store_true",       help="Also report every individual run")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="qkd-sim", description="Run BB84 and MDI-QKD netsquid simulations.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name, help_text in [("bb84",    "Run the BB84 simulation"),
+                            ("mdi",     "Run the MDI-QKD simulation"),
+                            ("compare", "Run BB84 and MDI-QKD with the same parameters")]:
+        add_common_arguments(sub.add_parser(name, help=help_text))
+
+    sweep = sub.add_parser("sweep", help="Sweep fibre length for one or both protocols")
+    add_common_arguments(sweep)
+    sweep.add_argument("--protocol", type=str,   default="both", choices=["bb84", "mdi", "both"], help="Protocol(s) to sweep")
+    sweep.add_argument("--fibres",   type=float, nargs="+", default=[1, 10, 25, 50, 100], help="Fibre lengths in km")
+    sweep.add_argument("--plot",     action="store_true", help="Plot relative key rate against fibre length (needs matplotlib)")
+    pipeline = sub.add_parser("pipeline", help="Compare pipelined multi-round BB84 against sequential rounds")
+    add_common_arguments(pipeline)
+    pipeline.add_argument("--rounds", type=int, default=8, help="Rounds per pipelined run")
+
+    multiplex = sub.add_parser("multiplex", help="Scale multiplexed BB84 over K parallel sub-channels")
+    add_common_arguments(multiplex)
+    multiplex.add_argument("--channels", type=int, nargs="+", default=[1, 2, 4, 8], help="Sub-channel counts K to compare")
+
+    keygen = sub.add_parser("keygen", help="Simulate and post-process keys concurrently in worker processes")
+    add_common_arguments(keygen)
+    keygen.add_argument("--protocol",     type=str,   default="bb84", choices=["bb84", "mdi"], help="Protocol to simulate")
+    keygen.add_argument("--sim-workers",  type=int,   default=2,    help="Simulation worker processes")
+    keygen.add_argument("--post-workers", type=int,   default=1,    help="Post-processing worker processes")
+    keygen.add_argument("--queue-size",   type=int,   default=4,    help="Keys buffered between simulation and post-processing")
+    keygen.add_argument("--sample-fraction", type=float, default=0.1, help="Fraction of each sifted key disclosed for QBER estimation")
+    keygen.add_argument("--seed",         type=int,   default=0,    help="Base seed (run i uses seed + i)")
+    return parser
+
+
+def check_supported(parser, args):
+    defaults = argparse.ArgumentParser()
+    add_common_arguments(defaults)
+    defaults = vars(defaults.parse_args([]))
+    for dest in UNSUPPORTED.get(args.command, []):
+        if getattr(args, dest) != defaults[dest]:
+            parser.error(f"--{dest.replace('_', '-')} is not supported by the {args.command} subcommand")
+
+
+def simulate(protocol, args, fibre, crn=None, profiler=None):
+    """
+    Run one protocol at one fibre length.
+
+    `profiler` is a lib.profiling.RunProfiler collecting every repetition, if profiling.
+
+    `crn` is the lib.crn.CommonRandomNumbers shared by every point of a sweep; if None
+    and --crn is given, a fresh one is used for this point alone.
+
+    Returns:
+        (summary dict, list of per-run records)
+    """
+    # heavy imports deferred until a simulation actually runs
+    from lib.attacks import make_attack
+    from lib.noise import make_noise
+    from lib.pool import QubitPool
+
+    from lib.memory import MemoryMonitor
+    from lib.trace import TraceWriter
+    from lib.crn import CommonRandomNumbers
+    from lib.keystore import KeyStore, KeyStoreWriter
+
+    # without --pool a non-reusing pool still counts live photons (and discards measured ones)
+    pool = QubitPool(reuse=args.pool)
+    monitor = None
+    if args.mem_report or args.mem_budget is not None:
+        budget = args.mem_budget * 2**20 if args.mem_budget is not None else None
+        monitor = MemoryMonitor(budget=budget, on_exceed=args.mem_policy)
+    if crn is None and args.crn is not None:
+        crn = CommonRandomNumbers(args.crn)
+    tracer = TraceWriter(os.path.join(args.trace, f"{protocol}_{fibre:g}km"), protocol) if args.trace else None
+    keys = None
+    if args.key_store:
+        keys = KeyStoreWriter(KeyStore(os.path.join(args.key_store, "alice")),
+                              KeyStore(os.path.join(args.key_store, "bob")),
+                              f"{protocol}-{fibre:g}km", args.key_block)
+    hooks = [h for h in (tracer, keys) if h is not None]
+    # X-basis test bits and errors summed over completed runs, for the parameter estimate
+    tests = {"bits": 0, "errors": 0}
+    if args.p_z is not None:
+        from lib.analytics import test_errors
+
+        def collect_tests(protocols):
+            if protocols["bob"].end_time is not None:
+                bits, errors = test_errors(protocols["alice"].test_key, protocols["bob"].test_key)
+                tests["bits"]   += bits
+                tests["errors"] += errors
+        hooks.append(collect_tests)
+
+    def run_hooks(protocols):
+        for hook in hooks:
+            hook(protocols)
+
+    kwargs = dict(runtimes    = args.runtimes,
+                  fibreLen    = fibre,
+                  photonCount = args.photons,
+                  sourceFreq  = args.freq,
+                  qSpeed      = args.speed,
+                  noise       = make_noise(args.noise, args.noise_rate),
+                  fastNoise   = args.fast_noise,
+                  formalism   = args.formalism,
+                  qubitPool   = pool,
+                  memoryMonitor = monitor,
+                  runHook     = run_hooks if hooks else None,
+                  crn         = crn,
+                  profiler    = profiler,
+                  pZ          = args.p_z,
+                  summaryOnly = args.summary,
+                  keyDir      = args.key_dir,
+                  returnBases = not args.summary)
+
+    if protocol == "bb84":
+        from BB84.BB84_run import run_BB84_sims
+        result = run_BB84_sims(attack=make_attack(args.attack, args.intercept_fraction),
+                               detector=make_detector(args), **kwargs)
+    else:
+        from MDI.mdiRun import run_mdi_sims
+        result = run_mdi_sims(attackA=make_attack(args.attack, args.intercept_fraction),
+                              attackB=make_attack(args.attack, args.intercept_fraction),
+                              **kwargs)
+
+    if monitor is not None:
+        monitor.close()
+    if tracer is not None:
+        tracer.close()
+    if keys is not None:
+        keys.store_a.close()
+        keys.store_b.close()
+
+    photons = args.photons
+    if monitor is not None and monitor.records:
+        # runs shrunk to fit the memory budget sent fewer photons than asked for
+        photons = [r["photons"] for r in monitor.records]
+
+    if args.summary:
+        summary = report.aggregator_summary(result, photonCount=photons)
+        add_resource_stats(summary, pool, monitor)
+        add_test_estimate(summary, tests, args)
+        return summary, []
+
+    KeyListA, KeyListB, KeyRateList, BasisList = result
+    runs = []
+    for i, (keyA, keyB) in enumerate(zip(KeyListA, KeyListB)):
+        done = report.completed(keyA)
+        runs.append({"protocol": PROTOCOLS[protocol],
+                     "fibre_km": fibre,
+                     "run":      i + 1,
+                     "completed": done,
+                     "key_len":  len(keyA) if done else None,
+                     "qber":     report.qber(keyA, keyB) if done else None,
+                     "key_rate": KeyRateList[i] if done else None})
+    summary = report.aggregate_summary(KeyListA, KeyListB, KeyRateList,
+                                       bases=BasisList, photonCount=photons)
+    add_resource_stats(summary, pool, monitor)
+    add_test_estimate(summary, tests, args)
+    return summary, runs
+
+
+def add_resource_stats(summary, pool, monitor):
+    if pool is not None:
+        summary["peak_live_qubits"] = pool.peak_live
+    if monitor is not None:
+        mem = monitor.summary()
+        summary["peak_bytes"]       = mem.get("max_peak_bytes")
+        summary["bytes_per_photon"] = mem.get("bytes_per_photon")
+        summary["peak_rss_bytes"]   = mem.get("peak_rss_bytes")
+        summary["shrunk_runs"]      = mem.get("shrunk_runs")
+
+
+def add_test_estimate(summary, tests, args):
+    if args.p_z is not None:
+        from lib.analytics import test_estimate
+        summary.update(test_estimate(tests["bits"], tests["errors"]))
+
+
+def make_detector(args):
+    if args.det_eff is None and not (args.dark_rate or args.dead_time or args.afterpulse):
+        return None
+    from lib.detector import DetectorModel
+    return DetectorModel(efficiency     = 1. if args.det_eff is None else args.det_eff,
+                         darkCountRate  = args.dark_rate,
+                         deadTime       = args.dead_time,
+                         afterpulseProb = args.afterpulse)
+
+
+def make_profiler(args):
+    if not args.profile:
+        return None
+    from lib.profiling import RunProfiler
+    return RunProfiler()
+
+
+def record(protocol, args, fibre, summary):
+    rec = {"protocol": PROTOCOLS[protocol],
+           "fibre_km": fibre,
+           "photons":  args.photons,
+           "runtimes": args.runtimes,
+           "freq_hz":  args.freq,
+           "speed":    args.speed,
+           "p_z":      args.p_z,
+           "attack":   args.attack,
+           "noise":    args.noise,
+           "formalism": args.formalism}
+    rec.update(summary)
+    return rec
+
+
+def run_pipeline(args):
+    from BB84.BB84_pipelined import pipelining_gain
+    from lib.attacks import make_attack
+    from lib.crn import CommonRandomNumbers
+    from lib.noise import make_noise
+    from lib.pool import QubitPool
+
+    profiler = make_profiler(args)
+    gain = pipelining_gain(rounds      = args.rounds,
+                           runtimes    = args.runtimes,
+                           fibreLen    = args.fibre,
+                           photonCount = args.photons,
+                           sourceFreq  = args.freq,
+                           qSpeed      = args.speed,
+                           attack      = make_attack(args.attack, args.intercept_fraction),
+                           noise       = make_noise(args.noise, args.noise_rate),
+                           fastNoise   = args.fast_noise,
+                           formalism   = args.formalism,
+                           detector    = make_detector(args),
+                           qubitPool   = QubitPool() if args.pool else None,
+                           crn         = CommonRandomNumbers(args.crn) if args.crn is not None else None,
+                           pZ          = args.p_z,
+                           profiler    = profiler)
+    rec = dict(record("bb84", args, args.fibre, gain), protocol="BB84 pipelined")
+
+    if args.format == "text":
+        report.print_parameters("Pipelined BB84", vars(args))
+        print(f"  Sequential: {gain['sequential_total_ns']/1e3:.2f} us total | first key after {gain['sequential_first_key_ns']/1e3:.2f} us | {gain['sequential_throughput']:.1f} bits/s")
+        print(f"  Pipelined:  {gain['pipelined_total_ns']/1e3:.2f} us total | first key after {gain['pipelined_first_key_ns']/1e3:.2f} us | {gain['pipelined_throughput']:.1f} bits/s")
+        print(f"  Speed-up:   {gain['speedup']:.2f}x over {args.rounds} rounds")
+    elif args.output:
+        with open(args.output, "w", newline="") as f:
+            report.write_records([rec], args.format, f)
+    else:
+        report.write_records([rec], args.format)
+    if profiler is not None:
+        write_profile(profiler, args)
+    return [rec]
+
+
+def run_multiplex(args):
+    from BB84.BB84_multiplexed import multiplexing_scaling
+    from lib.attacks import make_attack
+    from lib.noise import make_noise
+    from lib.pool import QubitPool
+
+    profiler = make_profiler(args)
+    rows = multiplexing_scaling(channelCounts = args.channels,
+                                runtimes      = args.runtimes,
+                                fibreLen      = args.fibre,
+                                photonCount   = args.photons,
+                                sourceFreq    = args.freq,
+                                qSpeed        = args.speed,
+                                attack        = make_attack(args.attack, args.intercept_fraction),
+                                noise         = make_noise(args.noise, args.noise_rate),
+                                fastNoise     = args.fast_noise,
+                                formalism     = args.formalism,
+                                qubitPool     = QubitPool() if args.pool else None,
+                                detector      = make_detector(args),
+                                pZ            = args.p_z,
+                                profiler      = profiler)
+    records = [dict(record("bb84", args, args.fibre, row), protocol="BB84 multiplexed") for row in rows]
+
+    if args.format == "text":
+        report.print_parameters("Multiplexed BB84", vars(args))
+        print(f"  {'K':>3} | {'key rate (bits/s)':>18} | {'per channel':>12} | {'gain':>6} | {'wall/run (s)':>12} | {'cost':>6}")
+        for row in rows:
+            print(f"  {row['channels']:>3} | {row['avg_key_rate']:>18.1f} | {row['rate_per_channel']:>12.1f} | "
+                  f"{row['rate_gain']:>5.2f}x | {row['wall_seconds']:>12.3f} | {row['cost_ratio']:>5.2f}x")
+    elif args.output:
+        with open(args.output, "w", newline="") as f:
+            report.write_records(records, args.format, f)
+    else:
+        report.write_records(records, args.format)
+    if profiler is not None:
+        write_profile(profiler, args)
+    return records
+
+
+def run_keygen(args):
+    from lib.pipeline import run_pipeline as run_key_pipeline
+    from lib.attacks import make_attack
+    from lib.crn import CommonRandomNumbers
+    from lib.noise import make_noise
+    from lib.pool import QubitPool
+
+    kwargs = dict(fibreLen    = args.fibre,
+                  photonCount = args.photons,
+                  sourceFreq  = args.freq,
+                  qSpeed      = args.speed,
+                  noise       = make_noise(args.noise, args.noise_rate),
+                  fastNoise   = args.fast_noise,
+                  formalism   = args.formalism,
+                  qubitPool   = QubitPool() if args.pool else None,
+                  crn         = CommonRandomNumbers(args.crn) if args.crn is not None else None,
+                  pZ          = args.p_z)
+    if args.protocol == "bb84":
+        kwargs["attack"]   = make_attack(args.attack, args.intercept_fraction)
+        kwargs["detector"] = make_detector(args)
+    else:
+        kwargs["attackA"]  = make_attack(args.attack, args.intercept_fraction)
+        kwargs["attackB"]  = make_attack(args.attack, args.intercept_fraction)
+    profileDir = tempfile.mkdtemp(prefix="qkd-profile-") if args.profile else None
+    summary = run_key_pipeline(args.protocol, runs=args.runtimes, simWorkers=args.sim_workers,
+                               postWorkers=args.post_workers, queueSize=args.queue_size, seed=args.seed,
+                               sampleFraction=args.sample_fraction, profileDir=profileDir, **kwargs)
+    stats = summary.pop("stats")
+    if profileDir:
+        # one pstats file per worker, merged into a single report
+        from lib.profiling import RunProfiler
+        profiler = RunProfiler()
+        for path in summary.pop("profiles"):
+            profiler.add(path)
+        write_profile(profiler, args)
+        shutil.rmtree(profileDir, ignore_errors=True)
+    rec = dict(record(args.protocol, args, args.fibre, summary),
+               **{f"{m}_{k}": v for m, s in stats.items() for k, v in s.items() if k in ("mean", "std")})
+
+    if args.format == "text":
+        report.print_parameters(f"{PROTOCOLS[args.protocol]} key pipeline", vars(args))
+        print(f"  Workers          : {args.sim_workers} simulation, {args.post_workers} post-processing (queue {args.queue_size})")
+        print(f"  Wall time        : {summary['wall_seconds']:.2f} s ({summary['keys_per_second']:.2f} keys/s)")
+        print(f"  Backpressure     : {summary['blocked_seconds']:.2f} s simulation time blocked on the queue")
+        print(f"  Estimated QBER   : {rec['qber_est_mean']*100:.2f}%")
+        print(f"  Sifted -> final  : {rec['sifted_len_mean']:.1f} -> {rec['final_len_mean']:.1f} bits "
+              f"(leaked {rec['leaked_mean']:.1f}, corrected {rec['corrected_mean']:.1f})")
+        print(f"  Secret key rate  : {rec['final_rate_mean']:.4f} bits/s")
+        print(f"  Failed / aborted : {summary['failed']} / {summary['aborted']} ({summary['unverified']} failed verification), residual errors {summary['residual_errors']}")
+    elif args.output:
+        with open(args.output, "w", newline="") as f:
+            report.write_records([rec], args.format, f)
+    else:
+        report.write_records([rec], args.format)
+    return [rec]
+
+
+def run_command(args):
+    if args.command == "pipeline":
+        return run_pipeline(args)
+    if args.command == "multiplex":
+        return run_multiplex(args)
+    if args.command == "keygen":
+        return run_keygen(args)
+
+    if args.command == "sweep":
+        protocols = ["bb84", "mdi"] if args.protocol == "both" else [args.protocol]
+        fibres = args.fibres
+    else:
+        protocols = ["bb84", "mdi"] if args.command == "compare" else [args.command]
+        fibres = [args.fibre]
+
+    profiler = make_profiler(args)
+
+    crn = None
+    if args.crn is not None:
+        # one set of inputs for every fibre length and protocol
+        from lib.crn import CommonRandomNumbers
+        crn = CommonRandomNumbers(args.crn)
+
+    text = args.format == "text"
+    records, run_records = [], []
+    for fibre in fibres:
+        for protocol in protocols:
+            if text:
+                report.print_parameters(f"{PROTOCOLS[protocol]} Simulation",
+                                        dict(vars(args), fibre=fibre))
+            summary, runs = simulate(protocol, args, fibre, crn, profiler)
+            records.append(record(protocol, args, fibre, summary))
+            run_records += runs
+            if text:
+                if args.per_run:
+                    print("\n  Per-run results:")
+                    print("-" * 65)
+                    for r in runs:
+                        if r["completed"]:
+                            q_str = f"{r['qber']*100:.2f}%" if r["qber"] is not None else "N/A"
+                            print(f"  {r['protocol']} run {r['run']:>3}:  key_len={r['key_len']:>5} | QBER={q_str:>7} | key_rate={r['key_rate']:.4f}")
+                        else:
+                            print(f"  {r['protocol']} run {r['run']:>3}:  did not complete")
+                report.print_aggregate_summary(summary)
+
+    if text and args.command == "compare":
+        report.comparative_stats(records[0], records[1])
+
+    if not text:
+        out = records + run_records if args.per_run else records
+        if args.output:
+            with open(args.output, "w", newline="") as f:
+                report.write_records(out, args.format, f)
+        else:
+            report.write_records(out, args.format)
+
+    if args.command == "sweep" and args.plot:
+        plot_sweep(records, fibres, protocols)
+
+    if profiler is not None:
+        write_profile(profiler, args)
+
+    return records
+
+
+def write_profile(profiler, args):
+    """
+    Dump merged profile statistics to --profile and print the hot-function report
+    (to stderr unless the output format is text, so json/csv stay parseable).
+    """
+    from lib.profiling import hot_functions
+
+    if profiler.stats is None:
+        return
+    profiler.dump(args.profile)
+    stream = sys.stdout if args.format == "text" else sys.stderr
+    report.print_profile_report(hot_functions(profiler.stats, args.profile_top), stream)
+    print(f"  pstats from {profiler.sources} profile(s) written to {args.profile}", file=stream)
+
+
+def plot_sweep(records, fibres, protocols):
+    import matplotlib.pyplot as plt
+
+    rates = {p: [r["avg_key_rate"] for r in records if r["protocol"] == PROTOCOLS[p]] for p in protocols}
+    base = rates[protocols[0]][0]
+
+    plt.figure()
+    for p, marker in zip(protocols, ["o-", "s-"]):
+        plt.plot(fibres, [r / base for r in rates[p]], marker, label=PROTOCOLS[p])
+
+    plt.xlabel("Node separation in kilometres")
+    plt.ylabel("Relative secure key rate")
+    plt.title("Relative performance: " + " and ".join(PROTOCOLS[p] for p in protocols))
+    plt.legend()
+    plt.grid(True, alpha=0.3)
+    plt.gca().set_ylim([0, 1.1])
+    plt.show()
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    check_supported(parser, args)
+    run_command(args)
+
+
+if __name__ == "__main__":
+    main()